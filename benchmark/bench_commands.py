@@ -0,0 +1,144 @@
+# coding: utf-8
+#
+# status / up / down の実行時間・ラウンドトリップ数・接続数・ピークメモリを計測する。
+#
+#   python3 benchmark/bench_commands.py --files 100,1000,10000 --latency 0.5 --connect-latency 20 [--coalesce]
+#
+# pyodbc を fake_pyodbc（インプロセスの代替）に差し替えるため、SQL Server は不要。
+# 合成したマイグレーションディレクトリに対して status -> up -> status -> index -> status --current -> down を実行する。
+# 実行時間は tracemalloc なしで計測し、ピークメモリは同じ手順をもう一度 tracemalloc ありで計測する。
+
+import io
+import sys
+import runpy
+import argparse
+import pathlib
+import tempfile
+import time
+import tracemalloc
+import contextlib
+
+BENCHMARK_DIR = pathlib.Path(__file__).resolve().parent
+TOOL_PATH = BENCHMARK_DIR.parent / "migrate" / "mssql_migrate.py"
+
+sys.path.insert(0, str(BENCHMARK_DIR))
+import fake_pyodbc
+
+COMMANDS = [
+    ("status", ["status"]),
+    ("up"    , ["up", "-s"]),
+    ("status", ["status", "--pending"]),
+    ("index" , ["index", "-s"]),
+    ("status", ["status", "--current"]),
+    ("down"  , ["down", "0", "-s"]),
+]
+
+
+def generate_tree(root, count, is_coalesce=False):
+    script_dir = pathlib.Path(root) / "migration"
+    script_dir.mkdir()
+
+    for i in range(0, count):
+        path = script_dir / f"{20200101000000 + i}_bench-{i}.py"
+        with open(path, "w") as f:
+            f.write(f'SQL_UP=["CREATE TABLE schema01.bench_{i} (id int)", "INSERT INTO schema01.bench_{i} VALUES ({i})"]\n')
+            f.write(f'SQL_DOWN="DROP TABLE schema01.bench_{i}"\n')
+
+    config_path = pathlib.Path(root) / "config.py"
+    with open(config_path, "w") as f:
+        f.write('MSSQL_MIGRATE_FILE_DIR  = "./migration/"\n')
+        f.write('MSSQL_MIGRATE_DB_HOST   = "localhost"\n')
+        f.write('MSSQL_MIGRATE_DB_PORT   = "1433"\n')
+        f.write(f'MSSQL_MIGRATE_DB_NAME   = "bench_{count}"\n')
+        f.write('MSSQL_MIGRATE_DB_USER   = "sa"\n')
+        f.write('MSSQL_MIGRATE_DB_PASS   = ""\n')
+        f.write('MSSQL_MIGRATE_SCHEMA    = ["schema01"]\n')
+        f.write('MSSQL_MIGRATE_TABLE     = "schema01.mssql_migrate"\n')
+        f.write(f'MSSQL_MIGRATE_COALESCE  = {is_coalesce}\n')
+
+    return config_path
+
+
+def run_command(argv, config_path):
+    # 実行のたびにツールを読み込み直す（コマンドラインから実行した場合と同じ状態で計測）
+    sys.argv = [str(TOOL_PATH)] + argv + ["-c", str(config_path)]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            runpy.run_path(str(TOOL_PATH), run_name="__main__")
+            ret = 0
+        except SystemExit as e:
+            ret = e.code or 0
+    if ( ret != 0 ):
+        sys.stderr.write(output.getvalue())
+    return ret
+
+
+def measure(config_path, is_trace_memory):
+    results = []
+    for name, argv in COMMANDS:
+        fake_pyodbc.reset()
+        if ( is_trace_memory ): tracemalloc.start()
+
+        start = time.perf_counter()
+        ret = run_command(argv, config_path)
+        elapsed = time.perf_counter() - start
+
+        peak = 0
+        if ( is_trace_memory ):
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        results.append({ "command": " ".join(argv), "ret": ret, "seconds": elapsed, "peak": peak, **fake_pyodbc.get_stats() })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of status / up / down with a fake pyodbc driver")
+    parser.add_argument('--files'          , type=str  , default="100,1000,10000", help='comma separated list of migration file counts. [default = 100,1000,10000]')
+    parser.add_argument('--latency'        , type=float, default=0.5 , help='latency per round trip in milliseconds. [default = 0.5]')
+    parser.add_argument('--connect-latency', type=float, default=20.0, help='latency per connection in milliseconds. [default = 20]')
+    parser.add_argument('--no-memory'      , action="store_true"     , help='skip the peak memory measurement.')
+    parser.add_argument('--coalesce'       , action="store_true"     , help='send the statements of each migration in one round trip (MSSQL_MIGRATE_COALESCE).')
+    args = parser.parse_args()
+
+    sys.modules["pyodbc"] = fake_pyodbc
+    fake_pyodbc.configure(round_trip_latency=args.latency / 1000, connect_latency=args.connect_latency / 1000)
+
+    rows = []
+    for count in [ int(x) for x in args.files.split(",") if x.strip() != "" ]:
+        with tempfile.TemporaryDirectory() as root:
+            config_path = generate_tree(root, count, args.coalesce)
+            fake_pyodbc.reset(True)
+            results = measure(config_path, False)
+
+            if ( not args.no_memory ):
+                fake_pyodbc.reset(True)
+                for result, traced in zip(results, measure(config_path, True)):
+                    result["peak"] = traced["peak"]
+
+        for result in results:
+            rows.append({
+                "files"      : count,
+                "command"    : result["command"],
+                "result"     : "ok" if result["ret"] == 0 else "failed",
+                "seconds"    : f"{result['seconds']:.3f}",
+                "round_trips": result["round_trips"],
+                "connects"   : result["connect"],
+                "peak_mb"    : "" if args.no_memory else f"{result['peak'] / 1024 / 1024:.1f}",
+            })
+
+    # 表示には SimpleTable を使う
+    sys.argv = [str(TOOL_PATH)]
+    tool = runpy.run_path(str(TOOL_PATH), run_name="mssql_migrate")
+
+    table = tool["SimpleTable"]()
+    table.set_header(["files", "command", "result", "seconds", "round_trips", "connects", "peak_mb"])
+    table.set_rows(rows)
+    table.print_table()
+
+    return 0 if all([ x["result"] == "ok" for x in rows ]) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# coding: utf-8
+#
+# マイグレーションファイルのスキャン・ハッシュ計算の並列数によるスケーリングを計測する。
+#
+#   python3 benchmark/bench_scan.py --files 10000 --size 4096 --jobs 1,2,4,8
+#
+# 合成したマイグレーションディレクトリに対して、マニフェストキャッシュなし
+# （全ファイルをハッシュ計算）とキャッシュありの２パターンを計測する。
+
+import sys
+import types
+import argparse
+import pathlib
+import tempfile
+import time
+import importlib.util
+
+TOOL_PATH = pathlib.Path(__file__).resolve().parent.parent / "migrate" / "mssql_migrate.py"
+
+
+def load_tool():
+    # スキャン処理は DB に接続しないため、pyodbc が無い環境でも読み込めるようにする
+    if ( "pyodbc" not in sys.modules and importlib.util.find_spec("pyodbc") is None ):
+        sys.modules["pyodbc"] = types.ModuleType("pyodbc")
+
+    spec = importlib.util.spec_from_file_location("mssql_migrate", TOOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_tree(root, count, size):
+    script_dir = pathlib.Path(root) / "migration"
+    script_dir.mkdir()
+
+    padding = "-- " + ("x" * max(size - 64, 0)) + "\n"
+    for i in range(0, count):
+        path = script_dir / f"{20200101000000 + i}_bench-{i}.py"
+        with open(path, "w") as f:
+            f.write(f'SQL_UP="SELECT {i};"\nSQL_DOWN="SELECT {i};"\n# {padding}')
+
+    config_path = pathlib.Path(root) / "config.py"
+    with open(config_path, "w") as f:
+        f.write('MSSQL_MIGRATE_FILE_DIR = "./migration/"\n')
+
+    return config_path
+
+
+def measure(tool, config_path, jobs, use_manifest, repeat):
+    config = types.SimpleNamespace(
+        CONFIG_PATH             = str(config_path),
+        MSSQL_MIGRATE_FILE_DIR  = "./migration/",
+        MSSQL_MIGRATE_SCAN_JOBS = jobs,
+    )
+
+    elapsed = []
+    for _ in range(0, repeat):
+        # スキャン結果はプロセス内でキャッシュされるため、計測ごとに消す
+        tool._manifest_cache.clear()
+        tool.clear_migration_file_cache(config)
+        manifest_path = pathlib.Path(config_path).parent / "migration" / tool.MANIFEST_FILE_NAME
+        if ( use_manifest ):
+            # キャッシュありの計測では、事前にマニフェストを作成しておく
+            if ( not manifest_path.exists() ):
+                tool.get_migration_file_infos(config)
+                tool._manifest_cache.clear()
+                tool.clear_migration_file_cache(config)
+        else:
+            config.MSSQL_MIGRATE_MANIFEST_PATH = ""
+
+        start = time.perf_counter()
+        files = tool.get_migration_file_infos(config)
+        elapsed.append(time.perf_counter() - start)
+
+    return min(elapsed), len(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of migration file scan and hash")
+    parser.add_argument('--files' , type=int, default=10000, help='number of migration files. [default = 10000]')
+    parser.add_argument('--size'  , type=int, default=4096 , help='size of each migration file in bytes. [default = 4096]')
+    parser.add_argument('--jobs'  , type=str, default="1,2,4,8", help='comma separated list of thread counts. [default = 1,2,4,8]')
+    parser.add_argument('--repeat', type=int, default=3    , help='repeat count. the best time is reported. [default = 3]')
+    args = parser.parse_args()
+
+    tool = load_tool()
+    jobs_list = [ int(x) for x in args.jobs.split(",") if x.strip() != "" ]
+
+    with tempfile.TemporaryDirectory() as root:
+        config_path = generate_tree(root, args.files, args.size)
+
+        rows = []
+        for use_manifest in [False, True]:
+            base = None
+            for jobs in jobs_list:
+                sec, count = measure(tool, config_path, jobs, use_manifest, args.repeat)
+                base = sec if base is None else base
+                rows.append({
+                    "manifest": "on" if use_manifest else "off",
+                    "jobs"    : jobs,
+                    "files"   : count,
+                    "seconds" : f"{sec:.3f}",
+                    "speedup" : f"{base / sec:.2f}x",
+                })
+
+    table = tool.SimpleTable()
+    table.set_header(["manifest", "jobs", "files", "seconds", "speedup"])
+    table.set_rows(rows)
+    table.print_table()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
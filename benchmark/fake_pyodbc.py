@@ -0,0 +1,364 @@
+# coding: utf-8
+#
+# ベンチマーク用の pyodbc の代替（インプロセスで動作し、SQL Server に接続しない）。
+#
+# mssql-migrate.py が発行する管理用の SQL（カタログ・スキーマ・管理テーブル）のみを
+# 正規表現で解釈してメモリ上に保持する。マイグレーション SQL 自体は何もしない。
+# ラウンドトリップ・接続ごとに遅延を入れて、ネットワーク越しの SQL Server を模擬し、
+# 接続数・ラウンドトリップ数を記録する。
+#
+#   import fake_pyodbc
+#   sys.modules["pyodbc"] = fake_pyodbc
+#   fake_pyodbc.configure(round_trip_latency=0.001, connect_latency=0.02)
+
+import re
+import json
+import time
+import threading
+
+version = "fake"
+
+
+class Error(Exception):
+    pass
+
+class InterfaceError(Error):
+    pass
+
+class DatabaseError(Error):
+    pass
+
+class OperationalError(DatabaseError):
+    pass
+
+class IntegrityError(DatabaseError):
+    pass
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+# 遅延（秒）と互換性レベル
+settings = {
+    "round_trip_latency" : 0.0,
+    "connect_latency"    : 0.0,
+    "compatibility_level": 150,
+}
+
+STAT_KEYS = ["connect", "execute", "executemany", "commit", "rollback", "fetch"]
+
+_stats = { x:0 for x in STAT_KEYS }
+_databases = {}
+_lock = threading.RLock()
+
+
+def configure(round_trip_latency=None, connect_latency=None, compatibility_level=None):
+    if ( round_trip_latency is not None ): settings["round_trip_latency"] = round_trip_latency
+    if ( connect_latency is not None ): settings["connect_latency"] = connect_latency
+    if ( compatibility_level is not None ): settings["compatibility_level"] = compatibility_level
+
+def reset(is_reset_databases=False):
+    with _lock:
+        for key in STAT_KEYS: _stats[key] = 0
+        if ( is_reset_databases ): _databases.clear()
+
+def get_stats():
+    # execute / executemany / commit / rollback を１ラウンドトリップとして数える
+    with _lock:
+        stats = dict(_stats)
+    stats["round_trips"] = stats["execute"] + stats["executemany"] + stats["commit"] + stats["rollback"]
+    return stats
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+def _wait(key):
+    latency = settings[key]
+    if ( latency > 0 ): time.sleep(latency)
+
+
+class Database:
+
+    def __init__(self):
+        self.schemas = set(["dbo"])
+        self.objects = set()
+        self.tables  = {}   # name -> { "columns": [...], "rows": { id: [ {...}, ... ] } }
+
+
+SQL_LITERAL_PATTERN = re.compile(r"^N?'(.*)'$", re.DOTALL)
+
+def _split_values(text):
+    # カンマ区切り（文字列・括弧内のカンマは除く）
+    values, current, is_quoted, depth = [], "", False, 0
+    for c in text:
+        if ( c == "'" ): is_quoted = not is_quoted
+        if ( not is_quoted and c == "(" ): depth += 1
+        if ( not is_quoted and c == ")" ): depth -= 1
+        if ( c == "," and not is_quoted and depth == 0 ):
+            values.append(current.strip())
+            current = ""
+            continue
+        current += c
+    if ( current.strip() != "" ): values.append(current.strip())
+    return values
+
+def _to_value(text, params):
+    if ( text == "?" ): return params.pop(0)
+    if ( text.lower() == "null" ): return None
+    if ( text.upper().startswith("SYSDATETIMEOFFSET") ): return "2000-01-01 00:00:00.0000000 +00:00"
+
+    m = SQL_LITERAL_PATTERN.match(text)
+    if ( m ): return m.group(1).replace("''", "'")
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+class Cursor:
+
+    def __init__(self, cnxn):
+        self._cnxn = cnxn
+        self._rows = []
+        self.description = None
+        self.rowcount = -1
+        self.arraysize = 1
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        _count("execute")
+        _wait("round_trip_latency")
+        if ( len(params) == 1 and isinstance(params[0], (list, tuple)) ): params = params[0]
+        with _lock:
+            self._cnxn._execute(self, sql.strip(), list(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        # fast_executemany は１回の送信として扱う
+        _count("executemany")
+        _wait("round_trip_latency")
+        count = 0
+        with _lock:
+            for params in seq_of_params:
+                self._cnxn._execute(self, sql.strip(), list(params))
+                count += 1
+        self.rowcount = count
+
+    def fetchall(self):
+        _count("fetch")
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=None):
+        _count("fetch")
+        size = size or self.arraysize
+        rows, self._rows = self._rows[0:size], self._rows[size:]
+        return rows
+
+    def fetchone(self):
+        _count("fetch")
+        return self._rows.pop(0) if len(self._rows) > 0 else None
+
+    def nextset(self):
+        return False
+
+    def close(self):
+        pass
+
+    def _set_result(self, columns, rows):
+        self.description = [ (x, None, None, None, None, None, None) for x in columns ]
+        self._rows = [ tuple(x) for x in rows ]
+        self.rowcount = -1
+
+    def _set_rowcount(self, rowcount):
+        self.description = None
+        self._rows = []
+        self.rowcount = rowcount
+
+
+class Connection:
+
+    def __init__(self, connection_string):
+        m = re.search(r"DATABASE=([^;]*)", connection_string)
+        with _lock:
+            self._db = _databases.setdefault(m.group(1) if m else "", Database())
+        self._undo = []
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        _count("commit")
+        _wait("round_trip_latency")
+        self._undo = []
+
+    def rollback(self):
+        _count("rollback")
+        _wait("round_trip_latency")
+        with _lock:
+            for undo in reversed(self._undo): undo()
+        self._undo = []
+
+    def close(self):
+        with _lock:
+            for undo in reversed(self._undo): undo()
+        self._undo = []
+
+    def _table_rows(self, cursor, table, rows, columns=None):
+        columns = columns or table["columns"]
+        cursor._set_result(columns, [ [ x.get(c, None) for c in columns ] for x in rows ])
+
+    def _execute(self, cursor, sql, params):
+        db = self._db
+
+        if ( sql == "SELECT 1" ):
+            return cursor._set_result([""], [[1]])
+
+        if ( sql == "SELECT @@SPID" ):
+            return cursor._set_result([""], [[51]])
+
+        if ( sql.startswith("SELECT 'L'") ):
+            rows = [ ["L", str(settings["compatibility_level"])] ]
+            rows.extend([ ["S", x] for x in db.schemas ])
+            rows.extend([ ["O", x] for x in db.objects ])
+            return cursor._set_result(["", ""], rows)
+
+        m = re.match(r"(?is)^CREATE SCHEMA \[(\w+)\]$", sql)
+        if ( m ):
+            name = m.group(1)
+            db.schemas.add(name)
+            self._undo.append(lambda: db.schemas.discard(name))
+            return cursor._set_rowcount(-1)
+
+        m = re.match(r"(?is)^CREATE TABLE ([\w.\[\]]+)\s*\((.*)\)$", sql)
+        if ( m ):
+            name = m.group(1).replace("[", "").replace("]", "")
+            db.objects.add(name)
+            db.tables[name] = { "columns": re.findall(r"\[(\w+)\]", m.group(2)), "rows": {} }
+            self._undo.append(lambda: ( db.objects.discard(name), db.tables.pop(name, None) ))
+            return cursor._set_rowcount(-1)
+
+        m = re.match(r"(?is)^ALTER TABLE ([\w.]+) ADD (.*)$", sql)
+        if ( m and m.group(1) in db.tables ):
+            db.tables[m.group(1)]["columns"].extend(re.findall(r"\[(\w+)\]", m.group(2)))
+            return cursor._set_rowcount(-1)
+
+        # アプリケーションロック（ベンチマークは１プロセスで順に実行するため、常に取得できる）
+        if ( "sp_getapplock" in sql ):
+            return cursor._set_result([""], [[0]])
+        if ( "APPLOCK_MODE" in sql ):
+            return cursor._set_result([""], [["Exclusive"]])
+
+        if ( "FROM sys.columns" in sql ):
+            table = db.tables.get(params[0], None)
+            return cursor._set_result(["name"], [ [x] for x in (table["columns"] if table else []) ])
+
+        if ( "OPENJSON(?)" in sql ):
+            return self._execute_migrate_state(cursor, sql, params)
+
+        m = re.match(r"(?is)^DELETE FROM ([\w.]+) WHERE id = '([^']*)';?$", sql)
+        if ( m and m.group(1) in db.tables ):
+            table, id = db.tables[m.group(1)], m.group(2)
+            deleted = table["rows"].pop(id, [])
+            self._undo.append(lambda: table["rows"].setdefault(id, []).extend(deleted))
+            return cursor._set_rowcount(len(deleted))
+
+        m = re.match(r"(?is)^INSERT INTO ([\w.]+) \((.*?)\)\s*VALUES\s*\((.*)\);?$", sql)
+        if ( m and m.group(1) in db.tables ):
+            table = db.tables[m.group(1)]
+            row = dict(zip(_split_values(m.group(2)), [ _to_value(x, params) for x in _split_values(m.group(3)) ]))
+            rows = table["rows"].setdefault(row["id"], [])
+            rows.append(row)
+            self._undo.append(lambda: rows.remove(row))
+            return cursor._set_rowcount(1)
+
+        m = re.match(r"(?is)^UPDATE ([\w.]+)\s+SET\s+(.*?)\s+WHERE\s+id = ('[^']*'|\?);?$", sql)
+        if ( m and m.group(1) in db.tables ):
+            table = db.tables[m.group(1)]
+            values = {}
+            for x in _split_values(m.group(2)):
+                k, v = x.split("=", 1)
+                values[k.strip()] = _to_value(v.strip(), params)
+
+            rows = table["rows"].get(_to_value(m.group(3), params), [])
+            for row in rows:
+                old = dict(row)
+                row.update(values)
+                self._undo.append(lambda row=row, old=old: ( row.clear(), row.update(old) ))
+            return cursor._set_rowcount(len(rows))
+
+        # 適用済みの件数・最新の id・その chain_hash（status --current）
+        if ( sql.startswith("IF OBJECT_ID(?) IS NULL") ):
+            table = db.tables.get(params[0], None)
+            rows = [] if table is None else sorted([ x for v in table["rows"].values() for x in v if x.get("applied_date", None) is not None ], key=lambda x:x["id"])
+            last = rows[-1] if len(rows) > 0 else {}
+            chain_hash = last.get("chain_hash", None) if table is not None and "chain_hash" in table["columns"] else None
+            return cursor._set_result(["applied_count", "last_id", "chain_hash"], [[len(rows), last.get("id", None), chain_hash]])
+
+        # 適用履歴の累積ハッシュの計算（直前の適用済みマイグレーション以降）
+        m = re.match(r"(?is)^SELECT id, hash, chain_hash\s+FROM ([\w.]+) WITH \(READCOMMITTEDLOCK\)", sql)
+        if ( m and m.group(1) in db.tables ):
+            table = db.tables[m.group(1)]
+            rows = sorted([ x for v in table["rows"].values() for x in v if x.get("applied_date", None) is not None ], key=lambda x:x["id"])
+            start = max([ x["id"] for x in rows if x["id"] < params[0] ] or [""])
+            return self._table_rows(cursor, table, [ x for x in rows if x["id"] >= start ], ["id", "hash", "chain_hash"])
+
+        m = re.match(r"(?is)^SELECT\s+(?:TOP \((\d+)\)\s+)?\*\s+FROM ([\w.]+)(.*)$", sql)
+        if ( m and m.group(2) in db.tables ):
+            table = db.tables[m.group(2)]
+            condition = m.group(3)
+            if ( "id = ?" in condition ):
+                rows = list(table["rows"].get(params.pop(0), []))
+            else:
+                rows = [ x for v in table["rows"].values() for x in v ]
+            if ( "applied_date IS NOT NULL" in condition ):
+                rows = [ x for x in rows if x.get("applied_date", None) is not None ]
+            if ( "seq" in condition ):
+                rows = sorted(rows, key=lambda x:x["seq"])
+            else:
+                rows = sorted(rows, key=lambda x:x["id"], reverse=( "DESC" in condition ))
+            if ( m.group(1) ): rows = rows[0:int(m.group(1))]
+            return self._table_rows(cursor, table, rows)
+
+        # マイグレーション SQL は実行しない
+        return cursor._set_rowcount(-1)
+
+    def _execute_migrate_state(self, cursor, sql, params):
+        m = re.search(r"FULL OUTER JOIN ([\w.]+) migrate", sql)
+        table = self._db.tables[m.group(1)]
+
+        local_files = { x["id"]:x["hash"] for x in json.loads(params[0]) }
+        rows = { k:v[0] for k,v in table["rows"].items() if len(v) > 0 }
+
+        result = []
+        for id in sorted(set(local_files.keys()) | set(rows.keys())):
+            row = rows.get(id, None)
+            if ( id not in local_files ):
+                state = "orphaned"
+            elif ( row is None or row.get("applied_date", None) is None ):
+                state = "pending"
+            elif ( (row.get("hash", None) or "") != (local_files[id] or "") ):
+                state = "drifted"
+            else:
+                state = "applied"
+            result.append((state, id if id in local_files else None, row))
+
+        if ( "GROUP BY state" in sql ):
+            counts = {}
+            for state, _, _ in result:
+                counts[state] = counts.get(state, 0) + 1
+            return cursor._set_result(["state", ""], list(counts.items()))
+
+        if ( "WHERE state <>" in sql ):
+            result = [ x for x in result if x[0] != "applied" ]
+
+        columns = table["columns"]
+        records = [ [state, local_id] + [ (row or {}).get(c, None) for c in columns ] for state, local_id, row in result ]
+        return cursor._set_result(["state", "local_id"] + columns, records)
+
+
+def connect(connection_string, autocommit=False, **kwargs):
+    _count("connect")
+    _wait("connect_latency")
+    return Connection(connection_string)
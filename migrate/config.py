@@ -9,3 +9,7 @@ MSSQL_MIGRATE_DB_PASS   = os.getenv("MSSQL_MIGRATE_DB_PASS", "")
 
 MSSQL_MIGRATE_SCHEMA    = os.getenv("MSSQL_MIGRATE_SCHEMA", ["schema01", "schema02"])
 MSSQL_MIGRATE_TABLE     = os.getenv("MSSQL_MIGRATE_TABLE", "schema01.mssql_migrate")
+
+MSSQL_MIGRATE_DB_POOL_SIZE          = int(os.getenv("MSSQL_MIGRATE_DB_POOL_SIZE", "4"))
+MSSQL_MIGRATE_DB_POOL_PING_INTERVAL = float(os.getenv("MSSQL_MIGRATE_DB_POOL_PING_INTERVAL", "30"))
+MSSQL_MIGRATE_DB_FETCH_SIZE         = int(os.getenv("MSSQL_MIGRATE_DB_FETCH_SIZE", "1000"))
@@ -0,0 +1,4427 @@
+# coding: utf-8
+
+import os
+import sys
+import pyodbc
+import json
+import argparse
+import types
+import datetime
+import pathlib
+import copy
+import hashlib
+import threading
+import time
+import contextlib
+import marshal
+import builtins
+import importlib.util
+import concurrent.futures
+import itertools
+import csv
+import re
+import traceback
+import unicodedata
+import shutil
+import random
+import decimal
+from stat import S_ISREG
+
+DEFAULT_CONFIG_PATH=os.getenv("MSSQL_MIGRATE_CONFIG", "./config.py")
+
+HASH_SHORT_LENGTH=8
+
+TRANSACTION_PER_MIGRATION="per-migration"
+TRANSACTION_ALL="all"
+TRANSACTION_NONE="none"
+TRANSACTION_MODES=[TRANSACTION_PER_MIGRATION, TRANSACTION_ALL, TRANSACTION_NONE]
+
+MANIFEST_FILE_NAME=".mssql-migrate-manifest.json"
+MANIFEST_VERSION=1
+# 起動時の確認（is_current）用に、ローカルのマイグレーション全体の件数・最新の id・累積ハッシュを保存するファイル
+INDEX_FILE_NAME=".mssql-migrate-index.json"
+INDEX_VERSION=1
+HASH_CHUNK_SIZE=1024 * 1024
+
+MIGRATION_TYPE_PY="py"
+MIGRATION_TYPE_SQL="sql"
+MIGRATION_TYPE_SQUASHED="squashed"
+MIGRATION_FILE_SUFFIXES=[
+    # ( 拡張子, 種類, 用途 )
+    (".baseline.sql", MIGRATION_TYPE_SQL, "up"),
+    (".up.sql"      , MIGRATION_TYPE_SQL, "up"),
+    (".down.sql"    , MIGRATION_TYPE_SQL, "down"),
+    (".sql"         , MIGRATION_TYPE_SQL, "up"),
+    (".py"          , MIGRATION_TYPE_PY , None),
+]
+SQL_LOG_MAX_LENGTH=100
+
+# ベースライン（<TO_ID>b_<NAME>.baseline.sql）と、まとめた元ファイルの移動先
+BASELINE_FILE_SUFFIX=".baseline.sql"
+BASELINE_ID_SUFFIX="b"
+DEFAULT_SQUASHED_DIR_NAME="squashed"
+
+CODE_CACHE_DIR_NAME="__pycache__"
+CODE_CACHE_SUFFIX=".mssql-migrate.code"
+
+DEFAULT_SCAN_JOBS=min(8, (os.cpu_count() or 1) + 4)
+
+DEFAULT_BULK_CHUNK_SIZE=10000
+BULK_PROGRESS_INTERVAL=10
+# 実行中のステートメントの進捗を表示する間隔（秒）。0 で表示しない
+# 有効にすると接続ごとに @@SPID の問い合わせと監視スレッドが増えるため、既定では表示しない
+DEFAULT_PROGRESS_INTERVAL=0
+DEFAULT_CHUNK_SIZE=10000
+
+# 連続するステートメントを１回の送信にまとめる場合の最大文字数
+DEFAULT_COALESCE_MAX_SIZE=65536
+COALESCE_SEQ_VAR="@mssql_migrate_seq"
+COALESCE_ROWS_VAR="@mssql_migrate_rows"
+COALESCE_ERROR_NUMBER=51000
+COALESCE_ERROR_PATTERN=re.compile(r"mssql-migrate statement (\d+):")
+# バッチの先頭にしか書けない（TRY ... CATCH にも含められない）ステートメントは単独で送る
+COALESCE_STANDALONE_PATTERN=re.compile(r"^(?:\s|--[^\n]*\n|/\*.*?\*/)*(?:CREATE|ALTER|CREATE\s+OR\s+ALTER)\s+(?:PROC|PROCEDURE|FUNCTION|VIEW|TRIGGER|SCHEMA|DEFAULT|RULE)\b", re.IGNORECASE | re.DOTALL)
+# まとめた範囲は１つのバッチとしてコンパイルされるため
+#   変数を宣言するステートメントは単独で送る（同じ変数名の重複宣言になる）
+#   スキーマを変更するステートメントの後はバッチを区切る（変更後の列・インデックスを参照するとコンパイルエラーになる）
+COALESCE_DECLARE_PATTERN=re.compile(r"\bDECLARE\s+@", re.IGNORECASE)
+COALESCE_SCHEMA_CHANGE_PATTERN=re.compile(r"\b(?:ALTER\s+(?:TABLE|INDEX|TYPE)|DROP\s+\w+|EXEC(?:UTE)?\s+(?:sys\.)?sp_rename|CREATE\s+(?:UNIQUE\s+)?(?:(?:NON)?CLUSTERED\s+)?(?:COLUMNSTORE\s+)?INDEX|CREATE\s+(?:TYPE|SYNONYM))\b", re.IGNORECASE)
+
+DEFAULT_PARALLEL=4
+DEFAULT_MAX_PARALLEL=1
+# watch でファイルの変更を確認する間隔（秒）
+DEFAULT_WATCH_INTERVAL=0.25
+ON_ERROR_STOP="stop"
+ON_ERROR_CONTINUE="continue"
+
+# up / down の排他（sp_getapplock）。待機のタイムアウトと、保持中の生存確認の間隔（秒）
+LOCK_RESOURCE_PREFIX="mssql-migrate:"
+DEFAULT_LOCK_TIMEOUT=600
+DEFAULT_LOCK_HEARTBEAT=30
+
+# 再試行するエラー（SQLSTATE・エラー番号）と、指数バックオフの初期値・上限（秒）
+#   40001 / 1205: デッドロック、1222: ロックタイムアウト（SET LOCK_TIMEOUT）、HYT00: クエリタイムアウト
+#   08S01 / 08001 / 233 / 10053 / 10054 / 10060: 接続断、40197 / 40501 / 40613 / 49918-49920 / 10928 / 10929 / 4221: Azure SQL の一時的な障害
+DEFAULT_RETRY_MAX=3
+DEFAULT_RETRY_DELAY=1.0
+DEFAULT_RETRY_MAX_DELAY=30.0
+RETRY_SQLSTATES=["40001", "HYT00", "08S01", "08001"]
+RETRY_ERROR_NUMBERS=[1205, 1222, 233, 10053, 10054, 10060, 40197, 40501, 40613, 49918, 49919, 49920, 10928, 10929, 4221]
+# "... (1205) (SQLExecDirectW)" / 一括送信時は "mssql-migrate statement N: Msg 1205, ..."
+SQL_ERROR_NUMBER_PATTERN=re.compile(r"\((\d+)\)|Msg (\d+),")
+
+DEFAULT_DB_POOL_SIZE=4
+DEFAULT_DB_POOL_PING_INTERVAL=30
+DEFAULT_DB_FETCH_SIZE=1000
+
+MIGRATE_TABLE_COLUMNS=[
+    { "name": "id"          , "type": "nvarchar(20)"},
+    { "name": "name"        , "type": "nvarchar(50)"},
+    { "name": "size"        , "type": "int"},
+    { "name": "hash"        , "type": "nvarchar(64)"},
+    { "name": "applied_date", "type": "datetime2(7)"},
+    { "name": "applied_user", "type": "nvarchar(50)"},
+    { "name": "duration_ms" , "type": "bigint"},
+    { "name": "row_count"   , "type": "bigint"},
+    { "name": "checkpoint"  , "type": "nvarchar(400)"},
+    { "name": "chain_hash"  , "type": "nvarchar(64)"},
+]
+# ステートメントごとの実行時間・影響行数（<MSSQL_MIGRATE_TABLE>_detail）
+MIGRATE_DETAIL_TABLE_SUFFIX="_detail"
+MIGRATE_DETAIL_TABLE_COLUMNS=[
+    { "name": "id"          , "type": "nvarchar(20)"},
+    { "name": "seq"         , "type": "int"},
+    { "name": "duration_ms" , "type": "bigint"},
+    { "name": "row_count"   , "type": "bigint"},
+    { "name": "statement"   , "type": "nvarchar(200)"},
+]
+MIGRATE_SHOW_DETAIL_HEADER=[
+    "seq",
+    ("duration", "duration"),
+    ("row_count", "rows"),
+    "statement",
+]
+MIGRATE_STATUS_SORT_KEYS=["id", "duration"]
+
+# status の出力形式（json / csv / tsv は１行ずつ出力）
+OUTPUT_FORMAT_TABLE="table"
+OUTPUT_FORMAT_JSON="json"
+OUTPUT_FORMAT_CSV="csv"
+OUTPUT_FORMAT_TSV="tsv"
+OUTPUT_FORMATS=[OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_TSV]
+MIGRATE_STATUS_COLUMNS=["id", "name", "size", "hash", "applied_date", "applied_user", "duration_ms", "row_count", "checkpoint"]
+MIGRATE_STATE_COLUMNS=["state"] + MIGRATE_STATUS_COLUMNS
+MIGRATE_DETAIL_COLUMNS=["id", "seq", "duration_ms", "row_count", "statement"]
+MIGRATE_SHOW_STATE_HEADER=[
+    "state",
+    "id",
+    "name",
+    "size",
+    ("hash_short", "hash (sha256)"),
+    "applied_date",
+    "applied_user",
+]
+MIGRATE_STATE_APPLIED="applied"
+MIGRATE_STATE_PENDING="pending"
+MIGRATE_STATE_DRIFTED="drifted"
+MIGRATE_STATE_ORPHANED="orphaned"
+MIGRATE_STATES=[MIGRATE_STATE_APPLIED, MIGRATE_STATE_PENDING, MIGRATE_STATE_DRIFTED, MIGRATE_STATE_ORPHANED]
+MIGRATE_SHOW_VERIFY_HEADER=[
+    "state",
+    "id",
+    "name",
+    ("hash_short", "hash (file)"),
+    ("applied_hash_short", "hash (applied)"),
+    "applied_date",
+]
+MIGRATE_VERIFY_COLUMNS=["state", "id", "name", "hash", "applied_hash", "applied_date"]
+
+# plan の出力（実行時間の長い順）。statements はステートメント単位の上位 N 件
+MIGRATE_SHOW_PLAN_HEADER=[
+    "rank",
+    "id",
+    "name",
+    "direction",
+    "result",
+    ("duration", "duration"),
+    ("row_count", "rows"),
+    "statements",
+    "logical_reads",
+    "physical_reads",
+    ("cpu_time", "cpu"),
+]
+MIGRATE_PLAN_COLUMNS=["rank", "id", "name", "direction", "result", "duration_ms", "row_count", "statements", "logical_reads", "physical_reads", "cpu_ms"]
+MIGRATE_SHOW_PLAN_STATEMENT_HEADER=[
+    "rank",
+    "id",
+    "direction",
+    "seq",
+    ("duration", "duration"),
+    ("row_count", "rows"),
+    "logical_reads",
+    "physical_reads",
+    ("cpu_time", "cpu"),
+    "statement",
+]
+MIGRATE_PLAN_STATEMENT_COLUMNS=["rank", "id", "direction", "seq", "duration_ms", "row_count", "logical_reads", "physical_reads", "cpu_ms", "statement"]
+DEFAULT_PLAN_TOP=20
+# SET STATISTICS IO / TIME の情報メッセージ
+STATISTICS_IO_PATTERN=re.compile(r"logical reads (\d+), physical reads (\d+)")
+STATISTICS_TIME_PATTERN=re.compile(r"SQL Server Execution Times:\s*CPU time = (\d+) ms")
+
+# OPENJSON が使える互換性レベル（SQL Server 2016）
+OPENJSON_COMPATIBILITY_LEVEL=130
+
+# 全角・曖昧幅の文字は２桁として表示幅を計算
+UNICODE_WIDTHS={'F': 2, 'W': 2, 'A': 2}
+
+MIGRATE_SHOW_STATUS_HEADER=[
+    "id",
+    "name",
+    "size",
+    ("hash_short", "hash (sha256)"),
+    "applied_date",
+    "applied_user",
+    "duration",
+    ("row_count", "rows"),
+]
+
+
+class SimpleTable:
+
+
+    def __init__(self, header=[], rows=[]):
+        self._header = header
+        self._rows = rows
+        self._width_cache = {}
+
+
+    def set_header(self, header):
+        self._header = header
+
+
+    def set_rows(self, rows):
+        self._rows = rows
+
+
+    def add_row(self, row):
+        self._rows.append(row)
+
+
+    def print_table(self, indent=0, file=None):
+        # 巨大なテーブルも１つの文字列にまとめず、１行ずつ出力する
+        file = file or sys.stdout
+        lines = self._generate_lines(indent)
+        if ( lines is None ):
+            print(None, file=file)
+            return
+        for line in lines:
+            file.write(line + "\n")
+
+
+    def get_table(self, indent=0):
+        lines = self._generate_lines(indent)
+        if ( lines is None ): return None
+        return "\n".join(lines)
+
+
+    def _get_unicode_width(self, value):
+        s = self._to_str(value)
+        if ( s.isascii() ): return len(s)
+
+        # 同じ値（名前・日付など）は何度も出てくるため、幅をキャッシュする
+        width = self._width_cache.get(s, None)
+        if ( width is None ):
+            width = sum(UNICODE_WIDTHS.get(unicodedata.east_asian_width(c), 1) for c in s)
+            self._width_cache[s] = width
+        return width
+
+
+    def _to_str(self, value):
+        value = "" if value is None else str(value)
+        return value
+
+
+    def _to_cell(self, value):
+        # セルごとの文字列・幅・寄せは１回だけ求める
+        text = self._to_str(value)
+        is_right = ( isinstance(value, int) or isinstance(value, float) )
+        return ( text, self._get_unicode_width(text), is_right )
+
+
+    def _padding(self, cell, length):
+        text, width, is_right = cell
+        spacer = " " * (length - width)
+        return ( spacer + text ) if is_right else ( text + spacer )
+
+
+    def _get_columns(self):
+        header = self._header or []
+        rows   = self._rows or []
+
+        # list / tuple の行: 列番号で参照。header が無ければ header 行を出力しない
+        if ( isinstance(rows[0], list) or isinstance(rows[0], tuple) ):
+            column_count = max(max([len(v) for v in rows]), len(header))
+            captions = [ header[i] if i < len(header) else "" for i in range(0, column_count) ]
+            cells = [ [ self._to_cell(row[i] if i < len(row) else "") for i in range(0, column_count) ] for row in rows ]
+            return ( captions if len(header) > 0 else None ), cells
+
+        if ( len(header) > 0):
+            keys = []
+            captions = []
+            for h in header:
+                if ( isinstance(h, list) or isinstance(h, tuple) ):
+                    key = h[0] if len(h) > 0 else ""
+                    caption = h[1] if len(h) > 1 else key
+                    keys.append(key)
+                    captions.append(caption)
+                else:
+                    keys.append(h)
+                    captions.append(h)
+        else:
+            keys = [ k for r in rows for k in r.keys() ]
+            keys = sorted(set(keys), key=keys.index)
+            captions = list(keys)
+
+        cells = [ [ self._to_cell(row.get(key, None)) for key in keys ] for row in rows ]
+        return captions, cells
+
+
+    def _generate_lines(self, indent=0):
+        if ( len(self._rows) == 0 ): return None
+        if ( not isinstance(self._rows[0], (list, tuple, dict)) ): return None
+
+        captions, cells = self._get_columns()
+        if ( captions is not None ):
+            captions = [ ( str(x), self._get_unicode_width(x), False ) for x in captions ]
+
+        column_lengths = [ 0 ] * len(cells[0])
+        for row in ( cells if captions is None else itertools.chain([captions], cells) ):
+            for i in range(0, len(row)):
+                if ( row[i][1] > column_lengths[i] ): column_lengths[i] = row[i][1]
+
+        return self._iter_lines(indent, captions, cells, column_lengths)
+
+
+    def _iter_lines(self, indent, captions, cells, column_lengths):
+        prefix = " " * indent
+        border = prefix + "+" + "-".join([ ("-" * ( x + 2 )) for x in column_lengths ]) + "+"
+
+        if ( captions is not None ):
+            yield border
+            yield prefix + "| " + " | ".join([ self._padding(captions[i], column_lengths[i]) for i in range(0, len(column_lengths)) ]) + " |"
+
+        yield border
+        for row in cells:
+            yield prefix + "| " + " | ".join([ self._padding(row[i], column_lengths[i]) for i in range(0, len(column_lengths)) ]) + " |"
+        yield border
+
+
+class DatabaseManager():
+
+    def __init__(self, host, port, database, uid, pwd, pool_size=DEFAULT_DB_POOL_SIZE, ping_interval=DEFAULT_DB_POOL_PING_INTERVAL, fetch_size=DEFAULT_DB_FETCH_SIZE):
+        self._connection_string = 'DRIVER={ODBC Driver 17 for SQL Server};' +\
+            f'SERVER={host},{port};' + \
+            f'DATABASE={database};' + \
+            f'UID={uid};' + \
+            f'PWD={pwd}'
+
+        # コネクションプール（未使用の接続と最終使用時刻）
+        self._pool_size     = max(pool_size, 0)
+        self._ping_interval = ping_interval
+        self._pool          = []
+        self._pool_lock     = threading.Lock()
+
+        # iter_query() で１回に読み込む行数
+        self._fetch_size    = max(int(fetch_size), 1)
+
+        # begin() 〜 commit()/rollback() の間、スレッドごとに固定する接続
+        self._local         = threading.local()
+
+        # スキーマ・オブジェクトの存在確認用スナップショット
+        self.catalog        = CatalogSnapshot(self)
+
+        # 実行中のステートメントの進捗表示（ProgressMonitor）と、進捗の問い合わせに使う接続ごとのセッション ID
+        self.progress       = None
+        self._session_ids   = {}
+
+        # 接続統計
+        self.connect_count    = 0
+        self.reuse_count      = 0
+        self.reconnect_count  = 0
+        self.round_trip_count = 0
+        self.retry_count      = 0
+        self.retry_wait       = 0.0
+
+    def _connect(self):
+        cnxn = pyodbc.connect(self._connection_string)
+        with self._pool_lock:
+            self.connect_count += 1
+        return cnxn
+
+    def connect_dedicated(self):
+        # プールに戻さない専用の接続（アプリケーションロック用）
+        return self._connect()
+
+    def _on_error(self, err):
+        # 再試行できるエラーか判定するため、スレッドごとに最後のエラーを保持
+        self._local.last_error = err
+        print(err, file=sys.stderr)
+
+    def get_last_error(self):
+        return getattr(self._local, "last_error", None)
+
+    def clear_last_error(self):
+        self._local.last_error = None
+
+    @contextlib.contextmanager
+    def collect_messages(self):
+        # 実行中は timings にステートメントごとの情報メッセージ（SET STATISTICS IO / TIME など）を追加する
+        self._local.is_collect_messages = True
+        try:
+            yield
+        finally:
+            self._local.is_collect_messages = False
+
+    def _fetch_messages(self, cursor):
+        # 複数の結果セットがある場合は、全て読み進めてメッセージを集める
+        messages = []
+        while True:
+            messages.extend([ x[1] for x in (getattr(cursor, "messages", None) or []) ])
+            if ( not cursor.nextset() ): break
+        return messages
+
+    def add_retry(self, wait):
+        with self._pool_lock:
+            self.retry_count += 1
+            self.retry_wait  += wait
+
+    def _count_round_trips(self, count=1):
+        with self._pool_lock:
+            self.round_trip_count += count
+
+    def _is_alive(self, cnxn):
+        try:
+            cursor = cnxn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cnxn.commit()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _acquire(self):
+        while True:
+            with self._pool_lock:
+                if ( len(self._pool) == 0 ): break
+                cnxn, last_used = self._pool.pop()
+
+            # 一定時間使われていない接続は生存確認してから再利用
+            if ( time.monotonic() - last_used < self._ping_interval or self._is_alive(cnxn) ):
+                with self._pool_lock:
+                    self.reuse_count += 1
+                return cnxn
+
+            self._close(cnxn)
+            with self._pool_lock:
+                self.reconnect_count += 1
+
+        return self._connect()
+
+    def _release(self, cnxn, lock_timeout=None):
+        # SET LOCK_TIMEOUT は接続単位の設定のため、既定に戻してからプールに戻す（戻せない場合は破棄）
+        if ( lock_timeout is not None ):
+            try:
+                self._count_round_trips()
+                cnxn.cursor().execute("SET LOCK_TIMEOUT -1")
+            except pyodbc.Error:
+                self._close(cnxn)
+                return
+        with self._pool_lock:
+            if ( len(self._pool) < self._pool_size ):
+                self._pool.append((cnxn, time.monotonic()))
+                return
+        self._close(cnxn)
+
+    def _close(self, cnxn):
+        with self._pool_lock:
+            self._session_ids.pop(id(cnxn), None)
+        try:
+            cnxn.close()
+        except pyodbc.Error:
+            pass
+
+    def _is_connection_error(self, err):
+        sqlstate = err.args[0] if len(err.args) > 0 else ""
+        return ( isinstance(sqlstate, str) and sqlstate.startswith("08") )
+
+    @contextlib.contextmanager
+    def _connection(self, lock_timeout=None):
+        # トランザクション中は固定した接続を使い、commit/rollback は呼び出し側に任せる
+        # （ロック待ち時間は begin / set_lock_timeout で設定する）
+        pinned = getattr(self._local, "cnxn", None)
+        if ( pinned is not None ):
+            yield pinned
+            return
+
+        # lock_timeout: この接続で実行する間のロック待ち時間（ミリ秒）
+        cnxn = self._acquire()
+        is_reusable = True
+        try:
+            if ( lock_timeout is not None ):
+                self._count_round_trips()
+                cnxn.cursor().execute(f"SET LOCK_TIMEOUT {int(lock_timeout)}")
+            yield cnxn
+        except pyodbc.Error as err:
+            # 切断された接続はプールに戻さず破棄（次回取得時に再接続）
+            if ( self._is_connection_error(err) ):
+                is_reusable = False
+                with self._pool_lock:
+                    self.reconnect_count += 1
+                raise
+            try:
+                cnxn.rollback()
+            except pyodbc.Error:
+                is_reusable = False
+                raise err
+            raise
+        except BaseException:
+            # 途中の状態が分からないため破棄
+            is_reusable = False
+            raise
+        finally:
+            # 失敗した場合も、ロック待ち時間を既定に戻してからプールに戻す
+            if ( is_reusable ):
+                self._release(cnxn, lock_timeout)
+            else:
+                self._close(cnxn)
+
+    def in_transaction(self):
+        return ( getattr(self._local, "cnxn", None) is not None )
+
+    def begin(self, lock_timeout=None):
+        if ( self.in_transaction() ):
+            log_error("transaction is already started.")
+            return False
+        try:
+            cnxn = self._acquire()
+        except pyodbc.Error as err:
+            self._on_error(err)
+            return False
+
+        self._local.cnxn = cnxn
+        self._local.lock_timeout = None
+        if ( lock_timeout is not None ):
+            if ( not self.set_lock_timeout(lock_timeout) ):
+                self.rollback()
+                return False
+        return True
+
+    def set_lock_timeout(self, lock_timeout=None):
+        # トランザクション中の接続のロック待ち時間（ミリ秒）。None で既定（無制限）に戻す
+        # SET LOCK_TIMEOUT は接続単位の設定のため、commit / rollback でプールに戻す前に元に戻す
+        if ( not self.execute(f"SET LOCK_TIMEOUT {int(lock_timeout) if lock_timeout is not None else -1}") ): return False
+        self._local.lock_timeout = lock_timeout
+        return True
+
+    def _reset_lock_timeout(self, cnxn):
+        if ( getattr(self._local, "lock_timeout", None) is None ): return True
+        self._local.lock_timeout = None
+        try:
+            cnxn.cursor().execute("SET LOCK_TIMEOUT -1")
+            return True
+        except pyodbc.Error:
+            return False
+
+    def commit(self):
+        cnxn = getattr(self._local, "cnxn", None)
+        if ( cnxn is None ): return True
+        self._local.cnxn = None
+        try:
+            cnxn.commit()
+        except pyodbc.Error as err:
+            self._on_error(err)
+            self._local.lock_timeout = None
+            self._close(cnxn)
+            return False
+        if ( self._reset_lock_timeout(cnxn) ):
+            self._release(cnxn)
+        else:
+            self._close(cnxn)
+        return True
+
+    def rollback(self):
+        cnxn = getattr(self._local, "cnxn", None)
+        if ( cnxn is None ): return True
+        self._local.cnxn = None
+        self.catalog.invalidate()
+        try:
+            cnxn.rollback()
+        except pyodbc.Error as err:
+            # 失敗の原因となったエラー（get_last_error）は上書きしない
+            print(err, file=sys.stderr)
+            self._local.lock_timeout = None
+            self._close(cnxn)
+            return False
+        if ( self._reset_lock_timeout(cnxn) ):
+            self._release(cnxn)
+        else:
+            self._close(cnxn)
+        return True
+
+    def close(self):
+        if ( self.progress is not None ): self.progress.close()
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for cnxn, _ in pool:
+            self._close(cnxn)
+
+    def _get_session_id(self, cnxn):
+        # 接続ごとに１回だけ問い合わせる
+        with self._pool_lock:
+            session_id = self._session_ids.get(id(cnxn), None)
+        if ( session_id is not None ): return session_id
+
+        cursor = cnxn.cursor()
+        self._count_round_trips()
+        session_id = cursor.execute("SELECT @@SPID").fetchone()[0]
+        with self._pool_lock:
+            self._session_ids[id(cnxn)] = session_id
+        return session_id
+
+    def _watch_progress(self, cnxn, statement):
+        if ( self.progress is None ): return contextlib.nullcontext()
+        return self.progress.statement(self._get_session_id(cnxn), statement)
+
+    def get_stats(self):
+        return {
+            "connect"  : self.connect_count,
+            "reuse"    : self.reuse_count,
+            "reconnect": self.reconnect_count,
+            "round_trip": self.round_trip_count,
+            "retry"     : self.retry_count,
+            "retry_wait": self.retry_wait,
+        }
+
+    def connect_test(self):
+        try:
+            with self._connection():
+                return True
+        except pyodbc.Error as err:
+            self._on_error(err)
+            return False
+
+    def execute(self, sqls, timings=None, params=None, coalesce_size=0, lock_timeout=None):
+        if ( type(sqls) is str ):
+            sqls = [sqls]
+
+        if ( coalesce_size > 0 ):
+            return self._execute_coalesced(sqls, timings, coalesce_size, lock_timeout)
+
+        # timings を渡すと、ステートメントごとの実行時間と影響行数を追加する
+        # lock_timeout はトランザクション外で実行する場合のみ、この呼び出しの間だけ設定する
+        try:
+            with self._connection(lock_timeout) as cnxn:
+                cursor = cnxn.cursor()
+                for sql in sqls:
+                    if ( len(sql.strip()) == 0 ): continue
+                    with self._watch_progress(cnxn, summarize_sql(sql)):
+                        start = time.monotonic()
+                        self._count_round_trips()
+                        cursor.execute(sql, *(params or []))
+                    if ( timings is not None ):
+                        timing = {
+                            "statement"  : summarize_sql(sql),
+                            "duration_ms": int((time.monotonic() - start) * 1000),
+                            "row_count"  : cursor.rowcount if cursor.rowcount >= 0 else None,
+                        }
+                        if ( getattr(self._local, "is_collect_messages", False) ):
+                            timing["messages"] = self._fetch_messages(cursor)
+                        timings.append(timing)
+                if ( not self.in_transaction() ): cnxn.commit()
+            return True
+        except pyodbc.Error as err:
+            self._on_error(err)
+            return False
+
+    def _execute_coalesced(self, sqls, timings, coalesce_size, lock_timeout=None):
+
+        # 連続するステートメントを coalesce_size 文字までまとめて１回で送信する
+        # timings は送信ごとに追加し、失敗時は元のステートメントの番号を表示する
+        statements = []
+        try:
+            with self._connection(lock_timeout) as cnxn:
+                cursor = cnxn.cursor()
+                for statements in coalesce_sql_statements(sqls, coalesce_size):
+                    with self._watch_progress(cnxn, summarize_coalesced_statements(statements)):
+                        start = time.monotonic()
+                        self._count_round_trips()
+                        # SET STATISTICS IO / TIME のメッセージは結果セットごとに返るため、読み進めながら集める
+                        messages = [] if ( timings is not None and getattr(self._local, "is_collect_messages", False) ) else None
+                        if ( len(statements) == 1 ):
+                            cursor.execute(statements[0][1])
+                            row_count = cursor.rowcount if cursor.rowcount >= 0 else None
+                            if ( messages is not None ): messages.extend(self._fetch_messages(cursor))
+                        else:
+                            cursor.execute(build_coalesced_batch(statements))
+                            row_count = fetch_coalesced_row_count(cursor, messages)
+                    if ( timings is not None ):
+                        timing = {
+                            "statement"  : summarize_coalesced_statements(statements),
+                            "duration_ms": int((time.monotonic() - start) * 1000),
+                            "row_count"  : row_count,
+                        }
+                        if ( messages is not None ): timing["messages"] = messages
+                        timings.append(timing)
+                if ( not self.in_transaction() ): cnxn.commit()
+            return True
+        except pyodbc.Error as err:
+            self._on_error(err)
+            log_error(get_failed_statement_message(err, statements))
+            return False
+
+    def execute_many(self, sql, rows, chunk_size=DEFAULT_BULK_CHUNK_SIZE, callback=None):
+        # rows は chunk_size 件ずつ取り出して送信する（全件をメモリに載せない）
+        rows = iter(rows)
+        count = 0
+        try:
+            with self._connection() as cnxn:
+                cursor = cnxn.cursor()
+                cursor.fast_executemany = True
+                while True:
+                    chunk = list(itertools.islice(rows, chunk_size))
+                    if ( len(chunk) == 0 ): break
+                    self._count_round_trips()
+                    cursor.executemany(sql, chunk)
+                    count += len(chunk)
+                    if ( callback is not None ): callback(count)
+                if ( not self.in_transaction() ): cnxn.commit()
+            return count
+        except pyodbc.Error as err:
+            self._on_error(err)
+            return None
+
+    def query(self, sql, params=None):
+        try:
+            with self._connection() as cnxn:
+                cursor = cnxn.cursor()
+                self._count_round_trips()
+                rc = cursor.execute(sql, *(params or []))
+                records = cursor.fetchall()
+                if ( not self.in_transaction() ): cnxn.commit()
+
+            # pyodbc.Row は tuple と同様に参照できるため、コピーせずそのまま返す
+            result = types.SimpleNamespace(
+                Columns = [ c[0] for c in rc.description ],
+                Records = records
+            )
+            return result
+
+        except pyodbc.Error as err:
+            self._on_error(err)
+            return None
+
+    def iter_query(self, sql, params=None, fetch_size=None):
+        # 結果を fetch_size 行ずつ読み込み、Records から１行ずつ返す（全件をメモリに載せない）
+        # Records を読み終わる（または close() する）まで接続を占有するため、トランザクション中は読み終えてから次を実行する
+        # 読み込み中に失敗した場合は Records を終了し、Error にエラーを設定する
+        result  = types.SimpleNamespace(Columns=None, Records=None, Error=None)
+        records = self._iter_records(result, sql, params, fetch_size or self._fetch_size)
+        if ( next(records, result) is result ): return None
+        result.Records = records
+        return result
+
+    def _iter_records(self, result, sql, params, fetch_size):
+        try:
+            with self._connection() as cnxn:
+                cursor = cnxn.cursor()
+                cursor.arraysize = fetch_size
+                self._count_round_trips()
+                cursor.execute(sql, *(params or []))
+                result.Columns = [ c[0] for c in cursor.description ]
+                try:
+                    yield None
+                    while True:
+                        rows = cursor.fetchmany(fetch_size)
+                        if ( len(rows) == 0 ): break
+                        yield from rows
+                except GeneratorExit:
+                    # 途中で読むのをやめた場合も、残りの結果を破棄して接続を戻す
+                    pass
+                cursor.close()
+                if ( not self.in_transaction() ): cnxn.commit()
+        except pyodbc.Error as err:
+            self._on_error(err)
+            result.Error = err
+
+
+class CatalogSnapshot():
+
+    def __init__(self, dbm):
+        self._dbm     = dbm
+        self._lock    = threading.Lock()
+        self._schemas = None
+        self._objects = None
+        self._compatibility_level = 0
+
+    def load(self):
+        # スキーマとオブジェクトを１回のクエリでまとめて取得
+        ret = self._dbm.query("""
+            SELECT 'L', CAST(databases.compatibility_level AS nvarchar(10))
+            FROM sys.databases databases
+            WHERE databases.database_id = DB_ID()
+            UNION ALL
+            SELECT 'S', schemas.name
+            FROM sys.schemas schemas
+            UNION ALL
+            SELECT 'O', schemas.name + '.' + objects.name
+            FROM sys.objects objects
+                INNER JOIN sys.schemas schemas
+                    ON  objects.schema_id = schemas.schema_id
+            WHERE objects.is_ms_shipped = 0
+              AND objects.parent_object_id = 0
+        """)
+        if ( ret is None ): return False
+
+        level   = 0
+        schemas = set()
+        objects = set()
+        for kind, name in ret.Records:
+            if ( kind == "L" ): level = int(name)
+            if ( kind == "S" ): schemas.add(name.casefold())
+            if ( kind == "O" ): objects.add(name.casefold())
+
+        with self._lock:
+            self._compatibility_level = level
+            self._schemas = schemas
+            self._objects = objects
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._schemas = None
+            self._objects = None
+
+    def _get(self):
+        with self._lock:
+            schemas, objects = self._schemas, self._objects
+        if ( schemas is None ):
+            if ( not self.load() ): return set(), set()
+            return self._get()
+        return schemas, objects
+
+    def get_compatibility_level(self):
+        self._get()
+        with self._lock:
+            return self._compatibility_level
+
+    def is_schema_exists(self, schema_name):
+        schemas, _ = self._get()
+        return ( schema_name.casefold() in schemas )
+
+    def is_object_exists(self, object_name):
+        _, objects = self._get()
+        return ( object_name.casefold() in objects )
+
+
+class MigrationLock():
+
+    # sp_getapplock（Session 所有）で up / down を DB 単位で排他する
+    #   待機はサーバー側でブロックするのみ（ポーリングしない）
+    #   専用の接続が切れるとロックも解放されるため、プロセスが異常終了しても残らない
+    #   保持中は一定間隔でロックを確認し、失われていたら is_lost を立てる
+
+    def __init__(self, dbm, resource, timeout, heartbeat_interval):
+        self.resource            = resource
+        self.is_lost             = False
+        self.wait_seconds        = 0.0
+        self._dbm                = dbm
+        self._timeout            = timeout
+        self._heartbeat_interval = heartbeat_interval
+        self._cnxn               = None
+        self._cnxn_lock          = threading.Lock()
+        self._stop               = threading.Event()
+        self._thread             = None
+        self._acquired_time      = None
+
+    def acquire(self):
+        start = time.monotonic()
+        cnxn = None
+        try:
+            cnxn = self._dbm.connect_dedicated()
+            cursor = cnxn.cursor()
+            cursor.execute("""
+                SET NOCOUNT ON;
+                DECLARE @ret int;
+                EXEC @ret = sp_getapplock @Resource = ?, @LockMode = 'Exclusive', @LockOwner = 'Session', @LockTimeout = ?;
+                SELECT @ret;
+            """, self.resource, int(self._timeout * 1000))
+            ret = cursor.fetchone()[0]
+            cnxn.commit()
+        except pyodbc.Error as err:
+            print(err, file=sys.stderr)
+            if ( cnxn is not None ): self._close(cnxn)
+            return False
+        finally:
+            self.wait_seconds = time.monotonic() - start
+
+        # 0: 取得 / 1: 待機後に取得 / -1: タイムアウト / -2: キャンセル / -3: デッドロック / -999: エラー
+        if ( ret < 0 ):
+            log_error(f"could not acquire the lock `{self.resource}` in {self.wait_seconds:.1f}s (sp_getapplock returned {ret}).")
+            self._close(cnxn)
+            return False
+
+        self._cnxn = cnxn
+        self._acquired_time = time.monotonic()
+        if ( self._heartbeat_interval > 0 ):
+            self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._thread.start()
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(self._heartbeat_interval):
+            try:
+                with self._cnxn_lock:
+                    cursor = self._cnxn.cursor()
+                    cursor.execute("SELECT APPLOCK_MODE('public', ?, 'Session')", self.resource)
+                    mode = cursor.fetchone()[0]
+                    self._cnxn.commit()
+            except pyodbc.Error as err:
+                print(err, file=sys.stderr)
+                mode = None
+
+            if ( mode != "Exclusive" ):
+                self.is_lost = True
+                return
+
+    def release(self):
+        # 保持していた秒数を返す
+        self._stop.set()
+        if ( self._thread is not None ): self._thread.join()
+
+        with self._cnxn_lock:
+            cnxn, self._cnxn = self._cnxn, None
+        if ( cnxn is None ): return 0.0
+
+        try:
+            cursor = cnxn.cursor()
+            cursor.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'", self.resource)
+            cnxn.commit()
+        except pyodbc.Error:
+            # 接続を閉じればロックも解放される
+            pass
+        self._close(cnxn)
+        return time.monotonic() - self._acquired_time
+
+    def _close(self, cnxn):
+        try:
+            cnxn.close()
+        except pyodbc.Error:
+            pass
+
+class ProgressMonitor():
+
+    # 実行中のステートメントの進捗を、専用の接続から sys.dm_exec_requests に問い合わせて表示する
+    #   interval 秒以上かかっているステートメントのみ、interval 秒ごとに問い合わせる
+    #   問い合わせの結果が無い（権限が無いなど）場合も、経過時間は表示する
+    #   path を指定すると、進捗を JSON Lines で追記する
+
+    def __init__(self, dbm, database, interval, path=None):
+        self._dbm          = dbm
+        self._database     = database
+        self._interval     = interval
+        self._path         = path
+        self._statements   = {}
+        self._lock         = threading.Lock()
+        self._local        = threading.local()
+        self._cnxn         = None
+        self._stop         = threading.Event()
+        self._thread       = None
+        self._is_available = True
+
+    @contextlib.contextmanager
+    def migration(self, migration_info, ip_down, is_silent):
+        # 実行中のマイグレーション（スレッドごと）
+        self._local.migration = {
+            "id"       : migration_info.get("id", None),
+            "direction": "down" if ip_down else "up",
+            "is_silent": is_silent,
+        }
+        try:
+            yield
+        finally:
+            self._local.migration = None
+
+    @contextlib.contextmanager
+    def statement(self, session_id, statement):
+        now = time.monotonic()
+        info = {
+            **(getattr(self._local, "migration", None) or { "id": None, "direction": None, "is_silent": False }),
+            "session_id" : session_id,
+            "statement"  : statement,
+            "start"      : now,
+            "next"       : now + self._interval,
+            "is_reported": False,
+        }
+        with self._lock:
+            self._statements[id(info)] = info
+            if ( self._thread is None ):
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._statements.pop(id(info), None)
+                if ( info["is_reported"] ): self._report(info, None, "done")
+
+    def _run(self):
+        while not self._stop.wait(min(self._interval, 1.0)):
+            now = time.monotonic()
+            with self._lock:
+                due = [ x for x in self._statements.values() if x["next"] <= now ]
+
+            for info in due:
+                row = self._query(info["session_id"]) if self._is_available else None
+                with self._lock:
+                    # 問い合わせ中に終了したものは表示しない
+                    if ( id(info) not in self._statements ): continue
+                    info["next"] = now + self._interval
+                    info["is_reported"] = True
+                    self._report(info, row, "progress")
+
+    def _query(self, session_id):
+        try:
+            if ( self._cnxn is None ): self._cnxn = self._dbm.connect_dedicated()
+            cursor = self._cnxn.cursor()
+            cursor.execute("""
+                SELECT
+                        requests.command
+                    ,   requests.percent_complete
+                    ,   requests.wait_type
+                    ,   requests.wait_time
+                    ,   requests.blocking_session_id
+                    ,   blocker.login_name   AS blocker_login
+                    ,   blocker.host_name    AS blocker_host
+                    ,   blocker.program_name AS blocker_program
+                    ,   requests.cpu_time
+                    ,   requests.logical_reads
+                    ,   requests.row_count
+                FROM sys.dm_exec_requests requests
+                    LEFT OUTER JOIN sys.dm_exec_sessions blocker
+                        ON  blocker.session_id = requests.blocking_session_id
+                WHERE requests.session_id = ?
+            """, session_id)
+            columns = [ c[0] for c in cursor.description ]
+            rows = cursor.fetchall()
+            self._cnxn.commit()
+        except pyodbc.Error as err:
+            # 以降は問い合わせず、経過時間のみ表示する
+            log_error(f"could not query the progress from sys.dm_exec_requests. {err}")
+            self._is_available = False
+            return None
+        return dict(zip(columns, rows[0])) if len(rows) > 0 else None
+
+    def _report(self, info, row, event):
+        row = row or {}
+        elapsed_ms = int((time.monotonic() - info["start"]) * 1000)
+        percent = float(row.get("percent_complete", None) or 0)
+        record = {
+            "time"               : datetime.datetime.now().isoformat(timespec="seconds"),
+            "event"              : event,
+            "database"           : self._database,
+            "id"                 : info["id"],
+            "direction"          : info["direction"],
+            "session_id"         : info["session_id"],
+            "statement"          : info["statement"],
+            "elapsed_ms"         : elapsed_ms,
+            "percent_complete"   : round(percent, 1) if percent > 0 else None,
+            "eta_ms"             : int(elapsed_ms * (100 - percent) / percent) if percent > 0 else None,
+            "command"            : ( row.get("command", None) or "" ).strip() or None,
+            "wait_type"          : row.get("wait_type", None),
+            "wait_time_ms"       : row.get("wait_time", None),
+            "blocking_session_id": row.get("blocking_session_id", None) or None,
+            "blocker_login"      : row.get("blocker_login", None),
+            "blocker_host"       : row.get("blocker_host", None),
+            "blocker_program"    : row.get("blocker_program", None),
+            "cpu_ms"             : row.get("cpu_time", None),
+            "logical_reads"      : row.get("logical_reads", None),
+            "row_count"          : row.get("row_count", None),
+        }
+        log_info(format_progress(record), info["is_silent"])
+
+        if ( self._path is None ): return
+        try:
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as err:
+            log_error(f"could not write the progress to `{self._path}`. {err}")
+            self._path = None
+
+    def close(self):
+        self._stop.set()
+        if ( self._thread is not None ): self._thread.join()
+        self._thread = None
+        self._stop.clear()
+
+        cnxn, self._cnxn = self._cnxn, None
+        if ( cnxn is None ): return
+        try:
+            cnxn.close()
+        except pyodbc.Error:
+            pass
+
+def format_progress(record):
+    caption = f"[progress] {record['database']} `{record['id'] or '-'}`"
+    if ( record["direction"] is not None ): caption += f" {record['direction']}"
+    if ( record["event"] == "done" ):
+        return f"{caption} done in {format_elapsed(record['elapsed_ms'])}"
+
+    items = [ caption, f"elapsed={format_elapsed(record['elapsed_ms'])}" ]
+    if ( record["percent_complete"] is not None ):
+        items.append(f"{record['percent_complete']}% eta={format_elapsed(record['eta_ms'])}")
+    if ( record["command"] is not None ):
+        items.append(f"command={record['command']}")
+    if ( record["wait_type"] is not None ):
+        items.append(f"wait={record['wait_type']} ({record['wait_time_ms'] or 0:,}ms)")
+    if ( record["blocking_session_id"] is not None ):
+        blocker = "@".join([ x for x in [record["blocker_login"], record["blocker_host"]] if x ])
+        if ( record["blocker_program"] ): blocker += f" {record['blocker_program']}"
+        items.append(f"blocked_by={record['blocking_session_id']}" + ( f" ({blocker.strip()})" if blocker.strip() else "" ))
+    return " ".join(items) + f"\n  {record['statement']}"
+
+def format_elapsed(elapsed_ms):
+    # 1h02m03s / 12m03s / 5s
+    seconds = int(elapsed_ms // 1000)
+    hours, minutes, seconds = seconds // 3600, seconds // 60 % 60, seconds % 60
+    if ( hours > 0 ): return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if ( minutes > 0 ): return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+def track_progress(config, migration_info, ip_down, is_silent):
+    # 進捗の表示にマイグレーションの id を含める
+    progress = generate_dbm(config).progress
+    if ( progress is None ): return contextlib.nullcontext()
+    return progress.migration(migration_info, ip_down, is_silent)
+
+def log_info(message, is_silent=False):
+    if ( is_silent ): return True
+    print(message)
+
+def log_error(message):
+    print(f"Error: {message}", file=sys.stderr)
+
+class ThreadOutput():
+
+    # スレッドごとに出力をバッファリングするための stdout / stderr の代替
+    def __init__(self, stream, local):
+        self._stream = stream
+        self._local  = local
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if ( buffer is None ):
+            return self._stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        if ( getattr(self._local, "buffer", None) is None ):
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+_output_local = threading.local()
+
+@contextlib.contextmanager
+def capture_output():
+    # スレッド内の print 出力（stdout / stderr）を順序どおりにバッファに溜める
+    buffer = []
+    _output_local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _output_local.buffer = None
+
+@contextlib.contextmanager
+def redirect_thread_output():
+    # 既に置き換え済み（複数 DB の並列実行中など）の場合はそのまま
+    if ( isinstance(sys.stdout, ThreadOutput) ):
+        yield
+        return
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = ThreadOutput(stdout, _output_local)
+    sys.stderr = ThreadOutput(stderr, _output_local)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+_run_stats_local = threading.local()
+
+def reset_run_stats():
+    _run_stats_local.stats = {}
+
+def add_run_stats(key, value):
+    stats = getattr(_run_stats_local, "stats", None)
+    if ( stats is None ):
+        stats = _run_stats_local.stats = {}
+    stats[key] = stats.get(key, 0) + value
+
+def get_run_stats():
+    return dict(getattr(_run_stats_local, "stats", None) or {})
+
+_dbm_cache = {}
+_dbm_cache_lock = threading.Lock()
+
+def get_dbm_key(config):
+    return (
+        config.MSSQL_MIGRATE_DB_HOST,
+        config.MSSQL_MIGRATE_DB_PORT,
+        config.MSSQL_MIGRATE_DB_NAME,
+        config.MSSQL_MIGRATE_DB_USER,
+    )
+
+def generate_dbm(config):
+    # 同一接続先の DatabaseManager はサブコマンド実行中ずっと共有する
+    key = get_dbm_key(config)
+    with _dbm_cache_lock:
+        dbm = _dbm_cache.get(key, None)
+        if ( dbm is None ):
+            dbm = DatabaseManager(
+                host    = config.MSSQL_MIGRATE_DB_HOST,
+                port    = config.MSSQL_MIGRATE_DB_PORT,
+                database= config.MSSQL_MIGRATE_DB_NAME,
+                uid     = config.MSSQL_MIGRATE_DB_USER,
+                pwd     = config.MSSQL_MIGRATE_DB_PASS,
+                pool_size     = int(getattr(config, "MSSQL_MIGRATE_DB_POOL_SIZE", DEFAULT_DB_POOL_SIZE)),
+                ping_interval = float(getattr(config, "MSSQL_MIGRATE_DB_POOL_PING_INTERVAL", DEFAULT_DB_POOL_PING_INTERVAL)),
+                fetch_size    = int(getattr(config, "MSSQL_MIGRATE_DB_FETCH_SIZE", DEFAULT_DB_FETCH_SIZE)),
+            )
+            progress_interval = float(getattr(config, "MSSQL_MIGRATE_PROGRESS_INTERVAL", DEFAULT_PROGRESS_INTERVAL))
+            if ( progress_interval > 0 ):
+                dbm.progress = ProgressMonitor(dbm, config.MSSQL_MIGRATE_DB_NAME, progress_interval, getattr(config, "MSSQL_MIGRATE_PROGRESS_FILE", None) or None)
+            _dbm_cache[key] = dbm
+    return dbm
+
+def close_dbms():
+    with _dbm_cache_lock:
+        dbms = list(_dbm_cache.values())
+        _dbm_cache.clear()
+    for dbm in dbms:
+        dbm.close()
+
+def close_dbm(config):
+    key = get_dbm_key(config)
+    with _dbm_cache_lock:
+        dbm = _dbm_cache.pop(key, None)
+    if ( dbm is not None ):
+        dbm.close()
+
+_migration_locks = {}
+_migration_locks_lock = threading.Lock()
+
+def is_migration_lock_enabled(config, args):
+    # MSSQL_MIGRATE_LOCK = False or --no-lock でロックしない。dry-run は何も変更しないためロックしない
+    if ( args.is_no_lock or args.is_dry_run ): return False
+    return bool(getattr(config, "MSSQL_MIGRATE_LOCK", True))
+
+def acquire_migration_lock(config, args):
+    if ( not is_migration_lock_enabled(config, args) ): return True
+
+    timeout = args.lock_timeout if args.lock_timeout is not None else float(getattr(config, "MSSQL_MIGRATE_LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT))
+    heartbeat = float(getattr(config, "MSSQL_MIGRATE_LOCK_HEARTBEAT", DEFAULT_LOCK_HEARTBEAT))
+    dbm = generate_dbm(config)
+    lock = MigrationLock(dbm, f"{LOCK_RESOURCE_PREFIX}{config.MSSQL_MIGRATE_TABLE}", timeout, heartbeat)
+
+    log_info(f"[lock] acquiring `{lock.resource}` (timeout={timeout:g}s)", args.is_silent)
+    if ( not lock.acquire() ): return False
+    log_info(f"[lock] acquired after waiting {lock.wait_seconds:.1f}s", args.is_silent)
+
+    # 待機中に他のノードがスキーマ・管理テーブルを作成している可能性があるため
+    dbm.catalog.invalidate()
+
+    with _migration_locks_lock:
+        _migration_locks[get_dbm_key(config)] = lock
+    return True
+
+def release_migration_lock(config, is_silent):
+    with _migration_locks_lock:
+        lock = _migration_locks.pop(get_dbm_key(config), None)
+    if ( lock is None ): return
+
+    held = lock.release()
+    log_info(f"[lock] released `{lock.resource}` after holding {held:.1f}s", is_silent)
+
+def is_migration_lock_lost(config):
+    with _migration_locks_lock:
+        lock = _migration_locks.get(get_dbm_key(config), None)
+    return ( lock is not None and lock.is_lost )
+
+def print_connection_stats(config, is_silent):
+    stats = generate_dbm(config).get_stats()
+    log_info(f"\n[connection] opened={stats['connect']} reused={stats['reuse']} reconnected={stats['reconnect']} round_trips={stats['round_trip']}", is_silent)
+    if ( stats["retry"] > 0 ):
+        log_info(f"[retry] retried={stats['retry']} waited={stats['retry_wait']:.1f}s", is_silent)
+
+# 設定ファイル・マイグレーションファイルから参照できるモジュール（import なしで使える）
+PY_VARS_GLOBALS={
+    "os"      : os,
+    "sys"     : sys,
+    "json"    : json,
+    "argparse": argparse,
+    "types"   : types,
+    "datetime": datetime,
+    "pathlib" : pathlib,
+    "copy"    : copy,
+    "hashlib" : hashlib,
+}
+
+def compile_py_file(path, content_hash=None, cache_dir=None):
+
+    # キャッシュ無し
+    if ( cache_dir is None ):
+        with open(path, "rb") as f:
+            return compile(f.read(), str(path), "exec")
+
+    # コンパイル済みコードをファイル内容のハッシュをキーにキャッシュ
+    path = pathlib.Path(path)
+    content_hash = content_hash or hash_file(path)
+    cache_path = pathlib.Path(cache_dir) / f"{path.name}.{content_hash[0:16]}.{sys.implementation.cache_tag}{CODE_CACHE_SUFFIX}"
+
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+        if ( data[0:len(importlib.util.MAGIC_NUMBER)] == importlib.util.MAGIC_NUMBER ):
+            return marshal.loads(data[len(importlib.util.MAGIC_NUMBER):])
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+
+    with open(path, "rb") as f:
+        code = compile(f.read(), str(path), "exec")
+
+    # 古いキャッシュを削除してから保存。保存できなくても処理は継続
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for old_name in pop_code_cache_entries(cache_dir, path.name):
+            if ( old_name != cache_path.name ): os.remove(os.path.join(cache_dir, old_name))
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+        os.replace(tmp_path, cache_path)
+        # 同じプロセスで再度変更された場合（watch など）に、このキャッシュを削除できるよう一覧に追加
+        add_code_cache_entry(cache_dir, path.name, cache_path.name)
+    except OSError:
+        pass
+
+    return code
+
+_code_cache_entries = {}
+_code_cache_entries_lock = threading.Lock()
+
+def pop_code_cache_entries(cache_dir, file_name):
+    # キャッシュディレクトリの一覧は１回だけ取得する（ファイルごとに glob すると O(n^2) になる）
+    # <ファイル名>.<ハッシュ>.<cache_tag><CODE_CACHE_SUFFIX>
+    with _code_cache_entries_lock:
+        entries = _code_cache_entries.get(str(cache_dir), None)
+        if ( entries is None ):
+            entries = _code_cache_entries[str(cache_dir)] = {}
+            for name in os.listdir(cache_dir):
+                if ( not name.endswith(CODE_CACHE_SUFFIX) ): continue
+                entries.setdefault(name[0:-len(CODE_CACHE_SUFFIX)].rsplit(".", 2)[0], []).append(name)
+        return entries.pop(file_name, [])
+
+def add_code_cache_entry(cache_dir, file_name, cache_name):
+    with _code_cache_entries_lock:
+        entries = _code_cache_entries.get(str(cache_dir), None)
+        if ( entries is not None ): entries.setdefault(file_name, []).append(cache_name)
+
+def import_py_vars(path, content_hash=None, cache_dir=None):
+
+    code = compile_py_file(path, content_hash, cache_dir)
+
+    # 専用の名前空間で実行し、定義された変数のみ抽出
+    namespace = {
+        "__builtins__": builtins,
+        "__name__"    : "__mssql_migrate__",
+        "__file__"    : str(path),
+        **PY_VARS_GLOBALS,
+    }
+    exec(code, namespace)
+
+    result = types.SimpleNamespace()
+    for k,v in namespace.items():
+        if ( k.startswith("__") ): continue
+        if ( isinstance(v, types.ModuleType) ): continue
+        setattr(result, k, v)
+
+    return result
+
+_migration_vars_cache = {}
+_migration_vars_cache_lock = threading.Lock()
+
+def load_migration_vars(config, migration_info):
+    path = migration_info["file"]
+    key = ( str(path), migration_info.get("hash", None) )
+
+    with _migration_vars_cache_lock:
+        migration_vars = _migration_vars_cache.get(key, None)
+    if ( migration_vars is not None ):
+        return migration_vars
+
+    # MSSQL_MIGRATE_CODE_CACHE = False でコンパイル済みコードのキャッシュを無効化
+    cache_dir = None
+    if ( getattr(config, "MSSQL_MIGRATE_CODE_CACHE", True) ):
+        cache_dir = pathlib.Path(path).parent / CODE_CACHE_DIR_NAME
+
+    migration_vars = import_py_vars(path, migration_info.get("hash", None), cache_dir)
+
+    # 行データにジェネレータ（１回しか読めない iterable）を直接指定している場合は、
+    # 再試行・watch で空のまま再利用しないよう、キャッシュせず毎回読み込み直す
+    if ( has_one_shot_rows(migration_vars) ): return migration_vars
+
+    with _migration_vars_cache_lock:
+        _migration_vars_cache[key] = migration_vars
+    return migration_vars
+
+def has_one_shot_rows(migration_vars):
+    for name in ["BULK_UP", "BULK_DOWN"]:
+        bulks = getattr(migration_vars, name, [])
+        if ( isinstance(bulks, dict) ): bulks = [bulks]
+        for bulk in bulks:
+            rows = bulk.get("rows", None) if isinstance(bulk, dict) else None
+            if ( rows is None or callable(rows) ): continue
+            if ( iter(rows) is rows ): return True
+    return False
+
+def get_migration_dir(config):
+
+    # SCRIPT_DIR の絶対パス。相対パスは config ファイルからの相対
+    script_dir = config.MSSQL_MIGRATE_FILE_DIR
+    if ( not os.path.isabs(script_dir) ):
+        config_path_abs = pathlib.Path(config.CONFIG_PATH).resolve()
+        script_dir = os.path.join(os.path.dirname(config_path_abs), script_dir)
+
+    return pathlib.Path(script_dir)
+
+def get_squashed_dir(config):
+
+    # ベースラインにまとめた元ファイルの移動先。相対パスは config ファイルからの相対
+    squashed_dir = getattr(config, "MSSQL_MIGRATE_SQUASHED_DIR", None)
+    if ( squashed_dir is None ): return get_migration_dir(config) / DEFAULT_SQUASHED_DIR_NAME
+    if ( not os.path.isabs(squashed_dir) ):
+        config_path_abs = pathlib.Path(config.CONFIG_PATH).resolve()
+        squashed_dir = os.path.join(os.path.dirname(config_path_abs), squashed_dir)
+
+    return pathlib.Path(squashed_dir)
+
+def get_display_path(path):
+    # 実行ディレクトリ配下ならば相対パスで表示
+    try:
+        return pathlib.Path(path).relative_to(pathlib.Path().cwd())
+    except ValueError:
+        return path
+
+def get_migration_files(config):
+    return [ path for path, _ in scan_migration_files(config) ]
+
+def scan_migration_files(config):
+
+    # パラメータから使用するものを変数に格納
+    config_path = config.CONFIG_PATH
+    config_path_abs = pathlib.Path(config_path).resolve()
+    script_dir_abs = get_migration_dir(config)
+
+    # ファイル一覧を stat 情報付きで取得。configファイルが含まれていたら除外
+    result = []
+    with os.scandir(script_dir_abs) as entries:
+        for entry in entries:
+            if ( split_migration_file_name(entry.name) is None ): continue
+            path = script_dir_abs / entry.name
+            if ( entry.name == config_path_abs.name and path.resolve() == config_path_abs ): continue
+            result.append((path, entry))
+
+    # ファイル一覧を返却
+    return result
+
+def hash_file(path):
+    # 大きなファイルでもメモリに全体を読み込まないよう、チャンク単位でハッシュ計算
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class MigrationManifest():
+
+    def __init__(self, path=None):
+        self._path     = path
+        self._lock     = threading.Lock()
+        self._entries  = {}
+        self._is_dirty = False
+
+        self.hit_count  = 0
+        self.miss_count = 0
+
+        if ( path is not None ):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if ( not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION ):
+            return
+        self._entries = data.get("files", {})
+
+    def clear(self):
+        with self._lock:
+            self._entries  = {}
+            self._is_dirty = True
+
+    def get_hash(self, path, stat):
+        # サイズ・更新日時が一致すればキャッシュしたハッシュを返す
+        with self._lock:
+            entry = self._entries.get(path.name, None)
+        if ( entry is not None and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns ):
+            with self._lock:
+                self.hit_count += 1
+            return entry.get("sha256")
+
+        hash = hash_file(path)
+        with self._lock:
+            self._entries[path.name] = {
+                "size"    : stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256"  : hash,
+            }
+            self._is_dirty = True
+            self.miss_count += 1
+        return hash
+
+    def prune(self, names):
+        names = set(names)
+        with self._lock:
+            removed = [ k for k in self._entries.keys() if k not in names ]
+            for k in removed:
+                del self._entries[k]
+            if ( len(removed) > 0 ): self._is_dirty = True
+
+    def save(self):
+        with self._lock:
+            if ( self._path is None or not self._is_dirty ): return True
+            data = { "version": MANIFEST_VERSION, "files": dict(sorted(self._entries.items())) }
+            self._is_dirty = False
+
+        # 書き込み途中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, self._path)
+            return True
+        except OSError:
+            # キャッシュなので保存できなくても処理は継続
+            return False
+
+_manifest_cache = {}
+_manifest_cache_lock = threading.Lock()
+
+def get_manifest(config):
+    # MSSQL_MIGRATE_MANIFEST_PATH に空文字 or None を指定するとファイルに保存しない
+    script_dir = get_migration_dir(config)
+    path = getattr(config, "MSSQL_MIGRATE_MANIFEST_PATH", os.path.join(script_dir, MANIFEST_FILE_NAME))
+    if ( path ):
+        if ( not os.path.isabs(path) ):
+            path = os.path.join(os.path.dirname(pathlib.Path(config.CONFIG_PATH).resolve()), path)
+        path = os.path.normpath(path)
+
+    key = ( str(script_dir), path or None )
+    with _manifest_cache_lock:
+        manifest = _manifest_cache.get(key, None)
+        if ( manifest is None ):
+            manifest = MigrationManifest(path or None)
+            _manifest_cache[key] = manifest
+    return manifest
+
+def split_migration_file_name(file_name):
+    for suffix, migration_type, direction in MIGRATION_FILE_SUFFIXES:
+        if ( file_name.endswith(suffix) ):
+            base_name = file_name[0:-len(suffix)]
+            return base_name, migration_type, direction
+    return None
+
+def get_migration_file_info(path: pathlib.Path, manifest=None, stat=None):
+    file_name, migration_type, direction = split_migration_file_name(path.name)
+    id = file_name.split("_")[0:1][0]
+    name = "_".join(file_name.split("_")[1:])
+
+    stat = path.stat() if stat is None else stat
+
+    hash = None
+    if ( S_ISREG(stat.st_mode) ):
+        hash = hash_file(path) if manifest is None else manifest.get_hash(path, stat)
+
+    return {
+        "file": path,
+        "id": id,
+        "name" : name,
+        "hash": hash,
+        "size": stat.st_size,
+        "type": migration_type,
+        "direction": direction,
+    }
+
+def merge_migration_file_infos(file_infos):
+
+    # .up.sql / .down.sql は１つのマイグレーションにまとめる
+    result = []
+    for file_info in file_infos:
+        if ( file_info["type"] != MIGRATION_TYPE_SQL ):
+            result.append(file_info)
+            continue
+
+        prev = result[-1] if len(result) > 0 else None
+        if ( prev is None or prev["type"] != MIGRATION_TYPE_SQL or (prev["id"], prev["name"]) != (file_info["id"], file_info["name"]) ):
+            prev = { **file_info, "file": None, "file_up": None, "file_down": None, "hashes": [], "size": 0 }
+            result.append(prev)
+
+        prev[f"file_{file_info['direction']}"] = file_info["file"]
+        prev["hashes"].append(file_info["hash"])
+        prev["size"] += file_info["size"]
+
+    for info in result:
+        if ( info["type"] != MIGRATION_TYPE_SQL ): continue
+        info["file"] = info["file_up"] or info["file_down"]
+        hashes = info.pop("hashes")
+        del info["direction"]
+
+        # up / down 両方ある場合は、それぞれのハッシュを連結してハッシュ化
+        if ( len(hashes) > 1 ):
+            info["hash"] = hashlib.sha256("".join([ x or "" for x in hashes ]).encode()).hexdigest()
+
+    return result
+
+def scan_migration_file_infos(config, manifest):
+    jobs = max(int(getattr(config, "MSSQL_MIGRATE_SCAN_JOBS", DEFAULT_SCAN_JOBS)), 1)
+
+    def get_infos(files):
+        return [ get_migration_file_info(path, manifest, entry.stat()) for path, entry in files ]
+
+    # stat・ハッシュ計算はファイルごとに独立しているため並列実行
+    # スレッドへの受け渡しコストを抑えるため、ある程度まとめて渡す
+    files = scan_migration_files(config)
+    if ( jobs > 1 and len(files) > 1 ):
+        chunk_size = max(len(files) // (jobs * 4), 1)
+        chunks = [ files[i:i + chunk_size] for i in range(0, len(files), chunk_size) ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            result = [ x for infos in executor.map(get_infos, chunks) for x in infos ]
+    else:
+        result = get_infos(files)
+
+    # 並列数に関わらず順序を一定にする（.down.sql は .up.sql の後）
+    result = sorted(result, key=lambda x:(x["id"], x["name"], x["type"], x["direction"] != "up", x["file"].name))
+
+    return result
+
+def is_baseline_info(migration_info):
+    path = migration_info.get("file", None)
+    return ( migration_info.get("type", None) == MIGRATION_TYPE_SQL and path is not None and path.name.endswith(BASELINE_FILE_SUFFIX) )
+
+def add_squashed_migration_infos(file_infos):
+
+    # ベースラインにまとめたマイグレーションは、元ファイルの代わりに
+    # ベースライン先頭の `-- BASELINE: <id> <hash> <size> <name>` で id・ハッシュを扱う
+    # （元ファイルは読まないため、まとめた件数に関わらずベースライン１ファイルの読み込みのみ）
+    ids = set([ x["id"] for x in file_infos ])
+    squashed_infos = []
+    for info in file_infos:
+        if ( not is_baseline_info(info) ): continue
+
+        info["squashed"] = []
+        for value in read_sql_directives(info["file"]).get("BASELINE", []):
+            id, hash, size, name = (value.split(None, 3) + ["", "", "", ""])[0:4]
+
+            # 元ファイルが残っている場合はそちらを優先
+            if ( id in ids ): continue
+            ids.add(id)
+            info["squashed"].append(id)
+            squashed_infos.append({
+                "file": None,
+                "id": id,
+                "name": name,
+                "hash": hash,
+                "size": int(size or 0),
+                "type": MIGRATION_TYPE_SQUASHED,
+                "baseline": info["id"],
+            })
+
+    if ( len(squashed_infos) == 0 ): return file_infos
+    return sorted(file_infos + squashed_infos, key=lambda x:x["id"])
+
+_file_infos_cache = {}
+_file_infos_cache_lock = threading.Lock()
+
+def get_migration_file_infos(config):
+
+    # 実行中はスキャン結果を使い回す（複数 DB に適用する場合もスキャンは１回）
+    key = str(get_migration_dir(config))
+    with _file_infos_cache_lock:
+        result = _file_infos_cache.get(key, None)
+        if ( result is not None ): return result
+
+        manifest = get_manifest(config)
+
+        file_infos = scan_migration_file_infos(config, manifest)
+        result = merge_migration_file_infos(file_infos)
+        result = add_squashed_migration_infos(result)
+
+        manifest.prune([ x["file"].name for x in file_infos ])
+        manifest.save()
+
+        _file_infos_cache[key] = result
+        return result
+
+def clear_migration_file_cache(config, is_rehash=False):
+    with _file_infos_cache_lock:
+        _file_infos_cache.pop(str(get_migration_dir(config)), None)
+    if ( is_rehash ): get_manifest(config).clear()
+
+def check_manifest(config):
+
+    # キャッシュ経由の結果と、全ファイルを読み直した結果を比較
+    manifest = get_manifest(config)
+    cached = { x["file"].name: x for x in scan_migration_file_infos(config, manifest) }
+    manifest.save()
+
+    mismatches = []
+    for path in get_migration_files(config):
+        file_info = get_migration_file_info(path)
+        cached_hash = cached.get(path.name, {}).get("hash", None)
+        if ( cached_hash != file_info["hash"] ):
+            mismatches.append({
+                "file"    : path.name,
+                "manifest": cached_hash,
+                "actual"  : file_info["hash"],
+            })
+
+    return mismatches
+
+def open_sql_file(path):
+    # SSMS などが出力する UTF-16 (BOM 付き) にも対応
+    with open(path, "rb") as f:
+        bom = f.read(2)
+    encoding = "utf-16" if bom in (b"\xff\xfe", b"\xfe\xff") else "utf-8-sig"
+    return open(path, "r", encoding=encoding, newline="")
+
+SQL_GO_PATTERN = re.compile(r"^\s*GO(?:\s+(\d+))?\s*(?:--.*)?$", re.IGNORECASE)
+SQL_TOKEN_PATTERN = re.compile(r"'|\"|\[|--|/\*")
+SQL_COMMENT_PATTERN = re.compile(r"/\*|\*/")
+SQL_CLOSE_CHARS = { "'": "'", '"': '"', "[": "]" }
+
+def split_sql_batches(lines):
+
+    # 行単位で読み進め、文字列・識別子・コメントの外にある `GO [count]` 行でバッチを区切る
+    batch = []
+    state = None
+    depth = 0
+    for line in lines:
+        if ( state is None ):
+            matched = SQL_GO_PATTERN.match(line)
+            if ( matched ):
+                sql = "".join(batch).strip()
+                batch = []
+                if ( len(sql) > 0 ):
+                    for _ in range(0, int(matched.group(1) or 1)):
+                        yield sql
+                continue
+
+        batch.append(line)
+
+        pos = 0
+        while True:
+            if ( state is None ):
+                matched = SQL_TOKEN_PATTERN.search(line, pos)
+                if ( not matched ): break
+                pos = matched.end()
+                token = matched.group(0)
+                if ( token == "--" ): break
+                state = token
+                depth = 1
+
+            elif ( state == "/*" ):
+                # ブロックコメントは入れ子可
+                matched = SQL_COMMENT_PATTERN.search(line, pos)
+                if ( not matched ): break
+                pos = matched.end()
+                depth += 1 if matched.group(0) == "/*" else -1
+                if ( depth == 0 ): state = None
+
+            else:
+                close_char = SQL_CLOSE_CHARS[state]
+                pos = line.find(close_char, pos)
+                if ( pos < 0 ): break
+                pos += 1
+                # 閉じ文字の連続はエスケープ（'' / "" / ]]）
+                if ( line.startswith(close_char, pos) ):
+                    pos += 1
+                    continue
+                state = None
+
+    sql = "".join(batch).strip()
+    if ( len(sql) > 0 ):
+        yield sql
+
+def read_sql_batches(path):
+    with open_sql_file(path) as f:
+        yield from split_sql_batches(f)
+
+def summarize_sql(sql):
+    lines = [ x.strip() for x in sql.splitlines() if x.strip() != "" ]
+    head = lines[0] if len(lines) > 0 else ""
+    if ( len(lines) > 1 or len(head) > SQL_LOG_MAX_LENGTH ):
+        head = head[0:SQL_LOG_MAX_LENGTH] + " ..."
+    return f"{head} ({len(sql):,} chars)"
+
+def log_sql_batches(batches, is_silent):
+    for i, sql in enumerate(batches, start=1):
+        log_info(f"-- batch {i}: {summarize_sql(sql)}", is_silent)
+        yield sql
+
+def get_coalesce_size(config, value=None):
+
+    # COALESCE（マイグレーションごと）> MSSQL_MIGRATE_COALESCE（全体）
+    #   True: MSSQL_MIGRATE_COALESCE_MAX_SIZE 文字までまとめる / 数値: その文字数までまとめる / False: まとめない
+    if ( value is None ): value = getattr(config, "MSSQL_MIGRATE_COALESCE", False)
+    if ( isinstance(value, str) ):
+        value = value.strip().lower()
+        value = int(value) if value.isdigit() else ( value in ["true", "yes", "on"] )
+    if ( value is True ): return int(getattr(config, "MSSQL_MIGRATE_COALESCE_MAX_SIZE", DEFAULT_COALESCE_MAX_SIZE))
+    if ( not value ): return 0
+    return int(value)
+
+def coalesce_sql_statements(sqls, max_size):
+
+    # 連続するステートメントを max_size 文字まで [(番号, SQL), ...] にまとめる（番号は 1 から）
+    statements, size = [], 0
+    for i, sql in enumerate(sqls, start=1):
+        if ( len(sql.strip()) == 0 ): continue
+
+        is_standalone = ( COALESCE_STANDALONE_PATTERN.match(sql) is not None or COALESCE_DECLARE_PATTERN.search(sql) is not None )
+        if ( len(statements) > 0 and ( is_standalone or size + len(sql) > max_size ) ):
+            yield statements
+            statements, size = [], 0
+
+        statements.append((i, sql))
+        size += len(sql)
+        if ( is_standalone or COALESCE_SCHEMA_CHANGE_PATTERN.search(sql) is not None ):
+            yield statements
+            statements, size = [], 0
+
+    if ( len(statements) > 0 ):
+        yield statements
+
+def build_coalesced_batch(statements):
+
+    # 実行中のステートメント番号を変数に持ち、失敗時は番号付きのエラーにして投げ直す
+    # 影響行数はステートメントごとに合計し、最後に SELECT で返す
+    lines = []
+    lines.append("SET NOCOUNT ON;")
+    lines.append(f"DECLARE {COALESCE_SEQ_VAR} int = 0, {COALESCE_ROWS_VAR} bigint = 0;")
+    lines.append("BEGIN TRY")
+    for i, sql in statements:
+        sql = sql.rstrip()
+        lines.append(f"SET {COALESCE_SEQ_VAR} = {i};")
+        lines.append(sql)
+        lines.append(f"{'' if sql.endswith(';') else ';'}SET {COALESCE_ROWS_VAR} = {COALESCE_ROWS_VAR} + @@ROWCOUNT;")
+    lines.append("END TRY")
+    lines.append("BEGIN CATCH")
+    lines.append("SET NOCOUNT OFF;")
+    lines.append(f"DECLARE @mssql_migrate_error nvarchar(2048) = CONCAT(N'mssql-migrate statement ', {COALESCE_SEQ_VAR}, N': Msg ', ERROR_NUMBER(), N', ', ERROR_MESSAGE());")
+    lines.append(f"THROW {COALESCE_ERROR_NUMBER}, @mssql_migrate_error, 1;")
+    lines.append("END CATCH")
+    lines.append("SET NOCOUNT OFF;")
+    lines.append(f"SELECT {COALESCE_ROWS_VAR};")
+    return "\n".join(lines)
+
+def fetch_coalesced_row_count(cursor, messages=None):
+
+    # マイグレーション SQL が結果セットを返す場合もあるため、最後の結果セット（影響行数）まで読み進める
+    # messages を渡すと、途中の情報メッセージ（SET STATISTICS IO / TIME など）を追加する
+    row_count = None
+    while True:
+        if ( messages is not None ): messages.extend([ x[1] for x in (getattr(cursor, "messages", None) or []) ])
+        if ( cursor.description is not None ):
+            rows = cursor.fetchall()
+            if ( len(rows) > 0 ): row_count = rows[-1][0]
+        if ( not cursor.nextset() ): break
+    return row_count
+
+def summarize_coalesced_statements(statements):
+    if ( len(statements) == 1 ): return summarize_sql(statements[0][1])
+    return f"[{statements[0][0]}-{statements[-1][0]}] {summarize_sql(statements[0][1])}"
+
+def get_failed_statement_message(err, statements):
+
+    # 番号付きのエラーから、失敗した元のステートメントを求める
+    # 番号が無い場合（コンパイルエラーなど TRY ... CATCH で捕捉できないもの）は、まとめた範囲を表示
+    if ( len(statements) == 0 ): return "failed before sending statements."
+    m = COALESCE_ERROR_PATTERN.search(str(err))
+    failed = [ x for x in statements if m and x[0] == int(m.group(1)) ]
+    if ( len(statements) == 1 or len(failed) > 0 ):
+        i, sql = ( failed or statements )[0]
+        return f"statement {i} failed: {summarize_sql(sql)}"
+    return f"one of the statements {statements[0][0]}-{statements[-1][0]} failed (sent as one batch)."
+
+def count_round_trips(sqls, coalesce_size):
+    # dry-run 用。ステートメント数と送信回数
+    if ( coalesce_size > 0 ):
+        groups = list(coalesce_sql_statements(sqls, coalesce_size))
+        return sum([ len(x) for x in groups ]), len(groups)
+    count = len([ x for x in sqls if len(x.strip()) > 0 ])
+    return count, count
+
+
+SQL_DIRECTIVE_PATTERN = re.compile(r"^--\s*(DEPENDS_ON|PARALLEL_GROUP|COALESCE|LOCK_TIMEOUT|BASELINE)\s*:\s*(.*?)\s*$", re.IGNORECASE)
+SQL_LIST_DIRECTIVES=["BASELINE"]
+
+def read_sql_directives(path):
+    # .sql はファイル先頭のコメント行で DEPENDS_ON / PARALLEL_GROUP / COALESCE / LOCK_TIMEOUT を指定する
+    # BASELINE は複数行をリストで返す
+    directives = {}
+    with open_sql_file(path) as f:
+        for line in f:
+            line = line.strip()
+            if ( line == "" ): continue
+            if ( not line.startswith("--") ): break
+
+            m = SQL_DIRECTIVE_PATTERN.match(line)
+            if ( not m ): continue
+            key = m.group(1).upper()
+            if ( key in SQL_LIST_DIRECTIVES ):
+                directives.setdefault(key, []).append(m.group(2))
+            else:
+                directives[key] = m.group(2)
+    return directives
+
+def is_schema_exists(config, schema_name):
+    return generate_dbm(config).catalog.is_schema_exists(schema_name)
+
+def is_table_exists(config, table_name):
+    return generate_dbm(config).catalog.is_object_exists(table_name)
+
+def create_schemas(config, is_dry_run, is_silent):
+
+    # 存在確認は作成前にまとめて行う（作成のたびにスナップショットを再取得しない）
+    schema_names = [ x for x in config.MSSQL_MIGRATE_SCHEMA if not is_schema_exists(config, x) ]
+    for schema_name in schema_names:
+        ret = create_schema(config, schema_name, is_dry_run, is_silent)
+        if ( not ret ): return False
+
+    return True
+
+def create_schema(config, schema_name, is_dry_run, is_silent):
+    if ( is_dry_run ): is_silent = False
+
+    dry_run_caption = " (dry-run)" if is_dry_run else ""
+    log_info(f"\n[create schema{dry_run_caption}] `{schema_name}`", is_silent)
+    if ( is_dry_run ): return True
+
+    dbm =  generate_dbm(config)
+    # ret = dbm.execute(f"""
+    #     EXEC('CREATE SCHEMA {schema_name}')
+    # """)
+    ret = dbm.execute(f"""
+        CREATE SCHEMA [{schema_name}]
+    """)
+    dbm.catalog.invalidate()
+    return ret
+
+def get_migrate_detail_table(config):
+    return getattr(config, "MSSQL_MIGRATE_DETAIL_TABLE", config.MSSQL_MIGRATE_TABLE + MIGRATE_DETAIL_TABLE_SUFFIX)
+
+def create_migrate_table(config, is_dry_run, is_silent):
+    if ( is_dry_run ): is_silent = False
+
+    tables = [
+        ( config.MSSQL_MIGRATE_TABLE,       MIGRATE_TABLE_COLUMNS,        "id" ),
+        ( get_migrate_detail_table(config), MIGRATE_DETAIL_TABLE_COLUMNS, "id, seq" ),
+    ]
+    for table_name, table_columns, primary_key in tables:
+        # 既存のテーブルには、後から追加されたカラムを追加する
+        if ( is_table_exists(config, table_name) ):
+            ret = add_migrate_table_columns(config, table_name, table_columns, is_dry_run, is_silent)
+            if ( not ret ): return False
+            continue
+
+        dry_run_caption = " (dry-run)" if is_dry_run else ""
+        log_info(f"\n[create table{dry_run_caption}] `{table_name}`", is_silent)
+        if ( is_dry_run ): continue
+
+        columns = ", ".join([ "[" + x.get("name") + "] " + x.get("type") for x in table_columns])
+        sql = f"""
+            CREATE TABLE {table_name}
+            (
+                {columns}
+                , CONSTRAINT PK_{table_name.replace(".", "_")} PRIMARY KEY CLUSTERED ({primary_key})
+            )
+        """
+        dbm = generate_dbm(config)
+        ret = dbm.execute(sql)
+        dbm.catalog.invalidate()
+        if ( not ret ): return False
+
+    return True
+
+def add_migrate_table_columns(config, table_name, table_columns, is_dry_run, is_silent):
+    dbm = generate_dbm(config)
+    ret = dbm.query("""
+        SELECT columns.name
+        FROM sys.columns columns
+        WHERE columns.object_id = OBJECT_ID(?)
+    """, [table_name])
+    if ( ret is None ): return False
+
+    exists = set([ r[0].casefold() for r in ret.Records ])
+    columns = [ x for x in table_columns if x.get("name").casefold() not in exists ]
+    if ( len(columns) == 0 ): return True
+
+    dry_run_caption = " (dry-run)" if is_dry_run else ""
+    log_info(f"\n[alter table{dry_run_caption}] `{table_name}` add " + ", ".join([ x.get("name") for x in columns ]), is_silent)
+    if ( is_dry_run ): return True
+
+    columns = ", ".join([ "[" + x.get("name") + "] " + x.get("type") for x in columns])
+    return dbm.execute(f"ALTER TABLE {table_name} ADD {columns}")
+
+def merge_migration_info(row, file_info):
+    info = { **(row or {}), **(file_info or {}) }
+    if ( info.get("hash", None) ):
+        info["hash_short"] = info["hash"][0:HASH_SHORT_LENGTH] + "..."
+    # 管理テーブルに記録されたハッシュ（ファイルのハッシュで上書きされるため別に保持）
+    if ( row is not None and row.get("hash", None) ):
+        info["applied_hash"] = row["hash"]
+        info["applied_hash_short"] = row["hash"][0:HASH_SHORT_LENGTH] + "..."
+    if ( info.get("duration_ms", None) is not None ):
+        info["duration"] = format_duration(info["duration_ms"])
+    return info
+
+def format_duration(duration_ms):
+    return f"{duration_ms / 1000:,.3f}s"
+
+def get_migrate_status(config):
+
+    # マイグレーションファイル一覧を取得
+    files = get_migration_file_infos(config)
+
+    # 管理テーブルのデータを id 順に読み込みながら、ファイルと突き合わせて１件ずつ返す
+    # （管理テーブル全体をメモリに載せない。読み込みに失敗した場合は None）
+    rows = iter_migrate_rows(config)
+    if ( rows is None ): return None
+    return ( merge_migration_info(row, file_info) for row, file_info in merge_migrate_rows(rows, files) )
+
+def iter_migrate_rows(config):
+
+    # 管理テーブルの行を id 順に dict で１件ずつ返す（テーブルが無い場合は空）
+    if ( not is_table_exists(config, config.MSSQL_MIGRATE_TABLE) ): return iter([])
+
+    # ファイルの id と同じ順序で突き合わせるため、バイナリ順で並べる
+    ret = generate_dbm(config).iter_query(f"""
+        SELECT *
+        FROM {config.MSSQL_MIGRATE_TABLE}
+        ORDER BY
+                id COLLATE Latin1_General_BIN2 ASC
+    """)
+    if ( ret is None ): return None
+    return ( dict(zip(ret.Columns, r)) for r in ret.Records )
+
+def merge_migrate_rows(rows, files):
+
+    # 管理テーブルの行・ファイルをそれぞれ id 順に読み進め、同じ id のものを組にして返す
+    rows  = iter(rows)
+    files = iter(sorted(files, key=lambda x:x["id"]))
+    row, file_info = next(rows, None), next(files, None)
+    while ( row is not None or file_info is not None ):
+        if ( file_info is None or ( row is not None and row["id"] < file_info["id"] ) ):
+            yield row, None
+            row = next(rows, None)
+        elif ( row is None or file_info["id"] < row["id"] ):
+            yield None, file_info
+            file_info = next(files, None)
+        else:
+            yield row, file_info
+            row, file_info = next(rows, None), next(files, None)
+
+def get_migrate_state(row, file_info):
+    if ( file_info is None ): return MIGRATE_STATE_ORPHANED
+    if ( row is None or row.get("applied_date", None) is None ): return MIGRATE_STATE_PENDING
+    if ( (row.get("hash", None) or "") != (file_info.get("hash", None) or "") ): return MIGRATE_STATE_DRIFTED
+    return MIGRATE_STATE_APPLIED
+
+def is_server_filter_available(config):
+    # MSSQL_MIGRATE_SERVER_FILTER = False でサーバー側での絞り込みを無効化
+    if ( not getattr(config, "MSSQL_MIGRATE_SERVER_FILTER", True) ): return False
+    if ( not is_table_exists(config, config.MSSQL_MIGRATE_TABLE) ): return False
+    return ( generate_dbm(config).catalog.get_compatibility_level() >= OPENJSON_COMPATIBILITY_LEVEL )
+
+def query_migrate_state(config, files, select_sql, where_sql=""):
+
+    # ローカルのファイル id・ハッシュを JSON で渡し、サーバー側で管理テーブルと突き合わせる
+    # OPENJSON の列と管理テーブルの列の照合順序が異なる DB でも比較できるよう、照合順序を揃える
+    local_files = json.dumps([ { "id": x["id"], "hash": x["hash"] } for x in files ])
+    sql = f"""
+        SELECT {select_sql}
+        FROM (
+            SELECT
+                    CASE
+                        WHEN local_files.id IS NULL THEN '{MIGRATE_STATE_ORPHANED}'
+                        WHEN migrate.id IS NULL OR migrate.applied_date IS NULL THEN '{MIGRATE_STATE_PENDING}'
+                        WHEN ISNULL(migrate.hash, N'') COLLATE DATABASE_DEFAULT <> ISNULL(local_files.hash, N'') COLLATE DATABASE_DEFAULT THEN '{MIGRATE_STATE_DRIFTED}'
+                        ELSE '{MIGRATE_STATE_APPLIED}'
+                    END AS state
+                ,   local_files.id AS local_id
+                ,   migrate.*
+            FROM OPENJSON(?) WITH ( id nvarchar(20) '$.id', hash nvarchar(64) '$.hash' ) local_files
+                FULL OUTER JOIN {config.MSSQL_MIGRATE_TABLE} migrate
+                    ON  migrate.id COLLATE DATABASE_DEFAULT = local_files.id COLLATE DATABASE_DEFAULT
+        ) migrate_state
+        {where_sql}
+    """
+    return generate_dbm(config).query(sql, [local_files])
+
+def get_pending_migrations(config):
+
+    # 未適用・ハッシュ不一致・ファイル無しのマイグレーションのみ取得
+    files = get_migration_file_infos(config)
+    files_by_id = { x["id"]:x for x in files }
+
+    if ( not is_server_filter_available(config) ):
+        status = get_migrate_status_rows(config, files)
+        if ( status is None ): return None
+        return [ x for x in status if x["state"] != MIGRATE_STATE_APPLIED ]
+
+    ret = query_migrate_state(config, files, "*", f"WHERE state <> '{MIGRATE_STATE_APPLIED}'")
+    if ( ret is None ): return None
+
+    result = []
+    for record in ret.Records:
+        row = dict(zip(ret.Columns, record))
+        state = row.pop("state")
+        local_id = row.pop("local_id")
+        if ( row.get("id", None) is None ): row = None
+
+        id = local_id if local_id is not None else row["id"]
+        info = merge_migration_info(row, files_by_id.get(id, None))
+        info["state"] = state
+        result.append(info)
+
+    return sorted(result, key=lambda x:x['id'])
+
+def get_migrate_summary(config):
+
+    # 状態ごとの件数のみ取得
+    files = get_migration_file_infos(config)
+    summary = { x:0 for x in MIGRATE_STATES }
+
+    if ( not is_server_filter_available(config) ):
+        status = get_migrate_status_rows(config, files)
+        if ( status is None ): return None
+        for info in status:
+            summary[info["state"]] += 1
+        return summary
+
+    ret = query_migrate_state(config, files, "state, COUNT(*)", "GROUP BY state")
+    if ( ret is None ): return None
+
+    for state, count in ret.Records:
+        summary[state] = count
+    return summary
+
+def get_migrate_status_rows(config, files):
+
+    # サーバー側で絞り込めない場合は、管理テーブルを id 順に読み込みながら突き合わせる
+    rows = iter_migrate_rows(config)
+    if ( rows is None ): return None
+    return ( { **merge_migration_info(row, file_info), "state": get_migrate_state(row, file_info) } for row, file_info in merge_migrate_rows(rows, files) )
+
+def get_applied_migrations(config, limit=0):
+
+    # 適用済みのマイグレーションを新しい順に取得（limit > 0 の場合はその件数のみ）
+    if ( not is_table_exists(config, config.MSSQL_MIGRATE_TABLE) ): return []
+
+    top_sql = f"TOP ({int(limit)})" if limit > 0 else ""
+    ret = generate_dbm(config).query(f"""
+        SELECT {top_sql} *
+        FROM {config.MSSQL_MIGRATE_TABLE}
+        WHERE applied_date IS NOT NULL
+        ORDER BY
+                id DESC
+    """)
+    if ( ret is None ): return None
+
+    files_by_id = { x["id"]:x for x in get_migration_file_infos(config) }
+    result = []
+    for record in ret.Records:
+        row = dict(zip(ret.Columns, record))
+        result.append(merge_migration_info(row, files_by_id.get(row["id"], None)))
+
+    return result
+
+def apply_migration(config, migration_info, ip_down, is_dry_run, is_silent, transaction=TRANSACTION_PER_MIGRATION):
+    if ( is_dry_run ): is_silent = False
+
+    dbm = generate_dbm(config)
+
+    # print command
+    dry_run_caption = " (dry-run)" if is_dry_run else ""
+    operation_type  = "down" if ip_down else "up"
+
+    log_info(f"\n[migrate {operation_type}{dry_run_caption}] id=`{migration_info.get('id')}`", is_silent)
+
+    # ロック用の接続が切れた場合は、他のノードが適用を始めている可能性があるため中断
+    if ( is_migration_lock_lost(config) ):
+        log_error("the migration lock has been lost. stopped applying migrations.")
+        return False
+
+    # ベースラインにまとめたマイグレーションは、元ファイルを戻さない限り個別に実行できない
+    if ( migration_info.get("type", None) == MIGRATION_TYPE_SQUASHED ):
+        log_error(f"`{migration_info.get('id')}` is squashed into the baseline `{migration_info.get('baseline')}`. restore the file from the squashed directory to migrate it individually.")
+        return False
+    if ( ip_down and is_baseline_info(migration_info) ):
+        log_error(f"baseline `{migration_info.get('id')}` cannot be rolled back.")
+        return False
+
+    # get migration sql
+    path = migration_info.get("file", None)
+    if ( migration_info.get("type", None) == MIGRATION_TYPE_SQL ):
+        path = migration_info.get("file_down" if ip_down else "file_up", None)
+    if ( path is None and migration_info.get("type", None) != MIGRATION_TYPE_SQL ):
+        log_error(f"migration-file is not exists.")
+        return False
+
+    if ( path is not None ):
+        log_info(f"@ {get_display_path(path)}", is_silent)
+
+        if ( not path.is_file() ):
+            log_error(f"`{get_display_path(path)}` is not exists.")
+            return False
+
+    if ( migration_info.get("type", None) == MIGRATION_TYPE_SQL ):
+        # .sql はファイル全体を読み込まず、バッチ単位で読み込み・実行する
+        directives     = read_sql_directives(path) if path is not None else {}
+        get_sqls       = lambda: log_sql_batches(read_sql_batches(path), is_silent) if path is not None else []
+        migrate_bulks  = []
+        migrate_chunks = []
+        coalesce_size  = get_coalesce_size(config, directives.get("COALESCE", None))
+        lock_timeout   = get_lock_timeout(config, directives.get("LOCK_TIMEOUT", None))
+
+        if ( migration_info.get("is_record_only", False) ):
+            log_info("[baseline] squashed migrations are already applied. records the baseline only.", is_silent)
+            get_sqls = lambda: []
+        elif ( len(migration_info.get("squashed_infos", [])) > 0 ):
+            log_info(f"[baseline] records {len(migration_info['squashed_infos']):,} squashed migrations as applied.", is_silent)
+    else:
+        migration_vars = load_migration_vars(config, migration_info)
+        migrate_sqls   = get_migration_sqls(migration_vars, ip_down)
+        get_sqls       = lambda: migrate_sqls
+        migrate_bulks  = get_migration_bulks(config, migration_vars, path, ip_down)
+        migrate_chunks = get_migration_chunks(config, migration_vars, ip_down)
+        coalesce_size  = get_coalesce_size(config, getattr(migration_vars, "COALESCE", None))
+        lock_timeout   = get_lock_timeout(config, getattr(migration_vars, "LOCK_TIMEOUT", None))
+
+        log_info("```", is_silent)
+        for sql in migrate_sqls:
+            log_info(sql, is_silent)
+        log_info("```", is_silent)
+        for bulk in migrate_bulks:
+            log_info(f"[bulk] {bulk['sql']}", is_silent)
+            log_info(f"  <- {bulk['source']} (chunk_size={bulk['chunk_size']})", is_silent)
+        for chunk in migrate_chunks:
+            log_info(f"[chunk] {chunk['sql']}", is_silent)
+            if ( chunk["range"] is not None ):
+                log_info(f"  range={chunk['range']} (chunk_size={chunk['chunk_size']}, sleep={chunk['sleep']})", is_silent)
+            else:
+                log_info(f"  until no rows are affected (sleep={chunk['sleep']})", is_silent)
+
+    if ( coalesce_size > 0 ):
+        log_info(f"[coalesce] up to {coalesce_size:,} chars per round trip", is_silent)
+    if ( lock_timeout is not None ):
+        log_info(f"[lock_timeout] {lock_timeout:,}ms", is_silent)
+    migration_info["lock_timeout"] = lock_timeout
+
+    # exit process if dry-run
+    if ( is_dry_run ):
+        statement_count, round_trips = count_round_trips(get_sqls(), coalesce_size)
+        log_info(f"[round trips] {statement_count:,} statements in {round_trips:,} round trips", is_silent)
+        return True
+
+    # 分割実行はバッチごとにコミットするため、トランザクションの指定に関わらず別処理
+    if ( len(migrate_chunks) > 0 ):
+        if ( transaction == TRANSACTION_ALL or dbm.in_transaction() ):
+            log_error(f"chunked migration cannot be applied with `--transaction={TRANSACTION_ALL}`.")
+            return False
+        def run_chunked():
+            with track_progress(config, migration_info, ip_down, is_silent):
+                ret = execute_chunked_migration(config, migration_info, get_sqls(), migrate_bulks, migrate_chunks, ip_down, is_silent)
+            dbm.catalog.invalidate()
+            return ret
+        return run_migration_with_retry(config, migration_info, ip_down, run_chunked, is_silent)
+
+    def run(migrate_sqls, lock_timeout=None):
+        with track_progress(config, migration_info, ip_down, is_silent):
+            ret = execute_migration(config, migration_info, migrate_sqls, migrate_bulks, ip_down, is_silent, coalesce_size, lock_timeout)
+        if ( ret and len(migration_info.get("squashed_infos", [])) > 0 ):
+            ret = record_squashed_migrations(config, migration_info["squashed_infos"], migration_info.get("is_chain_deferred", False))
+
+        # マイグレーション SQL に DDL が含まれる可能性があるため
+        dbm.catalog.invalidate()
+        return ret
+
+    # per-migration: 管理テーブルの更新とマイグレーション SQL を１トランザクションでコミット
+    # デッドロック・ロックタイムアウト・接続断などで失敗した場合は、ロールバックしてマイグレーションごと再実行
+    is_own_transaction = ( transaction == TRANSACTION_PER_MIGRATION and not dbm.in_transaction() )
+    if ( is_own_transaction ):
+        return run_migration_with_retry(config, migration_info, ip_down, lambda: run_transaction(dbm, lambda: run(get_sqls()), lock_timeout), is_silent)
+
+    # all / none: 再実行すると他のマイグレーション・コミット済みの SQL に影響するため再試行しない
+    # LOCK_TIMEOUT はマイグレーション SQL の前後で設定・解除する
+    # （none は SQL を実行する接続に設定し、失敗した場合も既定に戻してからプールに戻す）
+    migrate_sqls = get_sqls()
+    if ( lock_timeout is None ):
+        return run(migrate_sqls)
+    if ( not dbm.in_transaction() ):
+        return run(migrate_sqls, lock_timeout)
+
+    if ( not dbm.set_lock_timeout(lock_timeout) ): return False
+    ret = run(migrate_sqls)
+    return dbm.set_lock_timeout(None) and ret
+
+def get_lock_timeout(config, value=None):
+    # LOCK_TIMEOUT（マイグレーションごと）> MSSQL_MIGRATE_SQL_LOCK_TIMEOUT（全体）。ミリ秒、None は既定（無制限）
+    if ( value is None ): value = getattr(config, "MSSQL_MIGRATE_SQL_LOCK_TIMEOUT", None)
+    if ( value is None or str(value).strip() == "" ): return None
+    return int(value)
+
+def get_retry_policy(config):
+    return {
+        "max_retries": int(getattr(config, "MSSQL_MIGRATE_RETRY_MAX", DEFAULT_RETRY_MAX)),
+        "delay"      : float(getattr(config, "MSSQL_MIGRATE_RETRY_DELAY", DEFAULT_RETRY_DELAY)),
+        "max_delay"  : float(getattr(config, "MSSQL_MIGRATE_RETRY_MAX_DELAY", DEFAULT_RETRY_MAX_DELAY)),
+        "sqlstates"  : set([ str(x) for x in getattr(config, "MSSQL_MIGRATE_RETRY_SQLSTATES", RETRY_SQLSTATES) ]),
+        "errors"     : set([ int(x) for x in getattr(config, "MSSQL_MIGRATE_RETRY_ERRORS", RETRY_ERROR_NUMBERS) ]),
+    }
+
+def get_error_numbers(err):
+    message = " ".join([ str(x) for x in err.args ])
+    return [ int(a or b) for a, b in SQL_ERROR_NUMBER_PATTERN.findall(message) ]
+
+def is_retryable_error(policy, err):
+    if ( err is None ): return False
+    sqlstate = str(err.args[0]) if len(err.args) > 0 else ""
+    if ( sqlstate in policy["sqlstates"] ): return True
+    return any([ x in policy["errors"] for x in get_error_numbers(err) ])
+
+def get_retry_delay(policy, attempt):
+    # 指数バックオフ（上限 max_delay）。同時に失敗したノードが揃って再実行しないよう、半分〜全体の範囲でずらす
+    delay = min(policy["max_delay"], policy["delay"] * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def run_with_retry(config, func, is_silent, before_retry=None):
+
+    # func() が再試行できるエラーで失敗した場合は、待ってから再実行する
+    # before_retry() は再実行の前に呼ぶ（None: 失敗 / True: 再実行せず成功 / False: 再実行）
+    policy = get_retry_policy(config)
+    dbm = generate_dbm(config)
+    attempt = 0
+    while True:
+        dbm.clear_last_error()
+        if ( func() ): return True
+
+        err = dbm.get_last_error()
+        if ( attempt >= policy["max_retries"] or not is_retryable_error(policy, err) ): return False
+
+        delay = get_retry_delay(policy, attempt)
+        attempt += 1
+        log_info(f"[retry] {attempt}/{policy['max_retries']} in {delay:.1f}s (SQLSTATE={err.args[0]}, error={get_error_numbers(err)})", is_silent)
+        dbm.add_retry(delay)
+        time.sleep(delay)
+
+        if ( before_retry is not None ):
+            ret = before_retry()
+            if ( ret is None ): return False
+            if ( ret ): return True
+
+def run_migration_with_retry(config, migration_info, ip_down, func, is_silent):
+
+    # コミットの応答のみ失われた場合に二重に適用しないよう、再実行の前に管理テーブルを確認する
+    # 分割実行の場合は、コミット済みの checkpoint から再開する
+    def before_retry():
+        row = query_migrate_row(config, migration_info.get("id"))
+        if ( row is None ): return None
+
+        if ( is_migration_committed(row, migration_info, ip_down) ):
+            log_info("[retry] the previous attempt has been committed.", is_silent)
+            return True
+        migration_info["checkpoint"] = row.get("checkpoint", None)
+        return False
+
+    return run_with_retry(config, func, is_silent, before_retry)
+
+def query_migrate_row(config, id):
+    # 管理テーブルの１件（無い場合は {}、エラーの場合は None）
+    ret = generate_dbm(config).query(f"SELECT * FROM {config.MSSQL_MIGRATE_TABLE} WHERE id = ?", [id])
+    if ( ret is None ): return None
+    return dict(zip(ret.Columns, ret.Records[0])) if len(ret.Records) > 0 else {}
+
+def is_migration_committed(row, migration_info, ip_down):
+    # down は適用後にファイルが変更されている場合もあるため、ハッシュは比較せず管理テーブルから消えたかのみで判定
+    if ( ip_down ): return ( row.get("applied_date", None) is None )
+    return ( row.get("applied_date", None) is not None and row.get("hash", None) == migration_info.get("hash", None) )
+
+def record_squashed_migrations(config, squashed_infos, is_chain_deferred=False):
+
+    # 新規 DB にベースラインを適用した場合は、まとめたマイグレーションも同じトランザクションで適用済みにする
+    migrate_table_name  = config.MSSQL_MIGRATE_TABLE
+    user_name           = config.MSSQL_MIGRATE_DB_USER
+    dbm                 = generate_dbm(config)
+
+    ids = ", ".join([ f"'{x['id']}'" for x in squashed_infos ])
+    ret = dbm.execute(f"DELETE FROM {migrate_table_name} WHERE id IN ({ids});")
+    if ( not ret ): return False
+
+    rows = [ [x["id"], x["name"], x["size"], x["hash"], user_name] for x in squashed_infos ]
+    count = dbm.execute_many(f"""
+        INSERT INTO {migrate_table_name} (id, name, size, hash, applied_date, applied_user)
+        VALUES (?, ?, ?, ?, SYSDATETIMEOFFSET(), ?)
+    """, rows)
+    if ( count is None ): return False
+    if ( is_chain_deferred ): return True
+
+    return update_migrate_chain(config, min([ x["id"] for x in squashed_infos ]))
+
+def resolve_baselines(migrate_status):
+
+    # ベースラインにまとめたマイグレーションの適用方法を、まとめた範囲の状態で決める
+    #   全て未適用（新規 DB）: ベースラインを実行し、まとめたマイグレーションも適用済みとして記録
+    #   全て適用済み（既存 DB）: ベースラインの SQL は実行せず、適用済みとして記録のみ
+    #   一部のみ適用済み     : 元ファイルを squashed ディレクトリから戻して適用する必要があるためエラー
+    pending_squashed = {}
+    for info in migrate_status:
+        if ( info.get("type", None) != MIGRATION_TYPE_SQUASHED or info.get("applied_date", None) is not None ): continue
+        pending_squashed.setdefault(info["baseline"], []).append(info)
+
+    result = []
+    for info in migrate_status:
+        if ( info.get("type", None) == MIGRATION_TYPE_SQUASHED ): continue
+
+        if ( is_baseline_info(info) and info.get("applied_date", None) is None ):
+            squashed_infos = pending_squashed.pop(info["id"], [])
+            if ( len(squashed_infos) == len(info["squashed"]) ):
+                info["squashed_infos"] = squashed_infos
+            elif ( len(squashed_infos) == 0 ):
+                info["is_record_only"] = True
+            else:
+                log_error(f"baseline `{info['id']}` cannot be applied. {len(squashed_infos):,} of {len(info['squashed']):,} squashed migrations are not applied: `{squashed_infos[0]['id']}`, ...")
+                return None
+
+        result.append(info)
+
+    # 適用済みのベースラインにまとめたマイグレーションが未適用
+    for baseline_id, squashed_infos in pending_squashed.items():
+        log_error(f"`{squashed_infos[0]['id']}` is squashed into the applied baseline `{baseline_id}` but is not applied. restore the file from the squashed directory to apply it.")
+        return None
+
+    return result
+
+def get_migration_sqls(migration_vars, ip_down):
+    if ( ip_down ):
+        migrate_sqls = getattr(migration_vars, "SQL_DOWN", [])
+    else:
+        migrate_sqls = getattr(migration_vars, "SQL_UP", [])
+
+    if ( type(migrate_sqls) is str ): migrate_sqls = [migrate_sqls]
+    migrate_sqls = [ x.strip() for x in migrate_sqls ]
+
+    return migrate_sqls
+
+def get_migration_bulks(config, migration_vars, path, ip_down):
+    # BULK_UP / BULK_DOWN: パラメータ付き SQL と、その行データ（CSV ファイル or iterable）
+    if ( ip_down ):
+        bulks = getattr(migration_vars, "BULK_DOWN", [])
+    else:
+        bulks = getattr(migration_vars, "BULK_UP", [])
+
+    if ( isinstance(bulks, dict) ): bulks = [bulks]
+
+    default_chunk_size = int(getattr(config, "MSSQL_MIGRATE_BULK_CHUNK_SIZE", DEFAULT_BULK_CHUNK_SIZE))
+
+    result = []
+    for bulk in bulks:
+        if ( "csv" in bulk ):
+            # CSV ファイルのパスはマイグレーションファイルからの相対
+            csv_path = pathlib.Path(path).parent / bulk["csv"]
+            rows = ( lambda csv_path=csv_path, bulk=bulk: read_csv_rows(
+                csv_path,
+                encoding    = bulk.get("encoding", "utf-8-sig"),
+                delimiter   = bulk.get("delimiter", ","),
+                has_header  = bulk.get("header", True),
+                null        = bulk.get("null", ""),
+            ))
+            source = f"csv: {bulk['csv']}"
+        else:
+            # 関数（ジェネレータ）を指定した場合は実行時に呼び出す
+            rows = bulk["rows"]
+            rows = rows if callable(rows) else ( lambda rows=rows: rows )
+            source = "rows"
+
+        result.append({
+            "sql"       : bulk["sql"].strip(),
+            "rows"      : rows,
+            "source"    : source,
+            "chunk_size": int(bulk.get("chunk_size", default_chunk_size)),
+        })
+
+    return result
+
+def get_migration_chunks(config, migration_vars, ip_down):
+    # CHUNK_UP / CHUNK_DOWN: 小さなバッチに分けて繰り返し実行する SQL
+    if ( ip_down ):
+        chunks = getattr(migration_vars, "CHUNK_DOWN", [])
+    else:
+        chunks = getattr(migration_vars, "CHUNK_UP", [])
+
+    if ( isinstance(chunks, dict) ): chunks = [chunks]
+
+    default_chunk_size = int(getattr(config, "MSSQL_MIGRATE_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+    default_sleep      = float(getattr(config, "MSSQL_MIGRATE_CHUNK_SLEEP", 0))
+
+    result = []
+    for chunk in chunks:
+        result.append({
+            "sql"       : chunk["sql"].strip(),
+            "range"     : chunk.get("range", None),
+            "chunk_size": int(chunk.get("chunk_size", default_chunk_size)),
+            "sleep"     : float(chunk.get("sleep", default_sleep)),
+        })
+
+    return result
+
+def read_csv_rows(path, encoding="utf-8-sig", delimiter=",", has_header=True, null=""):
+    with open(path, "r", encoding=encoding, newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        if ( has_header ): next(reader, None)
+        for row in reader:
+            yield [ None if v == null else v for v in row ]
+
+def execute_bulk(config, bulk, is_silent, timings=None):
+    dbm = generate_dbm(config)
+
+    start = time.monotonic()
+    progress = { "time": start }
+
+    def log_progress(count):
+        now = time.monotonic()
+        if ( now - progress["time"] < BULK_PROGRESS_INTERVAL ): return
+        progress["time"] = now
+        log_info(f"  ... {count:,} rows ({count / (now - start):,.0f} rows/sec)", is_silent)
+
+    count = dbm.execute_many(bulk["sql"], bulk["rows"](), bulk["chunk_size"], log_progress)
+    if ( count is None ): return False
+
+    elapsed = time.monotonic() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    log_info(f"[bulk] {count:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec)", is_silent)
+    if ( timings is not None ):
+        timings.append({
+            "statement"  : summarize_sql(bulk["sql"]),
+            "duration_ms": int(elapsed * 1000),
+            "row_count"  : count,
+        })
+    return True
+
+def execute_migration(config, migration_info, migrate_sqls, migrate_bulks, ip_down, is_silent, coalesce_size=0, lock_timeout=None):
+
+    # prepare migrate state
+    if ( not ip_down ):
+        ret = insert_migrate_state(config, migration_info)
+        if ( not ret ): return False
+
+    # execute migration sql
+    timings = []
+    start = time.monotonic()
+    ret = execute_migration_sqls(config, migrate_sqls, migrate_bulks, ip_down, is_silent, timings, coalesce_size, lock_timeout)
+    if ( not ret ): return False
+
+    # update migrate state
+    # （plan で集計するため、ステートメントごとの実行時間・影響行数を残す）
+    migration_info["timings"] = timings
+    duration_ms = int((time.monotonic() - start) * 1000)
+    return update_migrate_state(config, migration_info, ip_down, timings, duration_ms, is_silent)
+
+def insert_migrate_state(config, migration_info):
+
+    migrate_table_name  = config.MSSQL_MIGRATE_TABLE
+    dbm                 = generate_dbm(config)
+
+    status_sql = f"""
+        DELETE FROM {migrate_table_name} WHERE id = '{migration_info.get('id')}';
+    """
+    ret = dbm.execute(status_sql)
+    if ( not ret ): return False
+
+    status_sql = f"""
+        INSERT INTO {migrate_table_name} (id, name, size, hash)
+        VALUES ('{migration_info.get('id')}', '{migration_info.get('name')}', {migration_info.get('size')},'{migration_info.get('hash')}');
+    """
+    return dbm.execute(status_sql)
+
+def execute_migration_sqls(config, migrate_sqls, migrate_bulks, ip_down, is_silent, timings, coalesce_size=0, lock_timeout=None):
+    dbm = generate_dbm(config)
+
+    # up: SQL -> bulk / down: bulk -> SQL
+    if ( not ip_down ):
+        ret = dbm.execute(migrate_sqls, timings, coalesce_size=coalesce_size, lock_timeout=lock_timeout)
+        if ( not ret ): return False
+
+    for bulk in migrate_bulks:
+        ret = execute_bulk(config, bulk, is_silent, timings)
+        if ( not ret ): return False
+
+    if ( ip_down ):
+        ret = dbm.execute(migrate_sqls, timings, coalesce_size=coalesce_size, lock_timeout=lock_timeout)
+        if ( not ret ): return False
+
+    return True
+
+def update_migrate_state(config, migration_info, ip_down, timings, duration_ms, is_silent):
+
+    migrate_table_name  = config.MSSQL_MIGRATE_TABLE
+    user_name           = config.MSSQL_MIGRATE_DB_USER
+    dbm                 = generate_dbm(config)
+
+    row_count = sum([ x["row_count"] for x in timings if x["row_count"] is not None ])
+    log_info(f"[time] {format_duration(duration_ms)} ({row_count:,} rows)", is_silent)
+
+    # 適用履歴の累積ハッシュ。末尾への追加の場合は、直前のマイグレーションから計算して同じ UPDATE で記録
+    # 並列実行の場合は、全て完了してからまとめて計算する（互いの未コミットの行を待ち合うため）
+    is_chain_deferred = migration_info.get("is_chain_deferred", False)
+    chain_hash = None
+    if ( not ip_down and not is_chain_deferred ):
+        ret = query_migrate_chain(config, migration_info.get("id"))
+        if ( ret is None ): return False
+        prev_chain_hash, rows = ret
+        if ( len(rows) == 0 ):
+            chain_hash = get_chain_hash(prev_chain_hash, migration_info.get("id"), migration_info.get("hash"))
+            is_chain_deferred = True
+
+    if ( ip_down ):
+        status_sql = f"""
+            UPDATE {migrate_table_name}
+            SET
+                    applied_date = null
+                ,   applied_user = null
+                ,   duration_ms  = null
+                ,   row_count    = null
+                ,   checkpoint   = null
+                ,   chain_hash   = null
+            WHERE
+                id = '{migration_info.get('id')}';
+        """
+    else:
+        status_sql = f"""
+            UPDATE {migrate_table_name}
+            SET
+                    applied_date = SYSDATETIMEOFFSET()
+                ,   applied_user = '{user_name}'
+                ,   duration_ms  = {duration_ms}
+                ,   row_count    = {row_count}
+                ,   checkpoint   = null
+                ,   chain_hash   = {f"'{chain_hash}'" if chain_hash is not None else "null"}
+            WHERE
+                id = '{migration_info.get('id')}';
+        """
+    ret = dbm.execute(status_sql)
+    if ( not ret ): return False
+
+    if ( not is_chain_deferred ):
+        ret = update_migrate_chain(config, migration_info.get("id"))
+        if ( not ret ): return False
+
+    # ステートメントごとの内訳（down では削除のみ）
+    return save_migration_timings(config, migration_info, [] if ip_down else timings)
+
+def get_chain_hash(prev_chain_hash, id, hash):
+    # 適用履歴の累積ハッシュ（直前までの累積ハッシュ・id・ハッシュを連結してハッシュ化）
+    return hashlib.sha256(f"{prev_chain_hash or ''}:{id}:{hash or ''}".encode()).hexdigest()
+
+def query_migrate_chain(config, id):
+
+    # id より前の直前の適用済みマイグレーションの累積ハッシュと、id 以降の適用済みマイグレーション（エラーの場合は None）
+    # READCOMMITTEDLOCK: 他のトランザクションの適用を待ってから読む（スナップショットを読まない）
+    migrate_table_name  = config.MSSQL_MIGRATE_TABLE
+    dbm                 = generate_dbm(config)
+
+    sql = f"""
+        SELECT id, hash, chain_hash
+        FROM {migrate_table_name} WITH (READCOMMITTEDLOCK)
+        WHERE applied_date IS NOT NULL
+          AND id >= ISNULL((
+                SELECT MAX(id)
+                FROM {migrate_table_name} WITH (READCOMMITTEDLOCK)
+                WHERE applied_date IS NOT NULL
+                  AND id < ?
+              ), N'')
+        ORDER BY
+                id ASC
+    """
+    ret = dbm.query(sql, [id])
+    if ( ret is None ): return None
+    rows = [ dict(zip(ret.Columns, r)) for r in ret.Records ]
+
+    # chain_hash の導入前に適用されたマイグレーションが残っている場合は、先頭から計算し直す
+    chain_hash = None
+    if ( len(rows) > 0 and rows[0]["id"] < id ):
+        chain_hash = rows.pop(0)["chain_hash"]
+        if ( chain_hash is None ):
+            ret = dbm.query(sql, [""])
+            if ( ret is None ): return None
+            rows = [ dict(zip(ret.Columns, r)) for r in ret.Records ]
+
+    return chain_hash, rows
+
+def update_migrate_chain(config, id):
+
+    # id 以降の適用済みマイグレーションの chain_hash を、直前の適用済みマイグレーションから計算し直す
+    # 末尾の取り消しでは、直前の１件を読むのみ
+    ret = query_migrate_chain(config, id)
+    if ( ret is None ): return False
+    chain_hash, rows = ret
+
+    updates = []
+    for row in rows:
+        chain_hash = get_chain_hash(chain_hash, row["id"], row["hash"])
+        if ( chain_hash != row["chain_hash"] ): updates.append([chain_hash, row["id"]])
+    if ( len(updates) == 0 ): return True
+
+    count = generate_dbm(config).execute_many(f"UPDATE {config.MSSQL_MIGRATE_TABLE} SET chain_hash = ? WHERE id = ?", updates)
+    return count is not None
+
+def get_checkpoint(migration_info, ip_down):
+
+    # 前回中断した分割実行の位置（同じ方向・同じファイル内容の場合のみ再開する）
+    checkpoint = migration_info.get("checkpoint", None)
+    if ( not checkpoint ): return None
+
+    try:
+        checkpoint = json.loads(checkpoint)
+    except ValueError:
+        return None
+    if ( checkpoint.get("direction", None) != ( "down" if ip_down else "up" ) ): return None
+    if ( checkpoint.get("hash", None) != migration_info.get("hash", None) ): return None
+    return checkpoint
+
+def save_checkpoint(config, migration_info, checkpoint):
+    checkpoint_json = json.dumps(checkpoint).replace("'", "''")
+    return generate_dbm(config).execute(f"""
+        UPDATE {config.MSSQL_MIGRATE_TABLE}
+        SET
+                checkpoint = N'{checkpoint_json}'
+        WHERE
+            id = '{migration_info.get('id')}';
+    """)
+
+def run_transaction(dbm, func, lock_timeout=None):
+    # func の処理をまとめてコミット（失敗時はロールバック）
+    if ( not dbm.begin(lock_timeout) ): return False
+    if ( not func() ):
+        dbm.rollback()
+        return False
+    return dbm.commit()
+
+def execute_chunked_migration(config, migration_info, migrate_sqls, migrate_bulks, migrate_chunks, ip_down, is_silent):
+
+    # 分割実行するマイグレーション
+    #   up  : 管理テーブル・SQL・bulk -> 分割実行（バッチごとにコミット）-> 適用済みに更新
+    #   down: 分割実行（バッチごとにコミット）-> bulk・SQL・管理テーブル
+    # バッチごとに管理テーブルの checkpoint を更新し、失敗した場合は次回その位置から再開する
+    dbm = generate_dbm(config)
+    timings = []
+    start = time.monotonic()
+
+    checkpoint = get_checkpoint(migration_info, ip_down)
+    if ( checkpoint is not None ):
+        log_info(f"[resume] step={checkpoint['step'] + 1}/{len(migrate_chunks)} position={checkpoint['position']} ({checkpoint['rows']:,} rows done)", is_silent)
+    else:
+        checkpoint = {
+            "direction": "down" if ip_down else "up",
+            "hash"     : migration_info.get("hash", None),
+            "step"     : 0,
+            "position" : None,
+            "end"      : None,
+            "rows"     : 0,
+        }
+        def prepare():
+            if ( not ip_down ):
+                if ( not insert_migrate_state(config, migration_info) ): return False
+                if ( not execute_migration_sqls(config, migrate_sqls, migrate_bulks, ip_down, is_silent, timings) ): return False
+            return save_checkpoint(config, migration_info, checkpoint)
+
+        ret = run_transaction(dbm, prepare, migration_info.get("lock_timeout", None))
+        if ( not ret ): return False
+
+    for step in range(checkpoint["step"], len(migrate_chunks)):
+        ret = execute_chunk(config, migration_info, migrate_chunks[step], checkpoint, is_silent, timings)
+        if ( not ret ): return False
+
+        checkpoint.update({ "step": step + 1, "position": None, "end": None })
+
+    def finish():
+        if ( ip_down ):
+            if ( not execute_migration_sqls(config, migrate_sqls, migrate_bulks, ip_down, is_silent, timings) ): return False
+        duration_ms = int((time.monotonic() - start) * 1000)
+        return update_migrate_state(config, migration_info, ip_down, timings, duration_ms, is_silent)
+
+    return run_transaction(dbm, finish, migration_info.get("lock_timeout", None))
+
+def execute_chunk(config, migration_info, chunk, checkpoint, is_silent, timings):
+    dbm = generate_dbm(config)
+
+    # range: [開始, 終了] or 最小値・最大値を返す SELECT。sql の ? に [下限, 上限) を渡して chunk_size ずつ実行
+    # 無し  : 影響行数が 0 になるまで sql を繰り返す（UPDATE TOP (N) ... など）
+    is_range = ( chunk["range"] is not None )
+    if ( is_range and checkpoint["position"] is None ):
+        key_range = chunk["range"]
+        if ( isinstance(key_range, str) ):
+            ret = dbm.query(key_range)
+            if ( ret is None ): return False
+            key_range = ret.Records[0] if len(ret.Records) > 0 else [None, None]
+        try:
+            checkpoint["position"], checkpoint["end"] = get_range_key(key_range[0]), get_range_key(key_range[1])
+        except ValueError as err:
+            log_error(f"{err} `range` of a chunk must select an integer key column.")
+            return False
+
+    log_info(f"[chunk] {chunk['sql']}", is_silent)
+
+    start = time.monotonic()
+    progress = { "time": start }
+    count = 0
+    while True:
+        if ( is_range ):
+            # 空のテーブル or 最後まで処理済み
+            if ( checkpoint["position"] is None or checkpoint["position"] > checkpoint["end"] ): break
+            params = [ checkpoint["position"], checkpoint["position"] + chunk["chunk_size"] ]
+        else:
+            params = []
+
+        batch_timings = []
+        def run_batch():
+            if ( not dbm.execute(chunk["sql"], batch_timings, params) ): return False
+            if ( batch_timings[0]["row_count"] is None ):
+                log_error("row count of the chunk is not available. remove `SET NOCOUNT ON` from the chunk sql.")
+                return False
+
+            rows = batch_timings[0]["row_count"]
+            checkpoint["rows"] += rows
+            checkpoint["position"] = params[1] if is_range else None
+            return save_checkpoint(config, migration_info, checkpoint)
+
+        position = checkpoint["position"]
+        ret = run_transaction(dbm, run_batch, migration_info.get("lock_timeout", None))
+        if ( not ret ):
+            checkpoint["position"] = position
+            return False
+
+        rows = batch_timings[0]["row_count"]
+        count += rows
+        if ( not is_range and rows == 0 ): break
+
+        now = time.monotonic()
+        if ( now - progress["time"] >= BULK_PROGRESS_INTERVAL ):
+            progress["time"] = now
+            log_info(f"  ... {count:,} rows ({count / (now - start):,.0f} rows/sec)", is_silent)
+
+        if ( chunk["sleep"] > 0 ): time.sleep(chunk["sleep"])
+
+    elapsed = time.monotonic() - start
+    log_info(f"[chunk] {count:,} rows in {elapsed:.1f}s", is_silent)
+    timings.append({
+        "statement"  : summarize_sql(chunk["sql"]),
+        "duration_ms": int(elapsed * 1000),
+        "row_count"  : count,
+    })
+    return True
+
+def get_range_key(value):
+    # range のキーは整数のみ（position + chunk_size で次の範囲を求め、checkpoint に JSON で保存するため）
+    # DECIMAL / NUMERIC の整数値は int に変換
+    if ( value is None or ( isinstance(value, int) and not isinstance(value, bool) ) ): return value
+    if ( isinstance(value, decimal.Decimal) and value.is_finite() and value == value.to_integral_value() ): return int(value)
+    raise ValueError(f"range key `{value}` ({type(value).__name__}) is not an integer.")
+
+def save_migration_timings(config, migration_info, timings):
+    detail_table_name = get_migrate_detail_table(config)
+    dbm = generate_dbm(config)
+
+    ret = dbm.execute(f"DELETE FROM {detail_table_name} WHERE id = '{migration_info.get('id')}';")
+    if ( not ret ): return False
+    if ( len(timings) == 0 ): return True
+
+    rows = [ [migration_info.get("id"), i + 1, x["duration_ms"], x["row_count"], x["statement"]] for i,x in enumerate(timings) ]
+    count = dbm.execute_many(f"""
+        INSERT INTO {detail_table_name} (id, seq, duration_ms, row_count, statement)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+    return count is not None
+
+def get_migration_dependencies(config, migration_info):
+
+    # マイグレーションファイルで宣言された依存先（DEPENDS_ON）と並列グループ（PARALLEL_GROUP）
+    depends_on, group = None, None
+    if ( migration_info.get("type", None) == MIGRATION_TYPE_SQL ):
+        path = migration_info.get("file_up", None)
+        if ( path is not None and path.is_file() ):
+            directives = read_sql_directives(path)
+            depends_on = directives.get("DEPENDS_ON", None)
+            group      = directives.get("PARALLEL_GROUP", None)
+    elif ( migration_info.get("file", None) is not None and migration_info["file"].is_file() ):
+        migration_vars = load_migration_vars(config, migration_info)
+        depends_on = getattr(migration_vars, "DEPENDS_ON", None)
+        group      = getattr(migration_vars, "PARALLEL_GROUP", None)
+
+    # id or ファイル名（<id>_<name>）で指定。文字列の場合はカンマ・空白区切り
+    if ( isinstance(depends_on, str) ): depends_on = depends_on.replace(",", " ").split()
+    if ( depends_on is not None ): depends_on = [ str(x).split("_")[0] for x in depends_on ]
+    if ( group is not None ): group = str(group)
+
+    return depends_on, group
+
+def build_migration_graph(config, migrate_status, migrations):
+
+    # マイグレーションごとに、先に完了している必要があるマイグレーションの id を求める
+    #   宣言無し       : それまでの全マイグレーションの完了を待つ（従来どおりの逐次実行）
+    #   DEPENDS_ON     : 指定したマイグレーションの完了を待つ（id が小さいもののみ指定可）
+    #   PARALLEL_GROUP : 同じグループ内は id 順に逐次実行、別グループとは並列実行
+    file_ids    = set([ x["id"] for x in get_migration_file_infos(config) ])
+    pending_ids = set([ x["id"] for x in migrate_status if x.get("applied_date", None) is None ])
+    run_ids     = set([ x["id"] for x in migrations ])
+
+    graph = {}
+    previous = []
+    barrier = []
+    last_in_group = {}
+    for migration_info in sorted(migrations, key=lambda x:x["id"]):
+        id = migration_info["id"]
+        depends_on, group = get_migration_dependencies(config, migration_info)
+
+        if ( depends_on is None and group is None ):
+            graph[id] = set(previous)
+            barrier = [id]
+            last_in_group = {}
+            previous.append(id)
+            continue
+
+        deps = set(barrier)
+        for dep in depends_on or []:
+            if ( dep >= id ):
+                log_error(f"`{id}` depends on `{dep}`. DEPENDS_ON must refer to an earlier migration.")
+                return None
+            if ( dep not in file_ids ):
+                log_error(f"`{id}` depends on unknown migration `{dep}`.")
+                return None
+            if ( dep in run_ids ):
+                deps.add(dep)
+            elif ( dep in pending_ids ):
+                log_error(f"`{id}` depends on `{dep}`, which is not applied.")
+                return None
+
+        if ( group is not None ):
+            if ( group in last_in_group ): deps.add(last_in_group[group])
+            last_in_group[group] = id
+
+        graph[id] = deps
+        previous.append(id)
+
+    return graph
+
+def apply_migrations_parallel(config, migrate_status, migrations, ip_down, args, max_parallel):
+
+    graph = build_migration_graph(config, migrate_status, migrations)
+    if ( graph is None ): return False
+
+    # down は依存関係を逆にたどる（依存しているマイグレーションを先に戻す）
+    if ( ip_down ):
+        reverse_graph = { x:set() for x in graph }
+        for id, deps in graph.items():
+            for dep in deps: reverse_graph[dep].add(id)
+        graph = reverse_graph
+
+    def run_migration(migration_info):
+        migration_info["is_chain_deferred"] = True
+        with capture_output() as buffer:
+            try:
+                ret = apply_migration(config, migration_info, ip_down, args.is_dry_run, args.is_silent, args.transaction)
+            except Exception:
+                traceback.print_exc()
+                ret = False
+        return ret, "".join(buffer)
+
+    done = set()
+    running = {}
+    is_failed = False
+    with redirect_thread_output():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            while True:
+                # 依存先が全て完了したものから、空きがある分だけ実行（失敗後は新たに実行しない）
+                for migration_info in migrations:
+                    if ( is_failed or len(running) >= max_parallel ): break
+                    id = migration_info["id"]
+                    if ( id in done or id in running.values() ): continue
+                    if ( not graph[id] <= done ): continue
+                    running[executor.submit(run_migration, migration_info)] = id
+
+                if ( len(running) == 0 ): break
+
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    id = running.pop(future)
+                    ret, output = future.result()
+
+                    # マイグレーションごとの出力はまとめて表示
+                    sys.stdout.write(output)
+                    sys.stdout.flush()
+
+                    if ( not ret ):
+                        is_failed = True
+                        continue
+                    done.add(id)
+                    add_run_stats("applied", 1)
+
+    # 適用履歴の累積ハッシュは、適用・取り消したマイグレーションのうち最も古いもの以降をまとめて計算
+    if ( len(done) > 0 and not args.is_dry_run ):
+        ids = list(done)
+        for migration_info in migrations:
+            if ( migration_info["id"] in done ): ids += [ x["id"] for x in migration_info.get("squashed_infos", []) ]
+        if ( not update_migrate_chain(config, min(ids)) ): return False
+
+    return not is_failed
+
+def apply_migrations(config, migrate_status, ip_down, args):
+
+    dbm = generate_dbm(config)
+
+    # 依存関係を元に、独立したマイグレーションを別々の接続で並列実行
+    # （all は１つの接続・トランザクションで実行するため対象外）
+    max_parallel = args.max_parallel or int(getattr(config, "MSSQL_MIGRATE_MAX_PARALLEL", DEFAULT_MAX_PARALLEL))
+    if ( max_parallel > 1 and args.transaction != TRANSACTION_ALL ):
+        migrations = [ x for x in migrate_status if ( x.get("applied_date", None) is not None ) == ip_down ]
+        if ( args.limit > 0 ): migrations = migrations[0:args.limit]
+        return apply_migrations_parallel(config, migrate_status, migrations, ip_down, args, max_parallel)
+
+    # all: 今回適用するマイグレーション全体を１トランザクションでコミット
+    is_all_transaction = ( args.transaction == TRANSACTION_ALL and not args.is_dry_run )
+    if ( is_all_transaction ):
+        if ( not dbm.begin() ): return False
+
+    applied_count = 0
+    apply_limit = args.limit if args.limit > 0 else -1
+    for migration_info in migrate_status:
+        is_applied = ( migration_info.get("applied_date", None) is not None )
+        if ( is_applied != ip_down ):
+            continue
+
+        ret = apply_migration(config, migration_info, ip_down, args.is_dry_run, args.is_silent, args.transaction)
+        if ( not ret ):
+            if ( is_all_transaction ):
+                dbm.rollback()
+                log_error("all migrations in this run have been rolled back.")
+            return False
+
+        applied_count += 1
+        if ( not is_all_transaction ): add_run_stats("applied", 1)
+
+        apply_limit = apply_limit - 1
+        if ( apply_limit == 0 ):
+            break
+
+    if ( is_all_transaction ):
+        ret = dbm.commit()
+        if ( ret ): add_run_stats("applied", applied_count)
+        return ret
+
+    return True
+
+def print_rows(rows, header, output_format=OUTPUT_FORMAT_TABLE, columns=None):
+
+    # table: 表示用の表 / json・csv・tsv: columns のキーで１行ずつ出力
+    if ( output_format == OUTPUT_FORMAT_TABLE ):
+        table = SimpleTable()
+        table.set_header(header)
+        table.set_rows(list(rows))
+        table.print_table()
+        return
+
+    columns = columns or [ x[0] if isinstance(x, (list, tuple)) else x for x in header ]
+    if ( output_format == OUTPUT_FORMAT_JSON ):
+        sys.stdout.write("[")
+        for i, row in enumerate(rows):
+            record = { k:row.get(k, None) for k in columns }
+            sys.stdout.write(("," if i > 0 else "") + "\n  " + json.dumps(record, ensure_ascii=False, default=str))
+        sys.stdout.write("\n]\n")
+        return
+
+    delimiter = "\t" if output_format == OUTPUT_FORMAT_TSV else ","
+    writer = csv.writer(sys.stdout, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([ row.get(k, None) for k in columns ])
+
+def print_migrate_status(config, sort_key="id", output_format=OUTPUT_FORMAT_TABLE):
+    dbm = generate_dbm(config)
+    dbm.clear_last_error()
+
+    # json / csv / tsv は管理テーブルを読み込みながら１行ずつ出力する
+    migration_status = get_migrate_status(config)
+    if ( migration_status is None ): return False
+
+    # duration: 実行時間の長い順（未適用は最後）
+    if ( sort_key == "duration" ):
+        migration_status = sorted(migration_status, key=lambda x:-(x.get("duration_ms", None) or -1))
+
+    print_rows(migration_status, MIGRATE_SHOW_STATUS_HEADER, output_format, MIGRATE_STATUS_COLUMNS)
+
+    # 読み込み途中で失敗した場合は、そこまでの出力で終了
+    return ( dbm.get_last_error() is None )
+
+def print_migration_detail(config, id, output_format=OUTPUT_FORMAT_TABLE):
+    detail_table_name = get_migrate_detail_table(config)
+    if ( not is_table_exists(config, detail_table_name) ):
+        if ( output_format != OUTPUT_FORMAT_TABLE ):
+            print_rows([], MIGRATE_SHOW_DETAIL_HEADER, output_format, MIGRATE_DETAIL_COLUMNS)
+            return True
+        log_info(f"no statement timings for `{id}`.")
+        return True
+
+    ret = generate_dbm(config).query(f"""
+        SELECT *
+        FROM {detail_table_name}
+        WHERE id = ?
+        ORDER BY
+                seq ASC
+    """, [id])
+    if ( ret is None ): return False
+
+    rows = [ dict(zip(ret.Columns, r)) for r in ret.Records ]
+    if ( len(rows) == 0 and output_format == OUTPUT_FORMAT_TABLE ):
+        log_info(f"no statement timings for `{id}`.")
+        return True
+
+    for row in rows:
+        row["duration"] = format_duration(row["duration_ms"])
+
+    print_rows(rows, MIGRATE_SHOW_DETAIL_HEADER, output_format, MIGRATE_DETAIL_COLUMNS)
+    return True
+
+def print_pending_migrations(config, output_format=OUTPUT_FORMAT_TABLE):
+    pending = get_pending_migrations(config)
+    if ( pending is None ): return False
+
+    if ( len(pending) == 0 and output_format == OUTPUT_FORMAT_TABLE ):
+        log_info("no pending migrations.")
+        return True
+
+    print_rows(pending, MIGRATE_SHOW_STATE_HEADER, output_format, MIGRATE_STATE_COLUMNS)
+    return True
+
+def print_migrate_summary(config, output_format=OUTPUT_FORMAT_TABLE):
+    summary = get_migrate_summary(config)
+    if ( summary is None ): return False
+
+    print_rows([ { "state": k, "count": v } for k,v in summary.items() ], ["state", "count"], output_format)
+    return True
+
+
+def subcmd_migrate_status(args, config):
+    if ( args.is_rehash ): clear_migration_file_cache(config, True)
+
+    if ( args.is_check_manifest ):
+        mismatches = check_manifest(config)
+        if ( len(mismatches) > 0 ):
+            log_error("manifest cache does not match the migration files. run with `--rehash`.")
+            table = SimpleTable()
+            table.set_header(["file", "manifest", "actual"])
+            table.set_rows(mismatches)
+            table.print_table()
+            return 1
+        log_info("manifest cache is consistent with the migration files.")
+        return 0
+
+    if ( args.is_current ):
+        ret = check_migrations_current(config)
+        if ( ret is None ): return 1
+        if ( ret ):
+            log_info("all migrations are applied.")
+            return 0
+        log_info("there are pending or changed migrations. see `status --pending` for details.")
+        return 1
+
+    if ( args.is_summary ):
+        return 0 if print_migrate_summary(config, args.output_format) else 1
+
+    if ( args.is_pending ):
+        return 0 if print_pending_migrations(config, args.output_format) else 1
+
+    if ( args.detail is not None ):
+        return 0 if print_migration_detail(config, args.detail, args.output_format) else 1
+
+    return 0 if print_migrate_status(config, args.sort, args.output_format) else 1
+
+def subcmd_migrate_new(args, config):
+    now = datetime.datetime.now()
+    dt_str = now.strftime('%Y%m%d%H%M%S')
+    output_path = f"{config.MSSQL_MIGRATE_FILE_DIR.rstrip('/')}/{dt_str}_{args.name}.py"
+
+    if ( args.is_sql ):
+        for direction in ["up", "down"]:
+            output_path = f"{config.MSSQL_MIGRATE_FILE_DIR.rstrip('/')}/{dt_str}_{args.name}.{direction}.sql"
+            log_info(output_path)
+            with open(output_path, mode='w') as f:
+                f.write(f"-- Write SQL ({direction}) here.\n-- Separate batches with `GO`.\n\nGO\n")
+        return 0
+
+    log_info(output_path)
+
+    lines = []
+    lines.append('')
+    lines.append('SQL_UP=[')
+    lines.append('  "Write SQL here;",')
+    lines.append('  "Write SQL here;",')
+    lines.append('  "Write SQL here;"')
+    lines.append(']')
+    lines.append('')
+    lines.append('SQL_DOWN=[')
+    lines.append('  "Write SQL here;",')
+    lines.append('  "Write SQL here;",')
+    lines.append('  "Write SQL here;"')
+    lines.append(']')
+    lines.append('')
+
+    with open(output_path, mode='w') as f:
+        f.write("\n".join(lines))
+
+    return 0
+
+def subcmd_migrate_baseline(args, config):
+    if ( args.is_dry_run ): args.is_silent = False
+
+    # --to までのマイグレーションを１つのベースラインにまとめる
+    files = get_migration_file_infos(config)
+    squashed = [ x for x in files if x["id"] <= args.to ]
+    if ( args.to not in [ x["id"] for x in squashed ] ):
+        log_error(f"migration `{args.to}` is not found.")
+        return 1
+
+    baseline_id = f"{args.to}{BASELINE_ID_SUFFIX}"
+    if ( any([ args.to < x["id"] <= baseline_id for x in files ]) ):
+        log_error(f"baseline id `{baseline_id}` conflicts with an existing migration.")
+        return 1
+
+    # まとめる範囲は、接続先の DB で全て適用済み（ハッシュ一致）であること
+    squashed_ids = set([ x["id"] for x in squashed ])
+    status = get_migrate_status_rows(config, squashed)
+    if ( status is None ): return 1
+    not_applied = [ x for x in status if x["id"] in squashed_ids and x["state"] != MIGRATE_STATE_APPLIED ]
+    if ( len(not_applied) > 0 ):
+        log_error(f"{len(not_applied):,} migrations up to `{args.to}` are not applied to this database.")
+        table = SimpleTable()
+        table.set_header(MIGRATE_SHOW_STATE_HEADER)
+        table.set_rows(not_applied)
+        table.print_table()
+        return 1
+
+    # 元ファイルの移動先（既に同名のファイルがある場合は何もしない）
+    squashed_dir = get_squashed_dir(config)
+    moves = []
+    for info in squashed:
+        for path in [ info.get("file", None), info.get("file_down", None) ]:
+            if ( path is None or ( len(moves) > 0 and moves[-1][0] == path ) ): continue
+            moves.append((path, squashed_dir / path.name))
+    for _, dest in moves:
+        if ( dest.exists() ):
+            log_error(f"`{get_display_path(dest)}` already exists.")
+            return 1
+
+    # ベースライン: 先頭にまとめたマイグレーションの id・ハッシュ、続けてスキーマの SQL
+    output_path = get_migration_dir(config) / f"{baseline_id}_{args.name}{BASELINE_FILE_SUFFIX}"
+    lines = []
+    lines.append(f"-- Baseline of {len(squashed):,} migrations up to `{args.to}`.")
+    lines.append("-- Applied to fresh databases only. Databases with these migrations record it without running.")
+    for info in squashed:
+        lines.append(f"-- BASELINE: {info['id']} {info['hash']} {info['size']} {info['name']}".rstrip())
+    lines.append("")
+    if ( args.schema is not None ):
+        with open_sql_file(args.schema) as f:
+            lines.append(f.read().rstrip("\r\n"))
+    else:
+        lines.append("-- Write SQL (schema of the squashed migrations) here.\n-- Separate batches with `GO`.\n\nGO")
+    lines.append("")
+
+    dry_run_caption = " (dry-run)" if args.is_dry_run else ""
+    log_info(f"[baseline{dry_run_caption}] {len(squashed):,} migrations -> {get_display_path(output_path)}", args.is_silent)
+    for src, dest in moves:
+        log_info(f"  {get_display_path(src)} -> {get_display_path(dest)}", args.is_silent)
+
+    if ( args.is_dry_run ): return 0
+
+    with open(output_path, mode='w', encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+    squashed_dir.mkdir(parents=True, exist_ok=True)
+    for src, dest in moves:
+        shutil.move(str(src), str(dest))
+
+    clear_migration_file_cache(config)
+    return 0
+
+def verify_migrations(config, is_silent):
+
+    # 適用済みのマイグレーションのうち、ハッシュ不一致・ファイル無しのものを返す（エラーの場合は None）
+    # 通常は最新の適用済みマイグレーションの chain_hash と、ローカルのファイルから計算した累積ハッシュの比較のみ
+    # 一致しない場合（または chain_hash が無い場合）のみ、マイグレーションごとに突き合わせる
+    files = get_migration_file_infos(config)
+    if ( not is_table_exists(config, config.MSSQL_MIGRATE_TABLE) ): return []
+
+    ret = generate_dbm(config).query(f"""
+        SELECT TOP (1) *
+        FROM {config.MSSQL_MIGRATE_TABLE}
+        WHERE applied_date IS NOT NULL
+        ORDER BY
+                id DESC
+    """)
+    if ( ret is None ): return None
+    if ( len(ret.Records) == 0 ): return []
+    row = dict(zip(ret.Columns, ret.Records[0]))
+
+    if ( row.get("chain_hash", None) is not None ):
+        chain_hash = None
+        for file_info in files:
+            if ( file_info["id"] > row["id"] ): break
+            chain_hash = get_chain_hash(chain_hash, file_info["id"], file_info["hash"])
+
+        if ( chain_hash == row["chain_hash"] ):
+            log_info(f"[verify] applied history up to `{row['id']}` matches the migration files.", is_silent)
+            return []
+        log_info("[verify] applied history does not match the migration files. comparing each migration.", is_silent)
+    else:
+        log_info("[verify] applied history has no digest yet. comparing each migration.", is_silent)
+
+    migrate_status = get_pending_migrations(config)
+    if ( migrate_status is None ): return None
+
+    result = []
+    for x in migrate_status:
+        if ( x.get("applied_date", None) is None ): continue
+        if ( x["state"] in [MIGRATE_STATE_DRIFTED, MIGRATE_STATE_ORPHANED] ): result.append(x)
+    return result
+
+def subcmd_migrate_verify(args, config):
+    if ( args.is_rehash ): clear_migration_file_cache(config, True)
+
+    is_silent = ( args.is_silent or args.output_format != OUTPUT_FORMAT_TABLE )
+    mismatches = verify_migrations(config, is_silent)
+    if ( mismatches is None ): return 1
+
+    if ( args.output_format != OUTPUT_FORMAT_TABLE ):
+        print_rows(mismatches, MIGRATE_SHOW_VERIFY_HEADER, args.output_format, MIGRATE_VERIFY_COLUMNS)
+        return 0 if len(mismatches) == 0 else 1
+
+    if ( len(mismatches) == 0 ):
+        log_info("all applied migrations match the migration files.", args.is_silent)
+        return 0
+
+    log_error(f"{len(mismatches)} applied migrations do not match the migration files.")
+    print_rows(mismatches, MIGRATE_SHOW_VERIFY_HEADER)
+    return 1
+
+def check_applied_migrations(args, config):
+
+    # up の前に適用済みのマイグレーションが変更されていないか確認
+    # 変更されている場合は中断（ファイル無しは表示のみ）
+    if ( args.is_no_verify or not getattr(config, "MSSQL_MIGRATE_VERIFY", True) ): return True
+
+    mismatches = verify_migrations(config, args.is_silent)
+    if ( mismatches is None ): return False
+
+    for x in mismatches:
+        if ( x["state"] == MIGRATE_STATE_ORPHANED ):
+            log_info(f"[verify] the file of applied migration `{x['id']}` is not found. (orphaned)", args.is_silent)
+
+    drifted = [ x["id"] for x in mismatches if x["state"] == MIGRATE_STATE_DRIFTED ]
+    if ( len(drifted) > 0 ):
+        log_error(f"applied migrations have been changed: {', '.join(drifted)}. see `verify` for details, or run with `--no-verify`.")
+        return False
+
+    return True
+
+def has_pending_migrations(config):
+
+    # スキーマ・管理テーブルが揃っていて、未適用のマイグレーションが無いか（ロックを取らずに確認）
+    if ( not all([ is_schema_exists(config, x) for x in config.MSSQL_MIGRATE_SCHEMA ]) ): return True
+    if ( not is_table_exists(config, config.MSSQL_MIGRATE_TABLE) ): return True
+
+    migrate_status = get_pending_migrations(config)
+    if ( migrate_status is None ): return True
+    return any([ x.get("applied_date", None) is None for x in migrate_status ])
+
+def get_index_path(config):
+    # MSSQL_MIGRATE_INDEX_PATH の相対パスは config ファイルから
+    path = getattr(config, "MSSQL_MIGRATE_INDEX_PATH", None) or os.path.join(get_migration_dir(config), INDEX_FILE_NAME)
+    if ( not os.path.isabs(path) ):
+        path = os.path.join(os.path.dirname(pathlib.Path(config.CONFIG_PATH).resolve()), path)
+    return os.path.normpath(path)
+
+def get_migration_snapshot_digest(config):
+    # ファイル名・サイズ・更新日時のみから計算（ファイルの内容は読まない）
+    snapshot = sorted(get_migration_file_snapshot(config).items())
+    return hashlib.sha256(json.dumps(snapshot).encode()).hexdigest()
+
+def get_migration_index(config):
+
+    # ローカルのマイグレーション全体の件数・最新の id・累積ハッシュ（管理テーブルの chain_hash と同じ計算）
+    snapshot = get_migration_snapshot_digest(config)
+    files = get_migration_file_infos(config)
+    chain_hash = None
+    for file_info in files:
+        chain_hash = get_chain_hash(chain_hash, file_info["id"], file_info["hash"])
+
+    return {
+        "version"   : INDEX_VERSION,
+        "snapshot"  : snapshot,
+        "count"     : len(files),
+        "last_id"   : files[-1]["id"] if len(files) > 0 else None,
+        "chain_hash": chain_hash,
+    }
+
+def read_migration_index(config):
+
+    # 保存したインデックスは、ファイルが変更されていない場合のみ使う（無い・古い場合は None）
+    try:
+        with open(get_index_path(config), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if ( not isinstance(index, dict) or index.get("version", None) != INDEX_VERSION ): return None
+    if ( index.get("snapshot", None) != get_migration_snapshot_digest(config) ): return None
+    return index
+
+def write_migration_index(config, index):
+    path = get_index_path(config)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+    except OSError as err:
+        log_error(f"could not write the index `{get_display_path(path)}`. {err}")
+        return None
+    return path
+
+def query_migrate_head(config):
+
+    # 適用済みの件数・最新の id・その chain_hash を１回のクエリで取得（管理テーブルが無い場合は 0 件）
+    # chain_hash 列が無い（列の追加前の）管理テーブルは、件数・最新の id のみ（列を参照する SELECT は実行時にコンパイル）
+    migrate_table_name = config.MSSQL_MIGRATE_TABLE
+    ret = generate_dbm(config).query(f"""
+        IF OBJECT_ID(?) IS NULL
+            SELECT 0 AS applied_count, NULL AS last_id, NULL AS chain_hash
+        ELSE IF COL_LENGTH(?, 'chain_hash') IS NULL
+            SELECT
+                    COUNT(*) AS applied_count
+                ,   MAX(id) AS last_id
+                ,   NULL AS chain_hash
+            FROM {migrate_table_name}
+            WHERE applied_date IS NOT NULL
+        ELSE
+            EXEC sp_executesql N'
+                SELECT
+                        COUNT(*) AS applied_count
+                    ,   MAX(id) AS last_id
+                    ,   (
+                            SELECT TOP (1) chain_hash
+                            FROM {migrate_table_name}
+                            WHERE applied_date IS NOT NULL
+                            ORDER BY
+                                    id DESC
+                        ) AS chain_hash
+                FROM {migrate_table_name}
+                WHERE applied_date IS NOT NULL
+            '
+    """, [migrate_table_name, migrate_table_name])
+    if ( ret is None or len(ret.Records) == 0 ): return None
+    return dict(zip(ret.Columns, ret.Records[0]))
+
+def check_migrations_current(config):
+
+    # ローカルのマイグレーションが全て適用済み（ハッシュ一致）か（エラーの場合は None）
+    # 保存したインデックスがあれば、ファイルのハッシュを計算せずに１回のクエリで比較する
+    index = read_migration_index(config)
+    if ( index is None ): index = get_migration_index(config)
+
+    head = query_migrate_head(config)
+    if ( head is None ): return None
+
+    if ( head["applied_count"] != index["count"] or head["last_id"] != index["last_id"] ): return False
+    # chain_hash の導入前に適用された DB は、件数・最新の id のみで判定
+    if ( head["chain_hash"] is None ): return True
+    return ( head["chain_hash"] == index["chain_hash"] )
+
+def subcmd_migrate_index(args, config):
+    if ( args.is_rehash ): clear_migration_file_cache(config, True)
+
+    index = get_migration_index(config)
+    path = write_migration_index(config, index)
+    if ( path is None ): return 1
+
+    log_info(f"[index] {index['count']:,} migrations up to `{index['last_id']}` -> {get_display_path(path)}", args.is_silent)
+    return 0
+
+def subcmd_migrate_up(args, config):
+    if ( args.is_rehash ): clear_migration_file_cache(config, True)
+
+    # 複数ノードから同時に実行された場合は１ノードずつ適用する
+    # 他のノードが適用済みの場合は、ロックを待たずに終了
+    if ( is_migration_lock_enabled(config, args) and not args.is_schema_only and not has_pending_migrations(config) ):
+        if ( not check_applied_migrations(args, config) ): return 1
+        log_info("no pending migrations.", args.is_silent)
+        return 0
+
+    if ( not acquire_migration_lock(config, args) ): return 1
+    try:
+        return migrate_up(args, config)
+    finally:
+        release_migration_lock(config, args.is_silent)
+
+def migrate_up(args, config):
+
+    ret = create_schemas(config, args.is_dry_run, args.is_silent)
+    if ( not ret ): return 1
+
+    if ( args.is_schema_only ):
+        return 0
+
+    ret = create_migrate_table(config, args.is_dry_run, args.is_silent)
+    if ( not ret ): return 1
+
+    ret = check_applied_migrations(args, config)
+    if ( not ret ): return 1
+
+    migrate_status = get_pending_migrations(config)
+    if ( migrate_status is None ): return 1
+
+    migrate_status = resolve_baselines(migrate_status)
+    if ( migrate_status is None ): return 1
+
+    ret = apply_migrations(config, migrate_status, False, args)
+    if ( not ret ): return 1
+
+    if ( not ( args.is_silent and not args.is_dry_run) ):
+        print("\n[result]")
+        print_migrate_status(config)
+        print_connection_stats(config, False)
+
+    return 0
+
+def subcmd_migrate_down(args, config):
+    if ( args.is_rehash ): clear_migration_file_cache(config, True)
+
+    if ( not acquire_migration_lock(config, args) ): return 1
+    try:
+        return migrate_down(args, config)
+    finally:
+        release_migration_lock(config, args.is_silent)
+
+def migrate_down(args, config, is_print_result=True):
+
+    if ( is_table_exists(config, config.MSSQL_MIGRATE_TABLE) ):
+        ret = create_migrate_table(config, args.is_dry_run, args.is_silent)
+        if ( not ret ): return 1
+
+    migrate_status = get_applied_migrations(config, args.limit)
+    if ( migrate_status is None ): return 1
+
+    ret = apply_migrations(config, migrate_status, True, args)
+    if ( not ret ): return 1
+
+    if ( is_print_result and not ( args.is_silent and not args.is_dry_run) ):
+        print("\n[result]")
+        print_migrate_status(config)
+        print_connection_stats(config, False)
+
+    return 0
+
+def get_statistics(messages):
+    # SET STATISTICS IO / TIME のメッセージを集計（メッセージが無い場合は None）
+    io  = [ x for m in messages for x in STATISTICS_IO_PATTERN.findall(m) ]
+    cpu = [ int(x) for m in messages for x in STATISTICS_TIME_PATTERN.findall(m) ]
+    return {
+        "logical_reads" : sum([ int(x[0]) for x in io ]) if len(io) > 0 else None,
+        "physical_reads": sum([ int(x[1]) for x in io ]) if len(io) > 0 else None,
+        "cpu_ms"        : sum(cpu) if len(cpu) > 0 else None,
+        "cpu_time"      : format_duration(sum(cpu)) if len(cpu) > 0 else None,
+    }
+
+def plan_migration(config, migration_info, ip_down, is_silent):
+
+    # マイグレーション１件を実行し、実行時間・影響行数・統計を集計
+    dbm = generate_dbm(config)
+    migration_info.pop("timings", None)
+
+    start = time.monotonic()
+    with dbm.collect_messages():
+        ret = apply_migration(config, migration_info, ip_down, False, is_silent, TRANSACTION_ALL)
+    duration_ms = int((time.monotonic() - start) * 1000)
+
+    direction = "down" if ip_down else "up"
+    statements = []
+    for seq, timing in enumerate(migration_info.pop("timings", []), 1):
+        statements.append({
+            "id"         : migration_info["id"],
+            "direction"  : direction,
+            "seq"        : seq,
+            "statement"  : timing["statement"],
+            "duration_ms": timing["duration_ms"],
+            "duration"   : format_duration(timing["duration_ms"]),
+            "row_count"  : timing["row_count"],
+            **get_statistics(timing.get("messages", [])),
+        })
+
+    row_counts = [ x["row_count"] for x in statements if x["row_count"] is not None ]
+    result = {
+        "id"         : migration_info["id"],
+        "name"       : migration_info.get("name", None),
+        "direction"  : direction,
+        "result"     : "ok" if ret else "failed",
+        "duration_ms": duration_ms,
+        "duration"   : format_duration(duration_ms),
+        "row_count"  : sum(row_counts) if len(row_counts) > 0 else None,
+        "statements" : len(statements),
+    }
+    for key in ["logical_reads", "physical_reads", "cpu_ms"]:
+        values = [ x[key] for x in statements if x[key] is not None ]
+        result[key] = sum(values) if len(values) > 0 else None
+    result["cpu_time"] = format_duration(result["cpu_ms"]) if result["cpu_ms"] is not None else None
+
+    return ret, result, statements
+
+def subcmd_migrate_plan(args, config):
+
+    if ( args.is_rehash ): clear_migration_file_cache(config, True)
+
+    # 未適用のマイグレーションを１つのトランザクション内で実行し、必ずロールバックする
+    # 実行時間・影響行数・SET STATISTICS IO / TIME を集計して、時間のかかる順に表示
+    dbm = generate_dbm(config)
+    is_silent = ( args.is_silent or args.output_format != OUTPUT_FORMAT_TABLE )
+
+    migrate_status = get_pending_migrations(config)
+    if ( migrate_status is None ): return 1
+    migrate_status = resolve_baselines(migrate_status)
+    if ( migrate_status is None ): return 1
+
+    migrations = [ x for x in migrate_status if x.get("applied_date", None) is None ]
+    if ( args.limit > 0 ): migrations = migrations[0:args.limit]
+    if ( len(migrations) == 0 ):
+        log_info("no pending migrations.", args.is_silent)
+        return 0
+
+    # 分割実行はバッチごとにコミットするため、ロールバックできない（以降は依存している可能性があるため実行しない）
+    for i, migration_info in enumerate(migrations):
+        if ( migration_info.get("type", None) == MIGRATION_TYPE_SQL or migration_info.get("file", None) is None ): continue
+        migration_vars = load_migration_vars(config, migration_info)
+        if ( len(get_migration_chunks(config, migration_vars, False)) > 0 ):
+            log_info(f"[plan] `{migration_info['id']}` is a chunked migration and cannot be rolled back. plans the migrations before it.", is_silent)
+            migrations = migrations[0:i]
+            break
+
+    results = []
+    statements = []
+    is_failed = False
+    if ( not dbm.begin() ): return 1
+    try:
+        # 管理テーブルが無い場合も、トランザクション内で作成してロールバックする
+        is_failed = not ( create_schemas(config, False, is_silent) and create_migrate_table(config, False, is_silent) )
+        is_failed = is_failed or not dbm.execute(["SET STATISTICS IO ON", "SET STATISTICS TIME ON"])
+
+        # --down: 全て up した後、逆順に down する
+        plans = [ (x, False) for x in migrations ]
+        if ( args.is_down ): plans += [ (x, True) for x in reversed(migrations) ]
+        for migration_info, ip_down in plans:
+            if ( is_failed ): break
+            ret, result, migration_statements = plan_migration(config, migration_info, ip_down, is_silent)
+            results.append(result)
+            statements.extend(migration_statements)
+            is_failed = not ret
+    finally:
+        dbm.execute(["SET STATISTICS IO OFF", "SET STATISTICS TIME OFF"])
+        dbm.rollback()
+        dbm.catalog.invalidate()
+    log_info("\n[plan] all changes have been rolled back.", is_silent)
+
+    results = sorted(results, key=lambda x:-x["duration_ms"])
+    for rank, x in enumerate(results, 1): x["rank"] = rank
+    statements = sorted(statements, key=lambda x:-x["duration_ms"])[0:args.top]
+    for rank, x in enumerate(statements, 1): x["rank"] = rank
+
+    if ( args.output_format != OUTPUT_FORMAT_TABLE ):
+        print_rows(statements if args.is_statements else results,
+            MIGRATE_SHOW_PLAN_STATEMENT_HEADER if args.is_statements else MIGRATE_SHOW_PLAN_HEADER,
+            args.output_format,
+            MIGRATE_PLAN_STATEMENT_COLUMNS if args.is_statements else MIGRATE_PLAN_COLUMNS)
+        return 1 if is_failed else 0
+
+    print("\n[plan] migrations")
+    print_rows(results, MIGRATE_SHOW_PLAN_HEADER)
+    print(f"\n[plan] top {len(statements)} statements")
+    print_rows(statements, MIGRATE_SHOW_PLAN_STATEMENT_HEADER)
+
+    return 1 if is_failed else 0
+
+def get_migration_file_snapshot(config):
+    # 変更の検知はファイル名・サイズ・更新日時のみで行う（ハッシュ計算・DB への問い合わせ無し）
+    result = {}
+    for path, entry in scan_migration_files(config):
+        stat = entry.stat()
+        result[entry.name] = ( stat.st_size, stat.st_mtime_ns )
+    return result
+
+def subcmd_migrate_watch(args, config):
+
+    # プロセス・DB 接続・ファイルのハッシュ（manifest）を保持したまま、ファイルの変更を待って適用を繰り返す
+    interval = args.interval if args.interval is not None else float(getattr(config, "MSSQL_MIGRATE_WATCH_INTERVAL", DEFAULT_WATCH_INTERVAL))
+    log_info(f"[watch] {get_display_path(get_migration_dir(config))} (interval={interval}s, Ctrl+C to stop)")
+
+    applied_snapshot = None
+    snapshot = prev_snapshot = get_migration_file_snapshot(config)
+    try:
+        while True:
+            # 保存途中のファイルを読まないよう、前回の確認から変化が無くなってから適用する
+            if ( snapshot == prev_snapshot and snapshot != applied_snapshot ):
+                applied_snapshot = snapshot
+                start = time.monotonic()
+                watch_migrations(args, config)
+                log_info(f"\n[watch] {time.monotonic() - start:.3f}s. waiting for changes ...", args.is_silent)
+
+            time.sleep(interval)
+            prev_snapshot, snapshot = snapshot, get_migration_file_snapshot(config)
+    except KeyboardInterrupt:
+        log_info("\n[watch] stopped.")
+
+    return 0
+
+def watch_migrations(args, config):
+
+    # 変更されたファイルのみハッシュを再計算（変更の無いファイルは manifest のハッシュを使う）
+    clear_migration_file_cache(config)
+
+    migrate_status = get_pending_migrations(config)
+    if ( migrate_status is None ): return False
+
+    for x in migrate_status:
+        if ( x["state"] == MIGRATE_STATE_ORPHANED ):
+            log_info(f"[watch] the file of `{x['id']}` is not found. (orphaned)", args.is_silent)
+
+    drifted = [ x for x in migrate_status if x["state"] == MIGRATE_STATE_DRIFTED ]
+    pending = [ x for x in migrate_status if x["state"] == MIGRATE_STATE_PENDING ]
+    if ( len(drifted) == 0 and len(pending) == 0 and not has_pending_migrations(config) ):
+        log_info("no pending migrations.", args.is_silent)
+        return True
+
+    # up / down のオプションは既定値（per-migration・逐次実行）
+    migrate_args = argparse.Namespace(**{
+        **vars(args),
+        "is_dry_run"    : False,
+        "is_schema_only": False,
+        "is_no_verify"  : True,
+        "transaction"   : TRANSACTION_PER_MIGRATION,
+        "max_parallel"  : None,
+        "limit"         : 0,
+    })
+
+    if ( not acquire_migration_lock(config, migrate_args) ): return False
+    try:
+        # 適用済みのファイルが変更された場合は、そのマイグレーション以降を down してから up し直す
+        if ( len(drifted) > 0 ):
+            first_id = min([ x["id"] for x in drifted ])
+            applied = get_applied_migrations(config)
+            if ( applied is None ): return False
+
+            migrate_args.limit = len([ x for x in applied if x["id"] >= first_id ])
+            log_info(f"\n[watch] `{first_id}` has been changed. re-applies {migrate_args.limit} migrations.", args.is_silent)
+            if ( migrate_down(migrate_args, config, False) != 0 ): return False
+            migrate_args.limit = 0
+
+        return ( migrate_up(migrate_args, config) == 0 )
+    finally:
+        release_migration_lock(config, args.is_silent)
+
+def read_targets_file(path):
+
+    # .json: DB名 or 設定値の上書き（dict）のリスト / それ以外: １行１DB名（# 以降はコメント）
+    with open(path, "r", encoding="utf-8") as f:
+        if ( str(path).endswith(".json") ):
+            return json.load(f)
+        lines = [ x.split("#")[0].strip() for x in f ]
+    return [ x for x in lines if x != "" ]
+
+def get_targets(config):
+    targets = []
+
+    targets_file = getattr(config, "MSSQL_MIGRATE_TARGETS_FILE", None)
+    if ( targets_file ):
+        if ( not os.path.isabs(targets_file) ):
+            targets_file = os.path.join(os.path.dirname(pathlib.Path(config.CONFIG_PATH).resolve()), targets_file)
+        targets.extend(read_targets_file(targets_file))
+    elif ( isinstance(config.MSSQL_MIGRATE_DB_NAME, (list, tuple)) ):
+        targets.extend(config.MSSQL_MIGRATE_DB_NAME)
+
+    result = []
+    for target in targets:
+        if ( isinstance(target, str) ):
+            target = { "MSSQL_MIGRATE_DB_NAME": target }
+
+        target_config = copy.copy(config)
+        for k,v in target.items():
+            setattr(target_config, k, v)
+        target_config.TARGET_NAME = target.get("name", None) or target_config.MSSQL_MIGRATE_DB_NAME
+        result.append(target_config)
+
+    return result
+
+def run_targets(args, config, targets):
+
+    parallel = args.parallel or int(getattr(config, "MSSQL_MIGRATE_PARALLEL", DEFAULT_PARALLEL))
+    parallel = max(parallel, 1)
+    on_error = args.on_error
+
+    # マイグレーションファイルのスキャン・ハッシュ計算は全 DB で共通
+    # --rehash は DB ごとに行うと共有のキャッシュを並列に消し合うため、ここで１回だけ行う
+    if ( getattr(args, "is_rehash", False) ):
+        clear_migration_file_cache(config, True)
+        args = copy.copy(args)
+        args.is_rehash = False
+    get_migration_file_infos(config)
+
+    print_lock = threading.Lock()
+    stop_event = threading.Event()
+
+    def run_target(target):
+        result = { "target": target.TARGET_NAME, "result": "skipped", "applied": 0, "elapsed": "" }
+        if ( stop_event.is_set() ): return result
+
+        start = time.monotonic()
+        reset_run_stats()
+        with capture_output() as buffer:
+            try:
+                ret = args.func(args, target)
+            except Exception:
+                traceback.print_exc()
+                ret = 1
+            finally:
+                close_dbm(target)
+
+        result["result"]  = "ok" if ret == 0 else "failed"
+        result["applied"] = get_run_stats().get("applied", 0)
+        result["elapsed"] = f"{time.monotonic() - start:.1f}s"
+
+        if ( ret != 0 and on_error == ON_ERROR_STOP ):
+            stop_event.set()
+
+        # DB ごとの出力はまとめて表示
+        with print_lock:
+            sys.stdout.write(f"\n===== [target] {target.TARGET_NAME} ({result['result']}) =====\n")
+            sys.stdout.write("".join(buffer))
+            sys.stdout.flush()
+
+        return result
+
+    with redirect_thread_output():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+            results = list(executor.map(run_target, targets))
+
+    print("\n[targets]")
+    table = SimpleTable()
+    table.set_header(["target", "result", "applied", "elapsed"])
+    table.set_rows(results)
+    table.print_table()
+
+    return 0 if all([ x["result"] == "ok" for x in results ]) else 1
+
+
+def load_config(path):
+    # 設定ファイルを読み込み、省略可能な値を補完する
+    config = import_py_vars(path)
+    config.CONFIG_PATH  = path
+    config.MSSQL_MIGRATE_SCHEMA = getattr(config, "MSSQL_MIGRATE_SCHEMA", [])
+    if ( isinstance(config.MSSQL_MIGRATE_SCHEMA, str)):
+        config.MSSQL_MIGRATE_SCHEMA = config.MSSQL_MIGRATE_SCHEMA.split(",")
+    config.MSSQL_MIGRATE_SCHEMA = list(map(str.strip, config.MSSQL_MIGRATE_SCHEMA))
+    config.MSSQL_MIGRATE_SCHEMA = list(filter(lambda a: a != "", config.MSSQL_MIGRATE_SCHEMA))
+    return config
+
+def apply_args_to_config(args, config):
+    # config の値を上書きするオプション
+    if ( getattr(args, "jobs", None) is not None ):
+        config.MSSQL_MIGRATE_SCAN_JOBS = args.jobs
+    if ( getattr(args, "retry", None) is not None ):
+        config.MSSQL_MIGRATE_RETRY_MAX = args.retry
+    if ( getattr(args, "progress_interval", None) is not None ):
+        config.MSSQL_MIGRATE_PROGRESS_INTERVAL = args.progress_interval
+    if ( getattr(args, "progress_file", None) is not None ):
+        config.MSSQL_MIGRATE_PROGRESS_FILE = args.progress_file
+
+def check_single_target(config, name):
+    # --parallel の無いサブコマンドは１つの DB のみ対象（list のまま接続文字列に渡さない）
+    db_name = config.MSSQL_MIGRATE_DB_NAME
+    if ( isinstance(db_name, (list, tuple)) ):
+        log_error(f"`{name}` runs against a single database, but `MSSQL_MIGRATE_DB_NAME` has {len(db_name)} databases. use a config with one database.")
+        return False
+    return True
+
+def run_subcommand(args, config):
+    # 複数の DB が設定されている場合は、DB ごとに並列実行
+    targets = get_targets(config) if hasattr(args, "parallel") else []
+    if ( getattr(args, "is_single_target", False) and not check_single_target(config, args.subcommand) ): return 1
+    try:
+        if ( len(targets) > 0 ):
+            return run_targets(args, config, targets)
+        return args.func(args, config)
+    finally:
+        close_dbms()
+
+
+#
+# アプリケーションから import して使う場合の API
+#   config は設定ファイルのパス or load_config() で読み込んだもの
+#   up / down のキーワード引数は CLI のオプション（dest 名: is_dry_run / transaction / max_parallel / retry など）
+#
+
+def get_config(config):
+    # 呼び出し元の config を書き換えないよう、オプションはコピーに設定する
+    config = load_config(str(config)) if isinstance(config, (str, os.PathLike)) else copy.copy(config)
+
+    # CLI と違いプロセスが続くため、呼び出しごとにファイルを確認し直す（ハッシュはマニフェストのキャッシュを使う）
+    clear_migration_file_cache(config)
+    return config
+
+def get_subcommand_args(name, **kwargs):
+    # CLI と同じ既定値に、キーワード引数を上書きする
+    args = build_parser().parse_args([name])
+    for key, value in kwargs.items():
+        if ( not hasattr(args, key) ):
+            raise TypeError(f"{name}() got an unexpected keyword argument '{key}'")
+        setattr(args, key, value)
+    return args
+
+def status(config, is_pending=False):
+    # マイグレーションごとの状態を dict のリストで返す（エラーの場合は None）
+    # is_pending: 未適用・ハッシュ不一致・ファイル無しのみ（state を含む）
+    config = get_config(config)
+    if ( not check_single_target(config, "status") ): return None
+    try:
+        if ( is_pending ): return get_pending_migrations(config)
+        migration_status = get_migrate_status(config)
+        return None if migration_status is None else list(migration_status)
+    finally:
+        close_dbm(config)
+
+def up(config, limit=0, **kwargs):
+    # 未適用のマイグレーションを適用する。成功した場合は True
+    config = get_config(config)
+    args = get_subcommand_args("up", limit=limit, **kwargs)
+    apply_args_to_config(args, config)
+    return ( run_subcommand(args, config) == 0 )
+
+def down(config, limit=1, **kwargs):
+    # 適用済みのマイグレーションを新しい順に limit 件戻す。成功した場合は True
+    config = get_config(config)
+    args = get_subcommand_args("down", limit=limit, **kwargs)
+    apply_args_to_config(args, config)
+    return ( run_subcommand(args, config) == 0 )
+
+def is_current(config):
+    # 全てのマイグレーションが適用済み（ハッシュ一致）か。起動時・ヘルスチェック用（エラーの場合は None）
+    # `mssql-migrate.py index` でインデックスを保存しておくと、ファイルのハッシュを計算せず１回のクエリで判定する
+    config = get_config(config)
+    if ( not check_single_target(config, "is_current") ): return None
+    try:
+        return check_migrations_current(config)
+    finally:
+        close_dbm(config)
+
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(description="Database migration tool for MSSQL")
+    subparsers = parser.add_subparsers(required=True)
+
+    args_limit_up  = {
+        "args"   : ['limit'],
+        "kwargs" : {
+            "type"    : int,
+            "nargs"   : "?",
+            "default" : 0,
+            "help"    : 'Limit the number of migrations (0 = unlimited). [default = 0]'
+        }
+    }
+
+    args_limit_down = copy.deepcopy(args_limit_up)
+    args_limit_down["kwargs"]["default"] = 1
+    args_limit_down["kwargs"]["help"] = 'Limit the number of migrations (0 = unlimited). [default = 1]'
+    
+    args_config = {
+        "args"   : ['-c', '--config'],
+        "kwargs" : {
+            "dest"    : "config",
+            "metavar" : "PATH",
+            "type"    : str,
+            "required": False,
+            "default" : DEFAULT_CONFIG_PATH,
+            "help"    : f'configuration file to use. (default: `{DEFAULT_CONFIG_PATH}`)'
+        }
+    }
+    args_dryrun = {
+        "args"   : ['--dry-run'],
+        "kwargs" : {
+            "dest"    : "is_dry_run",
+            "required": False,
+            "default" : False,
+            "action"  : "store_true",
+            "help"    : 'do not apply. SQL display only.'
+        }
+    }
+    args_transaction = {
+        "args"   : ['--transaction'],
+        "kwargs" : {
+            "dest"    : "transaction",
+            "required": False,
+            "default" : TRANSACTION_PER_MIGRATION,
+            "choices" : TRANSACTION_MODES,
+            "help"    : f'transaction scope. `per-migration`: each migration with its history, `all`: whole run, `none`: each statement list. (default: `{TRANSACTION_PER_MIGRATION}`)'
+        }
+    }
+    args_rehash = {
+        "args"   : ['--rehash'],
+        "kwargs" : {
+            "dest"    : "is_rehash",
+            "required": False,
+            "default" : False,
+            "action"  : "store_true",
+            "help"    : 'ignore the manifest cache and re-hash all migration files.'
+        }
+    }
+    args_jobs = {
+        "args"   : ['-j', '--jobs'],
+        "kwargs" : {
+            "dest"    : "jobs",
+            "metavar" : "N",
+            "type"    : int,
+            "required": False,
+            "default" : None,
+            "help"    : f'number of threads to scan and hash migration files. (default: `MSSQL_MIGRATE_SCAN_JOBS` or {DEFAULT_SCAN_JOBS})'
+        }
+    }
+    args_parallel = {
+        "args"   : ['--parallel'],
+        "kwargs" : {
+            "dest"    : "parallel",
+            "metavar" : "N",
+            "type"    : int,
+            "required": False,
+            "default" : None,
+            "help"    : f'number of databases processed concurrently when multiple targets are configured. (default: `MSSQL_MIGRATE_PARALLEL` or {DEFAULT_PARALLEL})'
+        }
+    }
+    args_on_error = {
+        "args"   : ['--on-error'],
+        "kwargs" : {
+            "dest"    : "on_error",
+            "required": False,
+            "default" : ON_ERROR_STOP,
+            "choices" : [ON_ERROR_STOP, ON_ERROR_CONTINUE],
+            "help"    : f'when a target fails, `stop` skips targets not yet started, `continue` processes all targets. (default: `{ON_ERROR_STOP}`)'
+        }
+    }
+    args_no_lock = {
+        "args"   : ['--no-lock'],
+        "kwargs" : {
+            "dest"    : "is_no_lock",
+            "required": False,
+            "default" : False,
+            "action"  : "store_true",
+            "help"    : 'do not take the database lock (sp_getapplock) that serializes concurrent up / down.'
+        }
+    }
+    args_lock_timeout = {
+        "args"   : ['--lock-timeout'],
+        "kwargs" : {
+            "dest"    : "lock_timeout",
+            "metavar" : "SEC",
+            "type"    : float,
+            "required": False,
+            "default" : None,
+            "help"    : f'seconds to wait for the lock held by another run. (default: MSSQL_MIGRATE_LOCK_TIMEOUT or {DEFAULT_LOCK_TIMEOUT})'
+        }
+    }
+    args_no_verify = {
+        "args"   : ['--no-verify'],
+        "kwargs" : {
+            "dest"    : "is_no_verify",
+            "required": False,
+            "default" : False,
+            "action"  : "store_true",
+            "help"    : 'do not check that applied migrations are unchanged before up.'
+        }
+    }
+    args_retry = {
+        "args"   : ['--retry'],
+        "kwargs" : {
+            "dest"    : "retry",
+            "metavar" : "N",
+            "type"    : int,
+            "required": False,
+            "default" : None,
+            "help"    : f'max retries of a migration failed by deadlock, lock timeout or connection error. `0` disables retry. (default: MSSQL_MIGRATE_RETRY_MAX or {DEFAULT_RETRY_MAX})'
+        }
+    }
+    args_progress_interval = {
+        "args"   : ['--progress-interval'],
+        "kwargs" : {
+            "dest"    : "progress_interval",
+            "metavar" : "SEC",
+            "type"    : float,
+            "required": False,
+            "default" : None,
+            "help"    : f'seconds between progress reports of a running statement. `0` disables them. (default: MSSQL_MIGRATE_PROGRESS_INTERVAL or {DEFAULT_PROGRESS_INTERVAL})'
+        }
+    }
+    args_progress_file = {
+        "args"   : ['--progress-file'],
+        "kwargs" : {
+            "dest"    : "progress_file",
+            "metavar" : "PATH",
+            "required": False,
+            "default" : None,
+            "help"    : 'appends the progress reports to the file as JSON Lines. (default: MSSQL_MIGRATE_PROGRESS_FILE)'
+        }
+    }
+    args_max_parallel = {
+        "args"   : ['--max-parallel'],
+        "kwargs" : {
+            "dest"    : "max_parallel",
+            "metavar" : "N",
+            "type"    : int,
+            "required": False,
+            "default" : None,
+            "help"    : f'number of independent migrations (DEPENDS_ON / PARALLEL_GROUP) applied concurrently. (default: `MSSQL_MIGRATE_MAX_PARALLEL` or {DEFAULT_MAX_PARALLEL})'
+        }
+    }
+    args_silent = {
+        "args"   : ['-s', '--silent'],
+        "kwargs" : {
+            "dest"    : "is_silent",
+            "required": False,
+            "default" : False,
+            "action"  : "store_true",
+            "help"    : 'do not display execution log.'
+        }
+    }
+
+    parser_status = subparsers.add_parser('status', help='show migrate history')
+    parser_status.set_defaults(func=subcmd_migrate_status)
+    parser_status.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_status.add_argument(*args_rehash['args'], **args_rehash['kwargs'])
+    parser_status.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+    parser_status.add_argument(*args_parallel['args'], **args_parallel['kwargs'])
+    parser_status.add_argument(*args_on_error['args'], **args_on_error['kwargs'])
+    parser_status.add_argument(
+        '--pending',
+        dest        = "is_pending",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'show only pending, drifted and orphaned migrations.'
+    )
+    parser_status.add_argument(
+        '--summary',
+        dest        = "is_summary",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'show only the number of migrations in each state.'
+    )
+    parser_status.add_argument(
+        '--sort',
+        dest        = "sort",
+        required    = False,
+        default     = "id",
+        choices     = MIGRATE_STATUS_SORT_KEYS,
+        help        = 'sort order. `duration` shows the slowest migrations first. (default: `id`)'
+    )
+    parser_status.add_argument(
+        '--detail',
+        dest        = "detail",
+        metavar     = "ID",
+        required    = False,
+        default     = None,
+        help        = 'show the per-statement duration and row count of the migration.'
+    )
+    parser_status.add_argument(
+        '--format',
+        dest        = "output_format",
+        required    = False,
+        default     = OUTPUT_FORMAT_TABLE,
+        choices     = OUTPUT_FORMATS,
+        help        = f'output format. json / csv / tsv are written row by row. (default: `{OUTPUT_FORMAT_TABLE}`)'
+    )
+    parser_status.add_argument(
+        '--check-manifest',
+        dest        = "is_check_manifest",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'compare the manifest cache with a full re-hash of the migration files.'
+    )
+    parser_status.add_argument(
+        '--current',
+        dest        = "is_current",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'exit with 0 if all migrations are applied, 1 otherwise. uses the index written by `index` when it is up to date.'
+    )
+
+    parser_verify = subparsers.add_parser('verify', help='checks that applied migrations match the migration files')
+    parser_verify.set_defaults(func=subcmd_migrate_verify)
+    parser_verify.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_verify.add_argument(*args_silent['args'], **args_silent['kwargs'])
+    parser_verify.add_argument(*args_rehash['args'], **args_rehash['kwargs'])
+    parser_verify.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+    parser_verify.add_argument(*args_parallel['args'], **args_parallel['kwargs'])
+    parser_verify.add_argument(*args_on_error['args'], **args_on_error['kwargs'])
+    parser_verify.add_argument(
+        '--format',
+        dest        = "output_format",
+        required    = False,
+        default     = OUTPUT_FORMAT_TABLE,
+        choices     = OUTPUT_FORMATS,
+        help        = f'output format of the mismatched migrations. (default: `{OUTPUT_FORMAT_TABLE}`)'
+    )
+
+    parser_index = subparsers.add_parser('index', help='writes the index of the migration files used by `status --current`')
+    parser_index.set_defaults(func=subcmd_migrate_index)
+    parser_index.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_index.add_argument(*args_silent['args'], **args_silent['kwargs'])
+    parser_index.add_argument(*args_rehash['args'], **args_rehash['kwargs'])
+    parser_index.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+
+    parser_new = subparsers.add_parser('new', help='creates a new empty migration template')
+    parser_new.set_defaults(func=subcmd_migrate_new)
+    parser_new.add_argument('name', metavar="NAME", type=str, help='migration-name')
+    parser_new.add_argument(
+        '--sql',
+        dest        = "is_sql",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'creates `.up.sql` / `.down.sql` templates instead of a `.py` file.'
+    )
+    parser_new.add_argument(*args_config['args'], **args_config['kwargs'])
+
+    parser_baseline = subparsers.add_parser('baseline', help='squashes applied migrations into a baseline')
+    parser_baseline.set_defaults(func=subcmd_migrate_baseline, subcommand="baseline", is_single_target=True)
+    parser_baseline.add_argument('--to', dest="to", metavar="ID", type=str, required=True, help='squashes migrations up to this id (inclusive).')
+    parser_baseline.add_argument('--name', dest="name", metavar="NAME", type=str, default="baseline", help='baseline migration-name. [default = baseline]')
+    parser_baseline.add_argument('--schema', dest="schema", metavar="PATH", type=str, default=None, help='SQL file used as the body of the baseline (e.g. a schema script of the database).')
+    parser_baseline.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_baseline.add_argument(*args_dryrun['args'], **args_dryrun['kwargs'])
+    parser_baseline.add_argument(*args_silent['args'], **args_silent['kwargs'])
+
+    parser_up = subparsers.add_parser('up', help='migration up')
+    parser_up.set_defaults(func=subcmd_migrate_up)
+    parser_up.add_argument(*args_limit_up['args'], **args_limit_up['kwargs'])
+    parser_up.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_up.add_argument(*args_dryrun['args'], **args_dryrun['kwargs'])
+    parser_up.add_argument(*args_silent['args'], **args_silent['kwargs'])
+    parser_up.add_argument(*args_transaction['args'], **args_transaction['kwargs'])
+    parser_up.add_argument(*args_max_parallel['args'], **args_max_parallel['kwargs'])
+    parser_up.add_argument(*args_no_lock['args'], **args_no_lock['kwargs'])
+    parser_up.add_argument(*args_lock_timeout['args'], **args_lock_timeout['kwargs'])
+    parser_up.add_argument(*args_retry['args'], **args_retry['kwargs'])
+    parser_up.add_argument(*args_progress_interval['args'], **args_progress_interval['kwargs'])
+    parser_up.add_argument(*args_progress_file['args'], **args_progress_file['kwargs'])
+    parser_up.add_argument(*args_no_verify['args'], **args_no_verify['kwargs'])
+    parser_up.add_argument(*args_rehash['args'], **args_rehash['kwargs'])
+    parser_up.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+    parser_up.add_argument(*args_parallel['args'], **args_parallel['kwargs'])
+    parser_up.add_argument(*args_on_error['args'], **args_on_error['kwargs'])
+    parser_up.add_argument(
+        '--schema-only',
+        dest        = "is_schema_only",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'schema creation only. do not apply migrations.'
+    )
+
+    parser_down = subparsers.add_parser('down', help='migration down')
+    parser_down.set_defaults(func=subcmd_migrate_down)
+    parser_down.add_argument(*args_limit_down['args'], **args_limit_down['kwargs'])
+    parser_down.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_down.add_argument(*args_dryrun['args'], **args_dryrun['kwargs'])
+    parser_down.add_argument(*args_silent['args'], **args_silent['kwargs'])
+    parser_down.add_argument(*args_transaction['args'], **args_transaction['kwargs'])
+    parser_down.add_argument(*args_max_parallel['args'], **args_max_parallel['kwargs'])
+    parser_down.add_argument(*args_no_lock['args'], **args_no_lock['kwargs'])
+    parser_down.add_argument(*args_lock_timeout['args'], **args_lock_timeout['kwargs'])
+    parser_down.add_argument(*args_retry['args'], **args_retry['kwargs'])
+    parser_down.add_argument(*args_progress_interval['args'], **args_progress_interval['kwargs'])
+    parser_down.add_argument(*args_progress_file['args'], **args_progress_file['kwargs'])
+    parser_down.add_argument(*args_rehash['args'], **args_rehash['kwargs'])
+    parser_down.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+    parser_down.add_argument(*args_parallel['args'], **args_parallel['kwargs'])
+    parser_down.add_argument(*args_on_error['args'], **args_on_error['kwargs'])
+
+
+    parser_plan = subparsers.add_parser('plan', help='rehearses pending migrations in a rolled-back transaction and reports their cost')
+    parser_plan.set_defaults(func=subcmd_migrate_plan, subcommand="plan", is_single_target=True)
+    parser_plan.add_argument(*args_limit_up['args'], **args_limit_up['kwargs'])
+    parser_plan.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_plan.add_argument(*args_silent['args'], **args_silent['kwargs'])
+    parser_plan.add_argument(*args_rehash['args'], **args_rehash['kwargs'])
+    parser_plan.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+    parser_plan.add_argument(*args_progress_interval['args'], **args_progress_interval['kwargs'])
+    parser_plan.add_argument(*args_progress_file['args'], **args_progress_file['kwargs'])
+    parser_plan.add_argument(
+        '--down',
+        dest        = "is_down",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'also rehearses SQL_DOWN in reverse order after all migrations are applied.'
+    )
+    parser_plan.add_argument(
+        '--top',
+        dest        = "top",
+        metavar     = "N",
+        type        = int,
+        required    = False,
+        default     = DEFAULT_PLAN_TOP,
+        help        = f'number of the slowest statements to show. (default: {DEFAULT_PLAN_TOP})'
+    )
+    parser_plan.add_argument(
+        '--statements',
+        dest        = "is_statements",
+        required    = False,
+        default     = False,
+        action      = "store_true",
+        help        = 'writes the statements instead of the migrations with `--format` json / csv / tsv.'
+    )
+    parser_plan.add_argument(
+        '--format',
+        dest        = "output_format",
+        required    = False,
+        default     = OUTPUT_FORMAT_TABLE,
+        choices     = OUTPUT_FORMATS,
+        help        = f'output format of the report. (default: `{OUTPUT_FORMAT_TABLE}`)'
+    )
+
+    parser_watch = subparsers.add_parser('watch', help='applies new or changed migrations automatically while files are edited')
+    parser_watch.set_defaults(func=subcmd_migrate_watch, subcommand="watch", is_single_target=True)
+    parser_watch.add_argument(*args_config['args'], **args_config['kwargs'])
+    parser_watch.add_argument(*args_silent['args'], **args_silent['kwargs'])
+    parser_watch.add_argument(*args_no_lock['args'], **args_no_lock['kwargs'])
+    parser_watch.add_argument(*args_lock_timeout['args'], **args_lock_timeout['kwargs'])
+    parser_watch.add_argument(*args_retry['args'], **args_retry['kwargs'])
+    parser_watch.add_argument(*args_progress_interval['args'], **args_progress_interval['kwargs'])
+    parser_watch.add_argument(*args_progress_file['args'], **args_progress_file['kwargs'])
+    parser_watch.add_argument(*args_jobs['args'], **args_jobs['kwargs'])
+    parser_watch.add_argument(
+        '--interval',
+        dest        = "interval",
+        metavar     = "SEC",
+        type        = float,
+        required    = False,
+        default     = None,
+        help        = f'seconds between checks of the migration files. (default: MSSQL_MIGRATE_WATCH_INTERVAL or {DEFAULT_WATCH_INTERVAL})'
+    )
+
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+
+    # Show help if there are no subcommands
+    argv = sys.argv[1:] if argv is None else argv
+    if ( len(argv) == 0 ):
+        parser.print_help()
+        return 1
+
+    # parse & Call a subcommand function
+    args = parser.parse_args(argv)
+
+    # import config
+    if ( not os.path.isfile(args.config) ):
+        log_error(f"config-file `{args.config}` is not found.")
+        return 1
+
+    config = load_config(args.config)
+    apply_args_to_config(args, config)
+
+    # call subcommand function
+    return run_subcommand(args, config)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
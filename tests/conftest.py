@@ -0,0 +1,58 @@
+# coding: utf-8
+#
+# SQL Server に接続せずに実行するテスト。
+# pyodbc を benchmark/fake_pyodbc.py（インプロセスの代替）に差し替えてから mssql_migrate を読み込む。
+#
+#   python3 -m pytest tests
+
+import sys
+import pathlib
+
+import pytest
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "benchmark"))
+sys.path.insert(0, str(ROOT_DIR / "migrate"))
+
+import fake_pyodbc
+sys.modules["pyodbc"] = fake_pyodbc
+
+import mssql_migrate
+
+
+CONFIG_TEMPLATE = """
+MSSQL_MIGRATE_FILE_DIR  = "migration"
+MSSQL_MIGRATE_DB_HOST   = "localhost"
+MSSQL_MIGRATE_DB_PORT   = "1433"
+MSSQL_MIGRATE_DB_NAME   = "test"
+MSSQL_MIGRATE_DB_USER   = "sa"
+MSSQL_MIGRATE_DB_PASS   = "sa"
+MSSQL_MIGRATE_SCHEMA    = "schema01"
+MSSQL_MIGRATE_TABLE     = "schema01.mssql_migrate"
+MSSQL_MIGRATE_MANIFEST_PATH = ""
+MSSQL_MIGRATE_CODE_CACHE    = False
+MSSQL_MIGRATE_PROGRESS_INTERVAL = 0
+"""
+
+
+@pytest.fixture(autouse=True)
+def fake_db():
+    fake_pyodbc.reset(True)
+    yield fake_pyodbc
+    mssql_migrate.close_dbms()
+
+@pytest.fixture
+def make_config(tmp_path):
+    # tmp_path/migration にマイグレーションファイルを置き、tmp_path/config.py を読み込む
+    migration_dir = tmp_path / "migration"
+    migration_dir.mkdir()
+
+    def make_config(files={}, **values):
+        for name, content in files.items():
+            (migration_dir / name).write_text(content, encoding="utf-8")
+        config_path = tmp_path / "config.py"
+        lines = [ CONFIG_TEMPLATE ] + [ f"{k} = {v!r}" for k, v in values.items() ]
+        config_path.write_text("\n".join(lines), encoding="utf-8")
+        return mssql_migrate.get_config(str(config_path))
+
+    return make_config
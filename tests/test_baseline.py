@@ -0,0 +1,82 @@
+# coding: utf-8
+
+import re
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+MIGRATIONS = {
+    "1_a.py": "SQL_UP=['SELECT 1']\nSQL_DOWN=[]\n",
+    "2_b.py": "SQL_UP=['SELECT 2']\nSQL_DOWN=[]\n",
+    "3_c.py": "SQL_UP=['SELECT 3']\nSQL_DOWN=[]\n",
+}
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    # 実行したマイグレーションの SQL（SELECT <数値> の行のみ。ベースラインは先頭のコメントも含めて送信される）
+    executed = []
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        executed.extend(re.findall(r"(?m)^SELECT \d+$", sql))
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    return executed
+
+@pytest.fixture
+def baseline(make_config, tmp_path):
+    # 1, 2 を適用した DB で、2 までをベースラインにまとめる
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, 2, is_silent=True)
+
+    schema_path = tmp_path / "schema.sql"
+    schema_path.write_text("SELECT 12\nGO\n", encoding="utf-8")
+    assert mssql_migrate.main(["baseline", "--to", "2", "--schema", str(schema_path), "-s", "-c", config.CONFIG_PATH]) == 0
+    return config
+
+
+def get_applied_ids(config):
+    return [ x["id"] for x in mssql_migrate.status(config) if x.get("applied_date", None) is not None ]
+
+
+def test_baseline_moves_squashed_files(baseline, tmp_path):
+    migration_dir = tmp_path / "migration"
+    assert sorted([ x.name for x in migration_dir.glob("*.py") ]) == ["3_c.py"]
+    assert sorted([ x.name for x in (migration_dir / "squashed").glob("*.py") ]) == ["1_a.py", "2_b.py"]
+
+    text = (migration_dir / f"2{mssql_migrate.BASELINE_ID_SUFFIX}_baseline{mssql_migrate.BASELINE_FILE_SUFFIX}").read_text(encoding="utf-8")
+    assert [ x.split()[2] for x in text.splitlines() if x.startswith("-- BASELINE:") ] == ["1", "2"]
+    assert "SELECT 12" in text
+
+def test_baseline_is_recorded_without_running_on_applied_database(baseline, executed):
+    assert mssql_migrate.up(baseline, is_silent=True)
+    assert executed == ["SELECT 3"]
+    assert mssql_migrate.status(baseline, is_pending=True) == []
+
+def test_baseline_runs_on_fresh_database(baseline, make_config, executed):
+    config = make_config(MSSQL_MIGRATE_DB_NAME="fresh")
+    assert mssql_migrate.up(config, is_silent=True)
+    assert executed == ["SELECT 12", "SELECT 3"]
+
+    # まとめたマイグレーションも適用済みとして記録
+    assert get_applied_ids(config) == ["1", "2", f"2{mssql_migrate.BASELINE_ID_SUFFIX}", "3"]
+    assert mssql_migrate.status(config, is_pending=True) == []
+
+def test_baseline_requires_applied_migrations(make_config, tmp_path):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, 1, is_silent=True)
+
+    assert mssql_migrate.main(["baseline", "--to", "2", "-s", "-c", config.CONFIG_PATH]) == 1
+    assert not (tmp_path / "migration" / "squashed").exists()
+
+def test_baseline_dry_run(make_config, tmp_path):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+
+    assert mssql_migrate.main(["baseline", "--to", "2", "--dry-run", "-c", config.CONFIG_PATH]) == 0
+    assert sorted([ x.name for x in (tmp_path / "migration").iterdir() if x.is_file() ]) == sorted(MIGRATIONS.keys())
@@ -0,0 +1,60 @@
+# coding: utf-8
+
+import re
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    # テーブル t に executemany で送信した行（送信ごと。管理テーブルへの送信は除く）
+    sent = []
+    executemany = fake_pyodbc.Cursor.executemany
+
+    def _executemany(self, sql, seq_of_params):
+        rows = [ list(x) for x in seq_of_params ]
+        if ( sql.startswith("INSERT INTO t ") ): sent.append(rows)
+        return executemany(self, sql, rows)
+
+    monkeypatch.setattr(fake_pyodbc.Cursor, "executemany", _executemany)
+    return sent
+
+
+def test_execute_many_sends_chunks_lazily(make_config, sent):
+    dbm = mssql_migrate.generate_dbm(make_config())
+
+    def rows():
+        for i in range(0, 25):
+            # 送信済みの件数 + chunk_size より先は読まない
+            assert i < sum([ len(x) for x in sent ]) + 10
+            yield (i,)
+
+    counts = []
+    assert dbm.execute_many("INSERT INTO t (id) VALUES (?)", rows(), 10, counts.append) == 25
+    assert [ len(x) for x in sent ] == [10, 10, 5]
+    assert counts == [10, 20, 25]
+    assert dbm.get_stats()["round_trip"] == 3
+
+def test_bulk_up_reads_csv_and_reports_rate(make_config, sent, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(mssql_migrate, "BULK_PROGRESS_INTERVAL", 0)
+    config = make_config({
+        "1_a.py": "BULK_UP={ 'sql': 'INSERT INTO t (id, name) VALUES (?, ?)', 'csv': '1_a.csv', 'chunk_size': 2 }\nSQL_DOWN=[]\n",
+    }, MSSQL_MIGRATE_BULK_CHUNK_SIZE=100)
+    (tmp_path / "migration" / "1_a.csv").write_text("id,name\n1,a\n2,\n3,c\n", encoding="utf-8")
+
+    assert mssql_migrate.up(config)
+    assert sent == [ [["1", "a"], ["2", None]], [["3", "c"]] ]
+
+    out = capsys.readouterr().out
+    assert re.search(r"\.\.\. 2 rows \([\d,]+ rows/sec\)", out)
+    assert re.search(r"\[bulk\] 3 rows in [\d.]+s \([\d,]+ rows/sec\)", out)
+
+def test_bulk_rows_function_and_default_chunk_size(make_config, sent):
+    config = make_config({
+        "1_a.py": "BULK_UP=[{ 'sql': 'INSERT INTO t (id) VALUES (?)', 'rows': lambda: ( (i,) for i in range(0, 5) ) }]\nSQL_DOWN=[]\n",
+    }, MSSQL_MIGRATE_BULK_CHUNK_SIZE=3)
+    assert mssql_migrate.up(config, is_silent=True)
+    assert [ len(x) for x in sent ] == [3, 2]
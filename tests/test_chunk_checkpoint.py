@@ -0,0 +1,108 @@
+# coding: utf-8
+
+import json
+import decimal
+import datetime
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+CHUNK_MIGRATION = """
+CHUNK_UP=[
+    {
+        "sql"       : "UPDATE test.items SET flag = 1 WHERE id >= ? AND id < ?",
+        "range"     : "SELECT MIN(id), MAX(id) FROM test.items",
+        "chunk_size": 3,
+    },
+]
+SQL_DOWN=[]
+"""
+
+
+@pytest.fixture
+def items(monkeypatch):
+    # test.items（id 1〜10）に対する分割実行の SQL だけを解釈する
+    items = { "range": [1, 10], "fail_at": None, "batches": [] }
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        if ( sql.startswith("SELECT MIN(id), MAX(id) FROM test.items") ):
+            return cursor._set_result(["", ""], [items["range"]])
+        if ( sql.startswith("UPDATE test.items") ):
+            items["batches"].append(list(params))
+            if ( params[0] == items["fail_at"] ):
+                raise fake_pyodbc.ProgrammingError("42000", "[42000] chunk failed (50000)")
+            return cursor._set_rowcount(len(range(max(params[0], 1), min(params[1], 11))))
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    return items
+
+def get_row(config):
+    return mssql_migrate.status(config)[0]
+
+
+def test_failed_chunk_saves_checkpoint(make_config, items):
+    config = make_config({ "1_chunk.py": CHUNK_MIGRATION })
+    items["fail_at"] = 7
+
+    assert not mssql_migrate.up(config, is_silent=True, retry=0)
+    assert items["batches"] == [[1, 4], [4, 7], [7, 10]]
+
+    row = get_row(config)
+    assert row["applied_date"] is None
+    checkpoint = json.loads(row["checkpoint"])
+    assert checkpoint["step"] == 0
+    assert checkpoint["position"] == 7
+    assert checkpoint["rows"] == 6
+
+def test_up_resumes_from_checkpoint(make_config, items):
+    config = make_config({ "1_chunk.py": CHUNK_MIGRATION })
+    items["fail_at"] = 7
+    assert not mssql_migrate.up(config, is_silent=True, retry=0)
+
+    items["fail_at"] = None
+    items["batches"] = []
+    assert mssql_migrate.up(config, is_silent=True, retry=0)
+    assert items["batches"] == [[7, 10], [10, 13]]
+
+    row = get_row(config)
+    assert row["applied_date"] is not None
+    assert row["checkpoint"] is None
+
+def test_checkpoint_is_ignored_when_migration_changes(make_config, items):
+    config = make_config({ "1_chunk.py": CHUNK_MIGRATION })
+    items["fail_at"] = 7
+    assert not mssql_migrate.up(config, is_silent=True, retry=0)
+
+    # ファイル内容（ハッシュ）が変わった場合は最初からやり直す
+    items["fail_at"] = None
+    items["batches"] = []
+    config = make_config({ "1_chunk.py": CHUNK_MIGRATION + "# changed\n" })
+    assert mssql_migrate.up(config, is_silent=True, retry=0)
+    assert items["batches"] == [[1, 4], [4, 7], [7, 10], [10, 13]]
+
+def test_decimal_range_keys_are_converted(make_config, items):
+    config = make_config({ "1_chunk.py": CHUNK_MIGRATION })
+    items["range"] = [decimal.Decimal("1"), decimal.Decimal("10")]
+
+    assert mssql_migrate.up(config, is_silent=True, retry=0)
+    assert items["batches"] == [[1, 4], [4, 7], [7, 10], [10, 13]]
+
+def test_non_integer_range_keys_are_rejected(make_config, items):
+    config = make_config({ "1_chunk.py": CHUNK_MIGRATION })
+    items["range"] = [datetime.datetime(2020, 1, 1), datetime.datetime(2020, 12, 31)]
+
+    assert not mssql_migrate.up(config, is_silent=True, retry=0)
+    assert items["batches"] == []
+
+def test_get_range_key():
+    assert mssql_migrate.get_range_key(None) is None
+    assert mssql_migrate.get_range_key(5) == 5
+    assert mssql_migrate.get_range_key(decimal.Decimal("5")) == 5
+    for value in [decimal.Decimal("1.5"), 1.0, "1", True, datetime.date(2020, 1, 1)]:
+        with pytest.raises(ValueError):
+            mssql_migrate.get_range_key(value)
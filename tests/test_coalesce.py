@@ -0,0 +1,32 @@
+# coding: utf-8
+
+import mssql_migrate
+
+
+def coalesce(sqls, max_size=1000):
+    return [ [ i for i, _ in x ] for x in mssql_migrate.coalesce_sql_statements(sqls, max_size) ]
+
+
+def test_consecutive_statements_are_coalesced():
+    assert coalesce(["INSERT INTO t VALUES (1)", "INSERT INTO t VALUES (2)", "", "SELECT 1"]) == [[1, 2, 4]]
+    assert coalesce(["SELECT 1", "SELECT 2", "SELECT 3"], max_size=16) == [[1, 2], [3]]
+
+def test_batch_leading_statements_are_sent_alone():
+    assert coalesce(["SELECT 1", "CREATE VIEW v AS SELECT 1 AS a", "SELECT 2"]) == [[1], [2], [3]]
+    assert coalesce(["SELECT 1", "-- comment\nCREATE OR ALTER PROCEDURE p AS SELECT 1", "SELECT 2"]) == [[1], [2], [3]]
+
+def test_schema_change_ends_the_batch():
+    # 追加した列を後続のステートメントで参照できるよう、ALTER TABLE の直後で区切る
+    assert coalesce(["SELECT 1", "ALTER TABLE t ADD c int", "UPDATE t SET c = 1"]) == [[1, 2], [3]]
+    assert coalesce(["DROP INDEX ix ON t", "CREATE UNIQUE NONCLUSTERED INDEX ix ON t (c)", "SELECT * FROM t WITH (INDEX(ix))"]) == [[1], [2], [3]]
+    assert coalesce(["EXEC sp_rename 't.a', 'b', 'COLUMN'", "UPDATE t SET b = 1"]) == [[1], [2]]
+
+def test_declare_is_sent_alone():
+    # 同じ変数名を宣言するステートメントを１つのバッチにしない
+    sqls = ["SELECT 1", "DECLARE @x int = 1; UPDATE t SET c = @x", "declare @x int = 2; UPDATE t SET c = @x", "SELECT 2"]
+    assert coalesce(sqls) == [[1], [2], [3], [4]]
+
+def test_round_trips_follow_boundaries():
+    sqls = ["ALTER TABLE t ADD c int", "UPDATE t SET c = 1", "UPDATE t SET c = 2"]
+    assert mssql_migrate.count_round_trips(sqls, 1000) == (3, 2)
+    assert mssql_migrate.count_round_trips(sqls, 0) == (3, 3)
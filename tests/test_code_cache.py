@@ -0,0 +1,37 @@
+# coding: utf-8
+
+import mssql_migrate
+
+
+def get_cache_files(cache_dir, name):
+    return sorted([ x.name for x in cache_dir.glob(f"{name}.*{mssql_migrate.CODE_CACHE_SUFFIX}") ])
+
+
+def test_compiled_code_is_cached(tmp_path):
+    path = tmp_path / "1_a.py"
+    path.write_text("SQL_UP=['SELECT 1']\n", encoding="utf-8")
+    cache_dir = tmp_path / mssql_migrate.CODE_CACHE_DIR_NAME
+
+    assert mssql_migrate.import_py_vars(path, None, cache_dir).SQL_UP == ["SELECT 1"]
+    assert len(get_cache_files(cache_dir, "1_a.py")) == 1
+    assert mssql_migrate.import_py_vars(path, None, cache_dir).SQL_UP == ["SELECT 1"]
+
+def test_repeated_edits_keep_one_cache_file(tmp_path):
+    # 同じプロセスで変更を繰り返しても、古いキャッシュは残らない
+    path = tmp_path / "1_a.py"
+    cache_dir = tmp_path / mssql_migrate.CODE_CACHE_DIR_NAME
+    for i in range(0, 4):
+        path.write_text(f"SQL_UP=['SELECT {i}']\n", encoding="utf-8")
+        assert mssql_migrate.import_py_vars(path, None, cache_dir).SQL_UP == [f"SELECT {i}"]
+        assert len(get_cache_files(cache_dir, "1_a.py")) == 1
+
+def test_cache_files_of_other_migrations_are_kept(tmp_path):
+    cache_dir = tmp_path / mssql_migrate.CODE_CACHE_DIR_NAME
+    for name in ["1_a.py", "2_b.py"]:
+        (tmp_path / name).write_text("SQL_UP=[]\n", encoding="utf-8")
+        mssql_migrate.import_py_vars(tmp_path / name, None, cache_dir)
+
+    (tmp_path / "1_a.py").write_text("SQL_UP=['SELECT 1']\n", encoding="utf-8")
+    mssql_migrate.import_py_vars(tmp_path / "1_a.py", None, cache_dir)
+    assert len(get_cache_files(cache_dir, "1_a.py")) == 1
+    assert len(get_cache_files(cache_dir, "2_b.py")) == 1
@@ -0,0 +1,67 @@
+# coding: utf-8
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+SYNTAX_ERROR = ("42000", "[42000] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Incorrect syntax near 'FAIL'. (102) (SQLExecDirectW)")
+
+
+@pytest.fixture
+def dbm(make_config, monkeypatch):
+    # "SELECT n FROM numbers" は 0〜4 の５行を返す。"FAIL" で始まる SQL は構文エラーにする
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        if ( sql == "SELECT n FROM numbers" ):
+            return cursor._set_result(["n"], [ [i] for i in range(0, 5) ])
+        if ( sql.startswith("FAIL") ):
+            raise fake_pyodbc.ProgrammingError(*SYNTAX_ERROR)
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    return mssql_migrate.generate_dbm(make_config())
+
+
+def test_records_are_fetched_lazily(dbm):
+    result = dbm.iter_query("SELECT n FROM numbers", fetch_size=2)
+    assert result.Columns == ["n"]
+    assert fake_pyodbc.get_stats()["fetch"] == 0
+
+    records = result.Records
+    assert [ next(records)[0] for _ in range(0, 3) ] == [0, 1, 2]
+    assert fake_pyodbc.get_stats()["fetch"] == 2
+
+    assert [ x[0] for x in records ] == [3, 4]
+    assert result.Error is None
+
+def test_connection_is_held_until_records_are_read(dbm):
+    result = dbm.iter_query("SELECT n FROM numbers")
+    assert len(dbm._pool) == 0
+    assert len(list(result.Records)) == 5
+    assert len(dbm._pool) == 1
+
+    assert dbm.execute("SELECT 1")
+    assert dbm.get_stats()["connect"] == 1
+
+def test_closing_records_releases_connection(dbm):
+    result = dbm.iter_query("SELECT n FROM numbers", fetch_size=2)
+    assert next(result.Records)[0] == 0
+    result.Records.close()
+    assert len(dbm._pool) == 1
+    assert result.Error is None
+
+def test_failed_query_returns_none(dbm):
+    assert dbm.iter_query("FAIL") is None
+    assert len(dbm._pool) == 1
+    assert dbm.get_last_error() is not None
+
+def test_iter_query_in_transaction_keeps_connection(dbm):
+    assert dbm.begin()
+    result = dbm.iter_query("SELECT n FROM numbers")
+    assert len(list(result.Records)) == 5
+    assert dbm.in_transaction()
+    assert dbm.rollback()
+    assert dbm.get_stats()["connect"] == 1
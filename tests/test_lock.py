@@ -0,0 +1,69 @@
+# coding: utf-8
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+MIGRATIONS = {
+    "1_a.py": "SQL_UP=['SELECT 1']\nSQL_DOWN=[]\n",
+    "2_b.py": "SQL_UP=['SELECT 2']\nSQL_DOWN=[]\n",
+}
+
+
+@pytest.fixture
+def locks(monkeypatch):
+    # sp_getapplock / sp_releaseapplock の呼び出し
+    locks = []
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        if ( "sp_getapplock" in sql ): locks.append("acquire")
+        if ( "sp_releaseapplock" in sql ): locks.append("release")
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    return locks
+
+
+def test_up_takes_lock_when_pending(make_config, locks):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    assert locks == ["acquire", "release"]
+
+def test_up_without_pending_skips_lock(make_config, locks, capsys):
+    # 全て適用済みの場合は、ロックを待たずに終了する
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    locks.clear()
+    capsys.readouterr()
+
+    assert mssql_migrate.up(config)
+    assert locks == []
+    assert "no pending migrations." in capsys.readouterr().out
+
+def test_up_without_pending_still_verifies(make_config, locks):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    config = make_config({ "1_a.py": MIGRATIONS["1_a.py"] + "# changed\n" })
+    locks.clear()
+
+    assert not mssql_migrate.up(config, is_silent=True)
+    assert locks == []
+
+def test_up_with_new_migration_after_fast_path(make_config, locks):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    config = make_config({ "3_c.py": "SQL_UP=['SELECT 3']\nSQL_DOWN=[]\n" })
+    locks.clear()
+
+    assert mssql_migrate.up(config, is_silent=True)
+    assert locks == ["acquire", "release"]
+    assert mssql_migrate.status(config, is_pending=True) == []
+
+def test_no_lock(make_config, locks):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True, is_no_lock=True)
+    assert mssql_migrate.down(config, is_silent=True, is_no_lock=True)
+    assert locks == []
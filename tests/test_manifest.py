@@ -0,0 +1,101 @@
+# coding: utf-8
+
+import os
+import json
+import hashlib
+
+import pytest
+
+import mssql_migrate
+
+
+MIGRATIONS = {
+    "1_a.py": "SQL_UP=['SELECT 1']\nSQL_DOWN=[]\n",
+    "2_b.py": "SQL_UP=['SELECT 2']\nSQL_DOWN=[]\n",
+}
+
+
+def scan(migration_dir, manifest):
+    infos = [ mssql_migrate.get_migration_file_info(x, manifest) for x in sorted(migration_dir.glob("*.py")) ]
+    manifest.prune([ x["file"].name for x in infos ])
+    manifest.save()
+    return { x["file"].name:x["hash"] for x in infos }
+
+def sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+@pytest.fixture
+def migration_dir(tmp_path):
+    migration_dir = tmp_path / "migration"
+    migration_dir.mkdir()
+    for name, content in MIGRATIONS.items():
+        (migration_dir / name).write_text(content, encoding="utf-8")
+    return migration_dir
+
+
+def test_manifest_is_reused_across_processes(migration_dir):
+    path = str(migration_dir / mssql_migrate.MANIFEST_FILE_NAME)
+    manifest = mssql_migrate.MigrationManifest(path)
+    hashes = scan(migration_dir, manifest)
+    assert manifest.miss_count == 2
+    assert hashes["1_a.py"] == sha256(migration_dir / "1_a.py")
+
+    # 保存したマニフェストを読み込んだ場合は、ファイルを読まずにハッシュを返す
+    manifest = mssql_migrate.MigrationManifest(path)
+    assert scan(migration_dir, manifest) == hashes
+    assert ( manifest.hit_count, manifest.miss_count ) == ( 2, 0 )
+
+def test_manifest_is_invalidated_by_size_and_mtime(migration_dir):
+    path = str(migration_dir / mssql_migrate.MANIFEST_FILE_NAME)
+    scan(migration_dir, mssql_migrate.MigrationManifest(path))
+
+    # サイズが同じでも更新日時が変われば計算し直す
+    file_path = migration_dir / "1_a.py"
+    stat = file_path.stat()
+    file_path.write_text(MIGRATIONS["1_a.py"].replace("1", "9"), encoding="utf-8")
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    (migration_dir / "2_b.py").write_text(MIGRATIONS["2_b.py"] + "# changed\n", encoding="utf-8")
+
+    manifest = mssql_migrate.MigrationManifest(path)
+    hashes = scan(migration_dir, manifest)
+    assert manifest.miss_count == 2
+    assert hashes == { x:sha256(migration_dir / x) for x in MIGRATIONS.keys() }
+
+def test_manifest_prunes_removed_files(migration_dir):
+    path = migration_dir / mssql_migrate.MANIFEST_FILE_NAME
+    scan(migration_dir, mssql_migrate.MigrationManifest(str(path)))
+    (migration_dir / "2_b.py").unlink()
+    scan(migration_dir, mssql_migrate.MigrationManifest(str(path)))
+    assert list(json.loads(path.read_text(encoding="utf-8"))["files"].keys()) == ["1_a.py"]
+
+def test_manifest_of_other_version_is_ignored(migration_dir):
+    path = migration_dir / mssql_migrate.MANIFEST_FILE_NAME
+    path.write_text(json.dumps({ "version": -1, "files": { "1_a.py": { "size": 0, "mtime_ns": 0, "sha256": "x" } } }), encoding="utf-8")
+    manifest = mssql_migrate.MigrationManifest(str(path))
+    assert scan(migration_dir, manifest)["1_a.py"] == sha256(migration_dir / "1_a.py")
+    assert manifest.hit_count == 0
+
+def test_rehash_recomputes_all_hashes(make_config):
+    config = make_config(MIGRATIONS)
+    mssql_migrate.get_migration_file_infos(config)
+    manifest = mssql_migrate.get_manifest(config)
+    assert manifest.miss_count == 2
+
+    mssql_migrate.clear_migration_file_cache(config)
+    mssql_migrate.get_migration_file_infos(config)
+    assert ( manifest.hit_count, manifest.miss_count ) == ( 2, 2 )
+
+    mssql_migrate.clear_migration_file_cache(config, True)
+    mssql_migrate.get_migration_file_infos(config)
+    assert ( manifest.hit_count, manifest.miss_count ) == ( 2, 4 )
+    assert mssql_migrate.check_manifest(config) == []
+
+
+def test_rehash_with_several_targets_scans_once(make_config, monkeypatch):
+    config = make_config(MIGRATIONS, MSSQL_MIGRATE_DB_NAME=["db1", "db2", "db3"])
+    scans = []
+    scan = mssql_migrate.scan_migration_file_infos
+    monkeypatch.setattr(mssql_migrate, "scan_migration_file_infos", lambda *args: scans.append(1) or scan(*args))
+
+    assert mssql_migrate.main(["up", "-s", "--rehash", "-c", config.CONFIG_PATH]) == 0
+    assert len(scans) == 1
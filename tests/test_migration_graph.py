@@ -0,0 +1,70 @@
+# coding: utf-8
+
+import mssql_migrate
+
+
+def build_graph(config):
+    # 全て未適用として、依存関係のグラフを求める
+    migrations = mssql_migrate.get_migration_file_infos(config)
+    return mssql_migrate.build_migration_graph(config, migrations, migrations)
+
+
+def test_undeclared_migrations_run_sequentially(make_config):
+    config = make_config({
+        "1_a.py": "SQL_UP=[]\n",
+        "2_b.py": "SQL_UP=[]\n",
+        "3_c.py": "SQL_UP=[]\n",
+    })
+    assert build_graph(config) == { "1": set(), "2": {"1"}, "3": {"1", "2"} }
+
+def test_parallel_groups_run_in_id_order_within_group(make_config):
+    config = make_config({
+        "1_base.py": "SQL_UP=[]\n",
+        "2_a.py"   : "PARALLEL_GROUP='x'\n",
+        "3_b.py"   : "PARALLEL_GROUP='y'\n",
+        "4_c.py"   : "PARALLEL_GROUP='x'\n",
+    })
+    assert build_graph(config) == { "1": set(), "2": {"1"}, "3": {"1"}, "4": {"1", "2"} }
+
+def test_depends_on_by_id_or_file_name(make_config):
+    config = make_config({
+        "1_base.py": "SQL_UP=[]\n",
+        "2_a.py"   : "PARALLEL_GROUP='x'\n",
+        "3_b.py"   : "PARALLEL_GROUP='y'\n",
+        "4_c.py"   : "DEPENDS_ON=['2_a', '3']\n",
+        "5_d.sql"  : "-- DEPENDS_ON: 3\nSELECT 1\n",
+    })
+    assert build_graph(config) == { "1": set(), "2": {"1"}, "3": {"1"}, "4": {"1", "2", "3"}, "5": {"1", "3"} }
+
+def test_undeclared_migration_is_a_barrier(make_config):
+    config = make_config({
+        "1_a.py": "PARALLEL_GROUP='x'\n",
+        "2_b.py": "PARALLEL_GROUP='y'\n",
+        "3_c.py": "SQL_UP=[]\n",
+        "4_d.py": "PARALLEL_GROUP='x'\n",
+    })
+    assert build_graph(config) == { "1": set(), "2": set(), "3": {"1", "2"}, "4": {"3"} }
+
+def test_depends_on_later_migration_is_rejected(make_config):
+    config = make_config({
+        "1_a.py": "DEPENDS_ON='2'\n",
+        "2_b.py": "SQL_UP=[]\n",
+    })
+    assert build_graph(config) is None
+
+def test_depends_on_unknown_migration_is_rejected(make_config):
+    config = make_config({
+        "2_b.py": "DEPENDS_ON='1'\n",
+    })
+    assert build_graph(config) is None
+
+def test_up_applies_graph_in_parallel(make_config):
+    config = make_config({
+        "1_base.py": "SQL_UP=['SELECT 1']\n",
+        "2_a.py"   : "PARALLEL_GROUP='x'\nSQL_UP=['SELECT 1']\n",
+        "3_b.py"   : "PARALLEL_GROUP='y'\nSQL_UP=['SELECT 1']\n",
+        "4_c.py"   : "DEPENDS_ON='2,3'\nSQL_UP=['SELECT 1']\n",
+    })
+    assert mssql_migrate.up(config, is_silent=True, max_parallel=4)
+    assert mssql_migrate.status(config, is_pending=True) == []
+    assert [ x["id"] for x in mssql_migrate.status(config) if x["applied_date"] is not None ] == ["1", "2", "3", "4"]
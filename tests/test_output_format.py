@@ -0,0 +1,61 @@
+# coding: utf-8
+
+import io
+import csv
+import json
+
+import pytest
+
+import mssql_migrate
+
+
+MIGRATIONS = {
+    "1_a.py": "SQL_UP=['SELECT 1']\nSQL_DOWN=[]\n",
+    "2_b.py": "SQL_UP=['SELECT 2']\nSQL_DOWN=[]\n",
+}
+ROWS = [ { "id": "1", "name": "a,b", "size": 10 }, { "id": "2", "name": "日本語", "size": None } ]
+
+
+def test_print_rows_json(capsys):
+    mssql_migrate.print_rows(iter(ROWS), ["id", "name", "size"], mssql_migrate.OUTPUT_FORMAT_JSON)
+    assert json.loads(capsys.readouterr().out) == ROWS
+
+@pytest.mark.parametrize("output_format, delimiter", [(mssql_migrate.OUTPUT_FORMAT_CSV, ","), (mssql_migrate.OUTPUT_FORMAT_TSV, "\t")])
+def test_print_rows_csv(capsys, output_format, delimiter):
+    mssql_migrate.print_rows(iter(ROWS), ["id", "name", "size"], output_format, ["id", "name"])
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out), delimiter=delimiter))
+    assert rows == [ ["id", "name"], ["1", "a,b"], ["2", "日本語"] ]
+
+def test_print_rows_empty_json(capsys):
+    mssql_migrate.print_rows([], ["id"], mssql_migrate.OUTPUT_FORMAT_JSON)
+    assert json.loads(capsys.readouterr().out) == []
+
+def test_status_json(make_config, capsys):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, 1, is_silent=True)
+    capsys.readouterr()
+
+    assert mssql_migrate.main(["status", "--format", "json", "-c", config.CONFIG_PATH]) == 0
+    rows = json.loads(capsys.readouterr().out)
+    assert [ list(x.keys()) for x in rows ] == [ mssql_migrate.MIGRATE_STATUS_COLUMNS ] * 2
+    assert [ ( x["id"], x["applied_date"] is not None ) for x in rows ] == [ ("1", True), ("2", False) ]
+
+def test_status_csv(make_config, capsys):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    capsys.readouterr()
+
+    assert mssql_migrate.main(["status", "--format", "csv", "-c", config.CONFIG_PATH]) == 0
+    rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    assert [ x["id"] for x in rows ] == ["1", "2"]
+    assert all([ x["hash"] != "" for x in rows ])
+
+def test_verify_json_exit_code(make_config, capsys):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    make_config({ "1_a.py": MIGRATIONS["1_a.py"] + "# changed\n" })
+    capsys.readouterr()
+
+    assert mssql_migrate.main(["verify", "--format", "json", "-c", config.CONFIG_PATH]) == 1
+    rows = json.loads(capsys.readouterr().out)
+    assert [ ( x["id"], x["state"] ) for x in rows ] == [ ("1", mssql_migrate.MIGRATE_STATE_DRIFTED) ]
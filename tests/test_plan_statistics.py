@@ -0,0 +1,48 @@
+# coding: utf-8
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+STATISTICS_IO = "[01000] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Table 'users'. Scan count 1, logical reads 3, physical reads 1, read-ahead reads 0."
+STATISTICS_TIME = "[01000] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server] SQL Server Execution Times: CPU time = 15 ms,  elapsed time = 20 ms."
+
+
+@pytest.fixture
+def statistics(monkeypatch):
+    # UPDATE を含む送信は SET STATISTICS IO / TIME のメッセージを返す
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        ret = execute(self, cursor, sql, params)
+        cursor.messages = [ ("[01000] (0)", STATISTICS_IO), ("[01000] (0)", STATISTICS_TIME) ] if "UPDATE" in sql else []
+        return ret
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+
+
+@pytest.mark.parametrize("coalesce_size", [0, 1000])
+def test_statistics_are_collected(make_config, statistics, coalesce_size):
+    dbm = mssql_migrate.generate_dbm(make_config())
+    timings = []
+    with dbm.collect_messages():
+        assert dbm.execute(["UPDATE users SET name = 'a'", "UPDATE users SET name = 'b'"], timings, coalesce_size=coalesce_size)
+
+    stats = [ mssql_migrate.get_statistics(x["messages"]) for x in timings ]
+    assert sum([ x["logical_reads"] for x in stats ]) == 3 * ( 1 if coalesce_size > 0 else 2 )
+    assert all([ x["cpu_ms"] == 15 for x in stats ])
+
+def test_coalesced_single_statement(make_config, statistics):
+    dbm = mssql_migrate.generate_dbm(make_config())
+    timings = []
+    with dbm.collect_messages():
+        assert dbm.execute(["UPDATE users SET name = 'a'"], timings, coalesce_size=1000)
+    assert mssql_migrate.get_statistics(timings[0]["messages"])["physical_reads"] == 1
+
+def test_messages_are_not_collected_by_default(make_config, statistics):
+    dbm = mssql_migrate.generate_dbm(make_config())
+    timings = []
+    assert dbm.execute(["UPDATE users SET name = 'a'", "UPDATE users SET name = 'b'"], timings, coalesce_size=1000)
+    assert all([ "messages" not in x for x in timings ])
@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import json
+import time
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+MIGRATIONS = {
+    "1_a.py": "SQL_UP=['SELECT 1', 'SLOW']\nSQL_DOWN=[]\n",
+}
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    # "SLOW" は 0.5 秒かかる（fake_pyodbc のロックの外で待つ）。sys.dm_exec_requests は進捗 42% を返す
+    executed = []
+    cursor_execute = fake_pyodbc.Cursor.execute
+    execute = fake_pyodbc.Connection._execute
+
+    def _cursor_execute(self, sql, *params):
+        if ( sql == "SLOW" ): time.sleep(0.5)
+        return cursor_execute(self, sql, *params)
+
+    def _execute(self, cursor, sql, params):
+        executed.append(sql)
+        if ( "sys.dm_exec_requests" in sql ):
+            columns = ["command", "percent_complete", "wait_type", "wait_time", "blocking_session_id", "blocker_login", "blocker_host", "blocker_program", "cpu_time", "logical_reads", "row_count"]
+            return cursor._set_result(columns, [["CREATE INDEX", 42.0, None, 0, 0, None, None, None, 10, 100, 0]])
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Cursor, "execute", _cursor_execute)
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    return executed
+
+
+def test_progress_is_disabled_by_default(make_config, executed):
+    config = make_config(MIGRATIONS)
+    del config.MSSQL_MIGRATE_PROGRESS_INTERVAL
+
+    assert mssql_migrate.generate_dbm(config).progress is None
+    assert mssql_migrate.up(config, is_silent=True)
+    assert "SELECT @@SPID" not in executed
+    assert not any([ "sys.dm_exec_requests" in x for x in executed ])
+
+def test_progress_is_reported_when_enabled(make_config, executed, tmp_path):
+    progress_path = tmp_path / "progress.jsonl"
+    config = make_config(MIGRATIONS, MSSQL_MIGRATE_PROGRESS_INTERVAL=0.1, MSSQL_MIGRATE_PROGRESS_FILE=str(progress_path))
+    assert mssql_migrate.up(config, is_silent=True)
+
+    records = [ json.loads(x) for x in progress_path.read_text(encoding="utf-8").splitlines() ]
+    assert len(records) >= 2
+    assert [ x["event"] for x in records ][-1] == "done"
+    assert all([ ( x["id"], x["direction"], x["statement"] ) == ( "1", "up", mssql_migrate.summarize_sql("SLOW") ) for x in records ])
+
+    progress = [ x for x in records if x["event"] == "progress" ]
+    assert len(progress) > 0
+    assert progress[0]["percent_complete"] == 42.0
+    assert progress[0]["command"] == "CREATE INDEX"
+    assert "SELECT @@SPID" in executed
+
+def test_progress_interval_option_overrides_config(make_config, executed):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.main(["up", "-s", "--progress-interval", "0.1", "-c", config.CONFIG_PATH]) == 0
+    assert any([ "sys.dm_exec_requests" in x for x in executed ])
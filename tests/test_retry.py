@@ -0,0 +1,105 @@
+# coding: utf-8
+
+import types
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+DEADLOCK = ("40001", "[40001] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Transaction (Process ID 57) was deadlocked on lock resources with another process and has been chosen as the deadlock victim. Rerun the transaction. (1205) (SQLExecDirectW)")
+LOCK_TIMEOUT = ("HY000", "[HY000] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Lock request time out period exceeded. (1222) (SQLExecDirectW)")
+SYNTAX_ERROR = ("42000", "[42000] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Incorrect syntax near 'SELEC'. (102) (SQLExecDirectW)")
+
+
+@pytest.fixture
+def policy():
+    return mssql_migrate.get_retry_policy(types.SimpleNamespace())
+
+@pytest.fixture
+def failures(monkeypatch):
+    # "FAIL" で始まる SQL は、登録したエラーを順に発生させる（無くなったら成功）
+    failures = { "errors": [], "lock_timeouts": {} }
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        if ( sql.startswith("SET LOCK_TIMEOUT") ):
+            failures["lock_timeouts"][id(self)] = int(sql.split()[-1])
+        if ( sql.startswith("FAIL") and len(failures["errors"]) > 0 ):
+            raise fake_pyodbc.ProgrammingError(*failures["errors"].pop(0))
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    monkeypatch.setattr(mssql_migrate.time, "sleep", lambda x: None)
+    return failures
+
+
+def test_error_numbers_are_parsed():
+    assert mssql_migrate.get_error_numbers(fake_pyodbc.Error(*DEADLOCK)) == [1205]
+    assert mssql_migrate.get_error_numbers(fake_pyodbc.Error("42000", "mssql-migrate statement 2: Msg 1222, Level 16")) == [1222]
+
+def test_retryable_errors(policy):
+    assert mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error(*DEADLOCK))
+    assert mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error(*LOCK_TIMEOUT))
+    assert mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error("08S01", "[08S01] Communication link failure (10054)"))
+    assert mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error("HYT00", "[HYT00] Query timeout expired (0)"))
+
+def test_non_retryable_errors(policy):
+    assert not mssql_migrate.is_retryable_error(policy, None)
+    assert not mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error(*SYNTAX_ERROR))
+    assert not mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error("23000", "[23000] Violation of PRIMARY KEY constraint (2627)"))
+
+def test_retry_policy_from_config():
+    config = types.SimpleNamespace(MSSQL_MIGRATE_RETRY_SQLSTATES=["42000"], MSSQL_MIGRATE_RETRY_ERRORS=[])
+    policy = mssql_migrate.get_retry_policy(config)
+    assert mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error(*SYNTAX_ERROR))
+    assert not mssql_migrate.is_retryable_error(policy, fake_pyodbc.Error(*LOCK_TIMEOUT))
+
+def test_retry_delay_is_bounded(policy):
+    for attempt in range(0, 10):
+        delay = min(policy["max_delay"], policy["delay"] * (2 ** attempt))
+        assert delay / 2 <= mssql_migrate.get_retry_delay(policy, attempt) <= delay
+
+
+def test_up_retries_deadlock(make_config, failures):
+    config = make_config({ "1_a.py": "SQL_UP=['FAIL']\nSQL_DOWN=[]\n" })
+    failures["errors"] = [DEADLOCK, LOCK_TIMEOUT]
+
+    assert mssql_migrate.up(config, is_silent=True)
+    assert failures["errors"] == []
+    assert mssql_migrate.status(config, is_pending=True) == []
+
+def test_up_gives_up_after_max_retries(make_config, failures):
+    config = make_config({ "1_a.py": "SQL_UP=['FAIL']\nSQL_DOWN=[]\n" })
+    failures["errors"] = [DEADLOCK] * 3
+
+    assert not mssql_migrate.up(config, is_silent=True, retry=2)
+    assert failures["errors"] == []
+
+def test_up_does_not_retry_syntax_error(make_config, failures):
+    config = make_config({ "1_a.py": "SQL_UP=['FAIL']\nSQL_DOWN=[]\n" })
+    failures["errors"] = [SYNTAX_ERROR, SYNTAX_ERROR]
+
+    assert not mssql_migrate.up(config, is_silent=True)
+    assert failures["errors"] == [SYNTAX_ERROR]
+
+@pytest.mark.parametrize("transaction", mssql_migrate.TRANSACTION_MODES)
+def test_lock_timeout_is_reset_after_failure(make_config, failures, transaction):
+    config = make_config({ "1_a.py": "LOCK_TIMEOUT=500\nSQL_UP=['SELECT 1', 'FAIL']\nSQL_DOWN=[]\n" })
+    failures["errors"] = [SYNTAX_ERROR]
+
+    assert not mssql_migrate.up(config, is_silent=True, transaction=transaction)
+    assert set(failures["lock_timeouts"].values()) == {-1}
+
+def test_down_retries_with_drifted_file(make_config, failures):
+    # 適用後にファイルが変更されていても、管理テーブルに残っている場合は再実行する
+    config = make_config({ "1_a.py": "SQL_UP=[]\nSQL_DOWN=['FAIL']\n" })
+    assert mssql_migrate.up(config, is_silent=True)
+
+    config = make_config({ "1_a.py": "SQL_UP=[]\nSQL_DOWN=['FAIL']\n# changed\n" })
+    failures["errors"] = [DEADLOCK]
+
+    assert mssql_migrate.down(config, is_silent=True)
+    assert failures["errors"] == []
+    assert [ x["applied_date"] for x in mssql_migrate.status(config) ] == [None]
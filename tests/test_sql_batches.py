@@ -0,0 +1,40 @@
+# coding: utf-8
+
+import io
+
+from mssql_migrate import split_sql_batches
+
+
+def split(text):
+    return list(split_sql_batches(io.StringIO(text)))
+
+
+def test_split_on_go_lines():
+    sql = "CREATE TABLE a (id int)\nGO\ncreate table b (id int)\n  go  -- comment\nSELECT 1\n"
+    assert split(sql) == ["CREATE TABLE a (id int)", "create table b (id int)", "SELECT 1"]
+
+def test_go_count_repeats_batch():
+    assert split("INSERT INTO a VALUES (1)\nGO 3\nSELECT 1\n") == ["INSERT INTO a VALUES (1)"] * 3 + ["SELECT 1"]
+
+def test_empty_batches_are_skipped():
+    assert split("GO\n\nGO 2\nSELECT 1\nGO\n\n") == ["SELECT 1"]
+
+def test_go_inside_string_literal():
+    sql = "INSERT INTO a VALUES ('line1\nGO\nit''s line3')\nGO\nSELECT 1\n"
+    assert split(sql) == ["INSERT INTO a VALUES ('line1\nGO\nit''s line3')", "SELECT 1"]
+
+def test_go_inside_quoted_identifier():
+    sql = 'SELECT 1 AS "a\nGO\n"\nGO\nSELECT [b\nGO\n]]c]\n'
+    assert split(sql) == ['SELECT 1 AS "a\nGO\n"', "SELECT [b\nGO\n]]c]"]
+
+def test_go_inside_block_comment():
+    sql = "/* outer\n/* inner\nGO\n*/\nGO\n*/\nSELECT 1\nGO\nSELECT 2\n"
+    assert split(sql) == ["/* outer\n/* inner\nGO\n*/\nGO\n*/\nSELECT 1", "SELECT 2"]
+
+def test_line_comment_does_not_open_string():
+    sql = "SELECT 1 -- it's a comment /*\nGO\nSELECT 2\n"
+    assert split(sql) == ["SELECT 1 -- it's a comment /*", "SELECT 2"]
+
+def test_go_as_part_of_statement_is_not_a_separator():
+    sql = "SELECT 1 AS go\nGOTO label\nGO\n"
+    assert split(sql) == ["SELECT 1 AS go\nGOTO label"]
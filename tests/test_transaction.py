@@ -0,0 +1,67 @@
+# coding: utf-8
+
+import pytest
+
+import fake_pyodbc
+import mssql_migrate
+
+
+SYNTAX_ERROR = ("42000", "[42000] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Incorrect syntax near 'FAIL'. (102) (SQLExecDirectW)")
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    # 実行した SQL と接続の組。"FAIL" で始まる SQL は構文エラーにする
+    executed = []
+    execute = fake_pyodbc.Connection._execute
+
+    def _execute(self, cursor, sql, params):
+        executed.append((id(self), sql))
+        if ( sql.startswith("FAIL") ):
+            raise fake_pyodbc.ProgrammingError(*SYNTAX_ERROR)
+        return execute(self, cursor, sql, params)
+
+    monkeypatch.setattr(fake_pyodbc.Connection, "_execute", _execute)
+    return executed
+
+
+def test_transaction_pins_one_connection(make_config, connections):
+    dbm = mssql_migrate.generate_dbm(make_config())
+    assert dbm.begin()
+    assert dbm.in_transaction()
+    assert dbm.execute(["SELECT 1", "SELECT 1"])
+    assert dbm.query("SELECT 1") is not None
+    assert not dbm.begin()
+    assert dbm.commit()
+
+    assert not dbm.in_transaction()
+    assert len(set([ x[0] for x in connections ])) == 1
+    assert dbm.get_stats()["connect"] == 1
+
+def test_rollback_returns_connection_to_pool(make_config, connections):
+    dbm = mssql_migrate.generate_dbm(make_config())
+    assert dbm.begin()
+    assert dbm.rollback()
+    assert fake_pyodbc.get_stats()["rollback"] == 1
+
+    assert dbm.execute("SELECT 1")
+    assert dbm.get_stats()["connect"] == 1
+    assert dbm.get_stats()["reuse"] == 1
+
+def test_commit_and_rollback_without_transaction(make_config):
+    dbm = mssql_migrate.generate_dbm(make_config())
+    assert dbm.commit()
+    assert dbm.rollback()
+
+@pytest.mark.parametrize("transaction", [mssql_migrate.TRANSACTION_PER_MIGRATION, mssql_migrate.TRANSACTION_ALL])
+def test_failed_migration_is_rolled_back(make_config, connections, transaction):
+    config = make_config({
+        "1_a.py": "SQL_UP=['SELECT 1']\nSQL_DOWN=[]\n",
+        "2_b.py": "SQL_UP=['SELECT 2', 'FAIL']\nSQL_DOWN=[]\n",
+    })
+    assert not mssql_migrate.up(config, is_silent=True, transaction=transaction)
+
+    # all: 全体をロールバック、per-migration: 失敗したマイグレーションのみロールバック
+    applied = [ x["id"] for x in mssql_migrate.status(config) if x.get("applied_date", None) is not None ]
+    assert applied == ( [] if transaction == mssql_migrate.TRANSACTION_ALL else ["1"] )
+    assert fake_pyodbc.get_stats()["rollback"] == 1
@@ -0,0 +1,122 @@
+# coding: utf-8
+
+import hashlib
+
+import fake_pyodbc
+import mssql_migrate
+
+
+MIGRATIONS = {
+    "1_a.py": "SQL_UP=['SELECT 1']\nSQL_DOWN=[]\n",
+    "2_b.py": "SQL_UP=['SELECT 2']\nSQL_DOWN=[]\n",
+    "3_c.py": "SQL_UP=['SELECT 3']\nSQL_DOWN=[]\n",
+}
+
+
+def get_applied_rows(config):
+    table = fake_pyodbc._databases[config.MSSQL_MIGRATE_DB_NAME].tables[config.MSSQL_MIGRATE_TABLE]
+    rows = [ x for v in table["rows"].values() for x in v if x.get("applied_date", None) is not None ]
+    return sorted(rows, key=lambda x:x["id"])
+
+def get_expected_chain(config):
+    chain_hash = None
+    for file_info in mssql_migrate.get_migration_file_infos(config):
+        chain_hash = get_chain_hash(chain_hash, file_info["id"], file_info["hash"])
+    return chain_hash
+
+def get_chain_hash(prev_chain_hash, id, hash):
+    return hashlib.sha256(f"{prev_chain_hash or ''}:{id}:{hash or ''}".encode()).hexdigest()
+
+
+def test_chain_hash_depends_on_order_and_previous_digest():
+    first = mssql_migrate.get_chain_hash(None, "1", "aaa")
+    assert first == get_chain_hash(None, "1", "aaa")
+    assert mssql_migrate.get_chain_hash(first, "2", "bbb") == get_chain_hash(first, "2", "bbb")
+    assert mssql_migrate.get_chain_hash(first, "2", "bbb") != mssql_migrate.get_chain_hash(None, "2", "bbb")
+    assert mssql_migrate.get_chain_hash(None, "1", None) == get_chain_hash(None, "1", "")
+
+def test_up_records_chain_hash(make_config):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+
+    rows = get_applied_rows(config)
+    chain_hash = None
+    for row in rows:
+        chain_hash = get_chain_hash(chain_hash, row["id"], row["hash"])
+        assert row["chain_hash"] == chain_hash
+    assert rows[-1]["chain_hash"] == get_expected_chain(config)
+
+def test_down_keeps_chain_of_remaining_history(make_config):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    assert mssql_migrate.down(config, is_silent=True)
+
+    rows = get_applied_rows(config)
+    assert [ x["id"] for x in rows ] == ["1", "2"]
+    assert mssql_migrate.verify_migrations(config, True) == []
+
+def test_verify_matches_applied_history(make_config):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    assert mssql_migrate.verify_migrations(config, True) == []
+
+def test_verify_reports_changed_and_missing_files(make_config, tmp_path):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+
+    (tmp_path / "migration" / "1_a.py").unlink()
+    config = make_config({ "2_b.py": MIGRATIONS["2_b.py"] + "# changed\n" })
+
+    mismatches = mssql_migrate.verify_migrations(config, True)
+    assert { x["id"]:x["state"] for x in mismatches } == {
+        "1": mssql_migrate.MIGRATE_STATE_ORPHANED,
+        "2": mssql_migrate.MIGRATE_STATE_DRIFTED,
+    }
+
+def test_verify_ignores_pending_migrations(make_config):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, 2, is_silent=True)
+
+    config = make_config({ "3_c.py": MIGRATIONS["3_c.py"] + "# changed\n", "4_d.py": "SQL_UP=[]\n" })
+    assert mssql_migrate.verify_migrations(config, True) == []
+
+def test_verify_without_chain_hash_compares_each_migration(make_config):
+    # chain_hash の導入前に適用された DB
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    for row in get_applied_rows(config):
+        row["chain_hash"] = None
+
+    assert mssql_migrate.verify_migrations(config, True) == []
+
+    config = make_config({ "3_c.py": MIGRATIONS["3_c.py"] + "# changed\n" })
+    assert [ x["id"] for x in mssql_migrate.verify_migrations(config, True) ] == ["3"]
+
+def test_verify_command_exit_code(make_config, tmp_path):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    assert mssql_migrate.main(["verify", "-s", "-c", config.CONFIG_PATH]) == 0
+
+    make_config({ "1_a.py": MIGRATIONS["1_a.py"] + "# changed\n" })
+    assert mssql_migrate.main(["verify", "-s", "-c", config.CONFIG_PATH]) == 1
+
+def test_is_current_compares_chain_hash(make_config):
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.is_current(config) is False
+    assert mssql_migrate.up(config, is_silent=True)
+    assert mssql_migrate.is_current(config) is True
+
+    get_applied_rows(config)[-1]["chain_hash"] = "0" * 64
+    assert mssql_migrate.is_current(config) is False
+
+def test_is_current_without_chain_hash_column(make_config):
+    # chain_hash 列の追加前の管理テーブル（件数・最新の id のみで判定）
+    config = make_config(MIGRATIONS)
+    assert mssql_migrate.up(config, is_silent=True)
+    table = fake_pyodbc._databases[config.MSSQL_MIGRATE_DB_NAME].tables[config.MSSQL_MIGRATE_TABLE]
+    table["columns"].remove("chain_hash")
+    get_applied_rows(config)[-1]["chain_hash"] = "0" * 64
+
+    assert mssql_migrate.is_current(config) is True
+    config = make_config({ "4_d.py": "SQL_UP=[]\n" })
+    assert mssql_migrate.is_current(config) is False
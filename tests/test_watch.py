@@ -0,0 +1,52 @@
+# coding: utf-8
+
+import pytest
+
+import mssql_migrate
+
+
+def migration(i):
+    # サイズを変えて、更新日時の精度に関わらず変更を検知させる
+    return f"SQL_UP=['SELECT {i}']\nSQL_DOWN=[]\n" + ( "#" * i ) + "\n"
+
+
+@pytest.fixture
+def watch(make_config, monkeypatch):
+    # time.sleep の呼び出しごとに edits を１つずつ実行し、無くなったら Ctrl+C で止める
+    def watch(config, edits):
+        edits = list(edits)
+        def sleep(sec):
+            if ( len(edits) == 0 ): raise KeyboardInterrupt()
+            edit = edits.pop(0)
+            if ( edit is not None ): edit()
+        monkeypatch.setattr(mssql_migrate.time, "sleep", sleep)
+        return mssql_migrate.main(["watch", "-s", "-c", config.CONFIG_PATH])
+    return watch
+
+
+def test_watch_applies_new_and_changed_files(make_config, watch, tmp_path):
+    config = make_config({ "1_a.py": migration(0) })
+    migration_dir = tmp_path / "migration"
+
+    edits = [
+        lambda: (migration_dir / "2_b.py").write_text(migration(0), encoding="utf-8"), None,
+        lambda: (migration_dir / "1_a.py").write_text(migration(1), encoding="utf-8"), None,
+    ]
+    assert watch(config, edits) == 0
+
+    assert mssql_migrate.status(config, is_pending=True) == []
+    assert [ x["id"] for x in mssql_migrate.status(config) ] == ["1", "2"]
+
+def test_watch_repeated_edits_keep_one_code_cache_file(make_config, watch, tmp_path):
+    config = make_config({ "1_a.py": migration(0) }, MSSQL_MIGRATE_CODE_CACHE=True)
+    path = tmp_path / "migration" / "1_a.py"
+
+    # 保存ごとに、変更を検知する確認と適用する確認の２回
+    edits = []
+    for i in range(1, 5):
+        edits += [ lambda i=i: path.write_text(migration(i), encoding="utf-8"), None ]
+    assert watch(config, edits) == 0
+
+    assert mssql_migrate.status(config, is_pending=True) == []
+    cache_dir = path.parent / mssql_migrate.CODE_CACHE_DIR_NAME
+    assert len(list(cache_dir.glob(f"1_a.py.*{mssql_migrate.CODE_CACHE_SUFFIX}"))) == 1